@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+appscript_backend.py
+Local Python implementation of the Apps Script web app in
+`Appscript code.txt` (register / submitScore), for offline testing. Start it
+with `python run_server.py --local-backend [DIR]` and /proxy calls are
+answered in-process instead of going to script.google.com.
+
+The responses match the script's createResponse() ({success, message,
+data}), but the storage is laid out differently:
+
+  - Users are found through an email -> row dictionary. The script reads the
+    whole sheet with getDataRange().getValues() and scans every row on
+    every call.
+  - A submit changes a row in memory and marks it dirty. Dirty rows are
+    written whole, in batches. The script makes up to four setValue() calls
+    per submit.
+  - Every score is appended to a structured log (one JSON record per
+    score). The script appends to a ' | '-joined string in column H that
+    grows with every attempt. history() rebuilds that string when needed.
+
+Without a data directory everything stays in memory. With one, rows go to
+users.jsonl and scores to scores.jsonl. Both files are append-only. Writes
+are batched, and a background thread flushes whatever is pending every
+flush_interval seconds, so an acknowledged score reaches the disk within
+that time even when no further calls arrive. On load
+the newest copy of each row wins, and users.jsonl is compacted when it has
+grown to more than twice the number of users.
+
+getLeaderboard (latest score per user, best first) is also answered, since
+run_server.py caches it and the stub upstream serves it.
+
+Usage:
+    python run_server.py --local-backend            # in memory
+    python run_server.py --local-backend .backend   # persisted
+    python appscript_backend.py --data .backend     # print the sheet view
+"""
+
+import os
+import re
+import json
+import time
+import argparse
+import datetime
+import threading
+import urllib.parse
+
+USERS_FILE = 'users.jsonl'
+SCORES_FILE = 'scores.jsonl'
+# Column order of the script's sheet, for export()
+SHEET_COLUMNS = ('Timestamp', 'Name', 'Email', 'Phone Number', 'Log-in Count', 'Device IDs',
+                 'Latest Score', 'Score History')
+LEADERBOARD_SIZE = 100
+# What parseInt() reads after leading whitespace
+LEADING_INTEGER = re.compile(r'[+-]?[0-9]+')
+
+
+def create_response(success, message, data=None):
+    """Same payload as the script's createResponse()."""
+    return {'success': success, 'message': message, 'data': data if data is not None else {}}
+
+
+def now_iso():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+
+
+def parse_int(value):
+    """The script's parseInt(value): the leading integer, so '85.5' is 85; None where it gives NaN."""
+    match = LEADING_INTEGER.match(str(value).lstrip()) if value is not None else None
+    return int(match.group()) if match else None
+
+
+class AppsScriptBackend:
+    """register / submitScore / getLeaderboard with an email index; thread-safe."""
+
+    def __init__(self, data_dir=None, batch_size=64, flush_interval=1.0):
+        """
+        Args:
+            data_dir: Directory for users.jsonl and scores.jsonl; None keeps
+                      everything in memory
+            batch_size: Flush once this many rows or scores are pending
+            flush_interval: Most seconds a pending row or score waits for a
+                            flush; a background thread flushes it when no
+                            call arrives to do so
+        """
+        # Absolute, since run_server.run() changes into the served directory
+        self.data_dir = os.path.abspath(data_dir) if data_dir else None
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # Sheet rows as dictionaries, in registration order
+        self.rows = []
+        # email -> index into self.rows
+        self.by_email = {}
+        # email -> list of score records; the structured replacement for column H
+        self.scores = {}
+        self._dirty = set()
+        self._pending_scores = []
+        self._last_flush = time.monotonic()
+        self.stats = {'register': 0, 'submitScore': 0, 'getLeaderboard': 0, 'invalid': 0,
+                      'flushes': 0, 'rows_written': 0, 'scores_written': 0}
+        self._closed = threading.Event()
+        self._flusher = None
+        if self.data_dir:
+            os.makedirs(self.data_dir, exist_ok=True)
+            self._load()
+        # With no interval every call flushes, so there is nothing to wait for
+        if self.data_dir and flush_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_periodically,
+                                             name='backend-flush', daemon=True)
+            self._flusher.start()
+
+    # -- persistence ---------------------------------------------------------
+
+    def _path(self, name):
+        return os.path.join(self.data_dir, name)
+
+    def _load(self):
+        lines = 0
+        try:
+            with open(self._path(USERS_FILE), encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    lines += 1
+                    row = json.loads(line)
+                    index = self.by_email.get(row['email'])
+                    if index is None:
+                        self.by_email[row['email']] = len(self.rows)
+                        self.rows.append(row)
+                    else:
+                        self.rows[index] = row
+        except FileNotFoundError:
+            pass
+        try:
+            with open(self._path(SCORES_FILE), encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.scores.setdefault(record['email'], []).append(record)
+        except FileNotFoundError:
+            pass
+        if lines > 2 * len(self.rows):
+            self._compact()
+
+    def _compact(self):
+        """Rewrite users.jsonl with one line per user."""
+        tmp = self._path(USERS_FILE + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for row in self.rows:
+                f.write(json.dumps(row) + '\n')
+        os.replace(tmp, self._path(USERS_FILE))
+
+    def _flush_locked(self):
+        if self.data_dir and (self._dirty or self._pending_scores):
+            if self._dirty:
+                with open(self._path(USERS_FILE), 'a', encoding='utf-8') as f:
+                    f.write(''.join(json.dumps(self.rows[i]) + '\n' for i in sorted(self._dirty)))
+            if self._pending_scores:
+                with open(self._path(SCORES_FILE), 'a', encoding='utf-8') as f:
+                    f.write(''.join(json.dumps(record) + '\n' for record in self._pending_scores))
+            self.stats['flushes'] += 1
+        self.stats['rows_written'] += len(self._dirty)
+        self.stats['scores_written'] += len(self._pending_scores)
+        self._dirty.clear()
+        self._pending_scores = []
+        self._last_flush = time.monotonic()
+
+    def _maybe_flush_locked(self):
+        pending = len(self._dirty) + len(self._pending_scores)
+        if pending >= self.batch_size or (pending and time.monotonic() - self._last_flush >= self.flush_interval):
+            self._flush_locked()
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval):
+            with self._lock:
+                if self._dirty or self._pending_scores:
+                    self._flush_locked()
+
+    def flush(self):
+        """Write every pending row and score now."""
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        """Stop the background flusher and write everything still pending."""
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+
+    # -- actions ---------------------------------------------------------------
+
+    def register(self, params):
+        email = params.get('email')
+        name = params.get('name') or 'Anonymous User'
+        phone_number = params.get('phoneNumber') or ''
+        if not email:
+            return create_response(False, 'Email is required for registration.')
+        with self._lock:
+            if email in self.by_email:
+                return create_response(False, 'User already registered. Please submit score.')
+            row = {'timestamp': now_iso(), 'name': name, 'email': email, 'phoneNumber': phone_number,
+                   'loginCount': 0, 'deviceIds': [], 'latestScore': 0}
+            self.by_email[email] = len(self.rows)
+            self.rows.append(row)
+            self._dirty.add(self.by_email[email])
+            self._maybe_flush_locked()
+        return create_response(True, 'Registration successful! You can now submit scores.', {'email': email})
+
+    def submit_score(self, params):
+        email = params.get('email')
+        device_id = params.get('deviceID')
+        new_score = parse_int(params.get('score'))
+        if not email or new_score is None or not device_id:
+            return create_response(False, 'Missing required data (email, score, or deviceID).')
+        with self._lock:
+            index = self.by_email.get(email)
+            if index is None:
+                return create_response(False, 'User not found. Please register first.')
+            row = self.rows[index]
+            # One in-memory update of the whole row instead of a setValue() per column
+            row['loginCount'] = int(row.get('loginCount') or 0) + 1
+            new_device = device_id not in row['deviceIds']
+            if new_device:
+                row['deviceIds'].append(device_id)
+            row['latestScore'] = new_score
+            record = {'timestamp': now_iso(), 'email': email, 'score': new_score, 'deviceID': device_id,
+                      'session': row['loginCount']}
+            self.scores.setdefault(email, []).append(record)
+            self._pending_scores.append(record)
+            self._dirty.add(index)
+            self._maybe_flush_locked()
+            session_count = row['loginCount']
+        return create_response(True, 'Score submitted successfully!', {
+            'sessionCount': session_count,
+            'latestScore': new_score,
+            'newDevice': new_device,
+        })
+
+    def leaderboard(self, params):
+        try:
+            limit = max(1, min(int(params.get('limit', LEADERBOARD_SIZE)), 1000))
+        except (TypeError, ValueError):
+            limit = LEADERBOARD_SIZE
+        with self._lock:
+            ranked = sorted((row for row in self.rows if row['loginCount']),
+                            key=lambda row: (-row['latestScore'], row['timestamp']))[:limit]
+            data = [{'rank': i + 1, 'name': row['name'], 'score': row['latestScore'],
+                     'sessions': row['loginCount']} for i, row in enumerate(ranked)]
+        return {'success': True, 'data': data}
+
+    def handle(self, params):
+        """
+        Route one call the way the script's doPost() does.
+
+        Args:
+            params: Dictionary of request parameters (query string and form
+                    fields merged, like e.parameter)
+
+        Returns:
+            JSON-serialisable response dictionary
+        """
+        action = params.get('action')
+        handler = {'register': self.register, 'submitScore': self.submit_score,
+                   'getLeaderboard': self.leaderboard}.get(action)
+        with self._lock:
+            self.stats[action if handler else 'invalid'] += 1
+        if handler is None:
+            return create_response(False, 'Invalid action specified.')
+        return handler(params)
+
+    # -- inspection ------------------------------------------------------------
+
+    def history(self, email):
+        """The script's column H string for email, rebuilt from the score log."""
+        return ' | '.join(f"{record['timestamp'][:10]} ({record['score']})"
+                          for record in self.scores.get(email, []))
+
+    def export(self):
+        """The users as sheet rows in the script's column order (A-H)."""
+        with self._lock:
+            return [[row['timestamp'], row['name'], row['email'], row['phoneNumber'], row['loginCount'],
+                     ', '.join(row['deviceIds']), row['latestScore'], self.history(row['email'])]
+                    for row in self.rows]
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['users'] = len(self.rows)
+            stats['scores'] = sum(len(records) for records in self.scores.values())
+            stats['pending'] = len(self._dirty) + len(self._pending_scores)
+        return stats
+
+
+def parse_params(query, body, content_type):
+    """
+    Merge a query string and a form or JSON body into one parameter dictionary,
+    like Apps Script's e.parameter (first value wins for repeated names).
+    """
+    params = {}
+    pairs = urllib.parse.parse_qsl(query, keep_blank_values=True)
+    if body:
+        text = body.decode('utf-8', 'replace')
+        if 'application/json' in (content_type or ''):
+            try:
+                payload = json.loads(text)
+            except ValueError:
+                payload = None
+            if isinstance(payload, dict):
+                pairs += [(k, v if isinstance(v, str) else json.dumps(v)) for k, v in payload.items()]
+        else:
+            pairs += urllib.parse.parse_qsl(text, keep_blank_values=True)
+    for name, value in pairs:
+        params.setdefault(name, value)
+    return params
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect the local Apps Script backend data')
+    parser.add_argument('--data', required=True, help='Data directory used with run_server.py --local-backend')
+    parser.add_argument('--json', action='store_true', help='Print the rows as JSON instead of a table')
+    args = parser.parse_args()
+
+    backend = AppsScriptBackend(args.data)
+    rows = backend.export()
+    if args.json:
+        print(json.dumps([dict(zip(SHEET_COLUMNS, row)) for row in rows], indent=2))
+        return
+    print('\t'.join(SHEET_COLUMNS))
+    for row in rows:
+        print('\t'.join(str(value) for value in row))
+    stats = backend.snapshot()
+    print(f"\n{stats['users']} users, {stats['scores']} scores")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,938 @@
+#!/usr/bin/env python3
+"""
+async_server.py
+asyncio serving engine for run_server.py, selected with `--async`.
+
+The threaded server starts one OS thread per connection, and every thread
+waiting on Apps Script is a thread doing nothing. Here every connection is a
+coroutine on one event loop: static files come from the shared static_assets
+cache (or loop.sendfile() when too large for it), with the stat, read and
+hash of a cache miss done in the default executor so a cold file does not
+stall other connections, and /proxy calls use a non-blocking keep-alive upstream pool, so hundreds of
+candidates waiting on submitScore cost hundreds of small coroutines instead
+of hundreds of threads.
+
+Behaviour matches CORSRequestHandler: the same CORS headers on every
+response, /proxy (GET and POST) and /proxy_test forwarding to APPSCRIPT_URL
+with streamed responses, the shared proxy cache for read-only GETs,
+/__proxy_cache__ counters, /__metrics__ and /__profile__ (server_metrics.py),
+/__run_local_shutdown__, directory listings where there is no index.html,
+and a 400 for a malformed Content-Length. Client connections are HTTP/1.1
+keep-alive.
+
+Usage:
+    python run_server.py --async [--port 4000] [--dir .] [--no-open]
+"""
+
+import os
+import ssl
+import sys
+import html
+import json
+import time
+import signal
+import email.utils
+import asyncio
+import posixpath
+import traceback
+import http.client
+import webbrowser
+import urllib.parse
+import urllib.request
+from collections import deque
+from http import HTTPStatus
+
+from appscript_backend import parse_params
+from proxy_cache import CachedResponse
+from run_server import (
+    CACHEABLE_PROXY_ACTIONS,
+    DEFAULT_APPSCRIPT_URL,
+    HOP_BY_HOP_HEADERS,
+    RELAY_CHUNK_SIZE,
+    UNCACHED_HEADERS,
+)
+from server_metrics import PROMETHEUS_CONTENT_TYPE, PUBLISH_INTERVAL, Profiler, route_for
+from static_assets import CachedBody, StaticAssets
+from upstream_pool import IDEMPOTENT_METHODS, MAX_REDIRECTS, REDIRECT_CODES, PoolTimeout
+
+SERVER_NAME = f'AsyncHTTP/0.1 Python/{sys.version.split()[0]}'
+MAX_HEADER_BYTES = 64 * 1024
+# Seconds an idle keep-alive client connection is held open
+KEEP_ALIVE_TIMEOUT = 15
+# Seconds requests in progress get to finish once the server is stopping
+DRAIN_SECONDS = 10
+CORS_HEADERS = [
+    ('Access-Control-Allow-Origin', '*'),
+    ('Access-Control-Allow-Methods', 'GET,POST,OPTIONS,HEAD'),
+    ('Access-Control-Allow-Headers', '*'),
+]
+STALE_CONNECTION_ERRORS = (
+    asyncio.IncompleteReadError,
+    ConnectionResetError,
+    BrokenPipeError,
+    ConnectionAbortedError,
+)
+
+
+class BadRequest(Exception):
+    """Malformed request; the status is sent back and the connection closed."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_head(data):
+    """
+    Split an HTTP message head into its start line and headers.
+
+    Returns:
+        Tuple of (start line, list of (name, value), dict of lowercased name -> value)
+    """
+    lines = data.decode('latin-1').split('\r\n')
+    headers = []
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, sep, value = line.partition(':')
+        if not sep:
+            raise ValueError(f'malformed header line: {line!r}')
+        headers.append((name.strip(), value.strip()))
+    return lines[0], headers, {name.lower(): value for name, value in headers}
+
+
+class AsyncUpstreamResponse:
+    """
+    Upstream response being read from a pooled connection.
+
+    The connection goes back to the pool on close() if the body was read to
+    the end and the upstream did not ask to close it.
+    """
+
+    def __init__(self, pool, key, conn, status, reason, headers, header_map, method, url):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.url = url
+        self._done = False
+        self._length = None
+        self._chunked = False
+        # Set by AsyncUpstreamPool.request() on the response it returns, for the 'total' timing
+        self.started = None
+
+        connection = header_map.get('connection', '').lower()
+        self._will_close = 'close' in connection
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            self._length = 0
+        elif 'chunked' in header_map.get('transfer-encoding', '').lower():
+            self._chunked = True
+        elif 'content-length' in header_map:
+            value = header_map['content-length']
+            if not value.strip().isdigit():
+                raise http.client.HTTPException(f'invalid Content-Length from upstream: {value!r}')
+            self._length = int(value)
+        else:
+            # Body runs until the upstream closes the connection
+            self._will_close = True
+        if self._length == 0:
+            self._done = True
+
+    def getheader(self, name, default=None):
+        name = name.lower()
+        for k, v in reversed(self.headers):
+            if k.lower() == name:
+                return v
+        return default
+
+    async def _read(self, reader, size):
+        return await asyncio.wait_for(reader.read(size), self._pool.read_timeout)
+
+    async def _readexactly(self, reader, size):
+        return await asyncio.wait_for(reader.readexactly(size), self._pool.read_timeout)
+
+    async def iter_chunks(self, size=RELAY_CHUNK_SIZE):
+        """Yield the body in pieces of at most size bytes as they arrive."""
+        reader = self._conn[0]
+        if self._done:
+            return
+        if self._length is not None:
+            remaining = self._length
+            while remaining:
+                data = await self._read(reader, min(size, remaining))
+                if not data:
+                    raise asyncio.IncompleteReadError(b'', remaining)
+                remaining -= len(data)
+                yield data
+        elif self._chunked:
+            while True:
+                line = await asyncio.wait_for(reader.readline(), self._pool.read_timeout)
+                chunk_left = int(line.split(b';', 1)[0].strip() or b'0', 16)
+                if chunk_left == 0:
+                    # Discard trailers up to the blank line
+                    while (await asyncio.wait_for(reader.readline(), self._pool.read_timeout)) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                while chunk_left:
+                    data = await self._readexactly(reader, min(size, chunk_left))
+                    chunk_left -= len(data)
+                    yield data
+                await self._readexactly(reader, 2)
+        else:
+            while True:
+                data = await self._read(reader, size)
+                if not data:
+                    break
+                yield data
+        self._done = True
+
+    async def read(self):
+        """Read the whole body."""
+        return b''.join([chunk async for chunk in self.iter_chunks()])
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        self._pool._release(self._key, conn, self._done and not self._will_close)
+        if self.started is not None:
+            self._pool._observe(self._key, 'total', time.perf_counter() - self.started)
+
+
+class AsyncUpstreamPool:
+    """Non-blocking counterpart of upstream_pool.UpstreamPool, with the same counters."""
+
+    def __init__(self, max_per_host=8, connect_timeout=5.0, read_timeout=15.0,
+                 pool_timeout=60.0, idle_timeout=60.0, ssl_context=None, metrics=None):
+        """
+        Args:
+            max_per_host: Most connections open to one host at a time
+            connect_timeout: Seconds allowed for connect and TLS handshake
+            read_timeout: Seconds allowed between bytes of the response
+            pool_timeout: Seconds a request waits for a free connection slot
+                          (raised to read_timeout if lower)
+            idle_timeout: Idle connections older than this are discarded;
+                          0 closes every connection after one request
+            ssl_context: Context for https upstreams (default: system trust)
+            metrics: server_metrics.ServerMetrics that receives connect, tls,
+                     first_byte and total timings; None records nothing
+        """
+        self.max_per_host = max_per_host
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_timeout = max(pool_timeout, read_timeout)
+        self.idle_timeout = idle_timeout
+        self.ssl_context = ssl_context or ssl.create_default_context()
+        self.metrics = metrics
+        self._idle = {}
+        self._slots = {}
+        self.stats = {'requests': 0, 'connections_opened': 0, 'connections_reused': 0,
+                      'stale_retries': 0, 'redirects': 0}
+
+    def _observe(self, key, phase, seconds):
+        if self.metrics is not None:
+            self.metrics.observe_upstream(key[1], phase, seconds)
+
+    def _slot(self, key):
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = asyncio.Semaphore(self.max_per_host)
+        return slot
+
+    async def _acquire(self, key):
+        """Return (connection, reused) for key, waiting for a free slot."""
+        try:
+            await asyncio.wait_for(self._slot(key).acquire(), self.pool_timeout)
+        except asyncio.TimeoutError:
+            raise PoolTimeout(f'no free upstream connection to {key[1]}:{key[2]} '
+                              f'within {self.pool_timeout}s') from None
+        now = time.monotonic()
+        idle = self._idle.get(key)
+        while idle:
+            reader, writer, last_used = idle.pop()
+            if now - last_used <= self.idle_timeout and not writer.is_closing() and not reader.at_eof():
+                self.stats['connections_reused'] += 1
+                return (reader, writer), True
+            writer.close()
+
+        self.stats['connections_opened'] += 1
+        scheme, host, port = key
+        try:
+            started = time.perf_counter()
+            if scheme == 'https' and hasattr(asyncio.StreamWriter, 'start_tls'):
+                # TCP first and the TLS handshake separately, so each gets its own timing (Python 3.11+)
+                conn = await asyncio.wait_for(asyncio.open_connection(host, port, limit=MAX_HEADER_BYTES),
+                                              self.connect_timeout)
+                connected = time.perf_counter()
+                try:
+                    await asyncio.wait_for(conn[1].start_tls(self.ssl_context, server_hostname=host),
+                                           self.connect_timeout)
+                except BaseException:
+                    conn[1].close()
+                    raise
+                self._observe(key, 'tls', time.perf_counter() - connected)
+            else:
+                conn = await asyncio.wait_for(
+                    asyncio.open_connection(host, port, ssl=self.ssl_context if scheme == 'https' else None,
+                                            limit=MAX_HEADER_BYTES),
+                    self.connect_timeout)
+                connected = time.perf_counter()
+            self._observe(key, 'connect', connected - started)
+        except BaseException:
+            self._slot(key).release()
+            raise
+        return conn, False
+
+    def _release(self, key, conn, reusable):
+        reader, writer = conn
+        if reusable and self.idle_timeout > 0 and not writer.is_closing():
+            self._idle.setdefault(key, deque()).append((reader, writer, time.monotonic()))
+        else:
+            writer.close()
+        self._slot(key).release()
+
+    async def _send(self, method, url, body, headers):
+        """Send one request (no redirects) and return an AsyncUpstreamResponse."""
+        parts = urllib.parse.urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ('http', 'https'):
+            raise ValueError(f'unsupported upstream scheme: {parts.scheme}')
+        default_port = 443 if scheme == 'https' else 80
+        port = parts.port or default_port
+        key = (scheme, parts.hostname, port)
+        target = urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+
+        host = parts.hostname if port == default_port else f'{parts.hostname}:{port}'
+        lines = [f'{method} {target} HTTP/1.1', f'Host: {host}', 'Accept-Encoding: identity']
+        lines += [f'{k}: {v}' for k, v in headers.items()]
+        if body is not None or method in ('POST', 'PUT'):
+            lines.append(f'Content-Length: {len(body or b"")}')
+        request = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + (body or b'')
+
+        while True:
+            conn, reused = await self._acquire(key)
+            reader, writer = conn
+            sent = False
+            try:
+                started = time.perf_counter()
+                writer.write(request)
+                await writer.drain()
+                sent = True
+                while True:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.read_timeout)
+                    start_line, response_headers, header_map = parse_head(head)
+                    version, _, rest = start_line.partition(' ')
+                    code, _, reason = rest.partition(' ')
+                    status = int(code)
+                    # Skip interim responses such as 100 Continue
+                    if not 100 <= status < 200 or status == 101:
+                        break
+                self._observe(key, 'first_byte', time.perf_counter() - started)
+                response = AsyncUpstreamResponse(self, key, conn, status, reason, response_headers,
+                                                 header_map, method, url)
+            except STALE_CONNECTION_ERRORS:
+                self._release(key, conn, False)
+                if not reused or (sent and method not in IDEMPOTENT_METHODS):
+                    raise
+                self.stats['stale_retries'] += 1
+                continue
+            except BaseException:
+                self._release(key, conn, False)
+                raise
+            if version == 'HTTP/1.0' and 'keep-alive' not in header_map.get('connection', '').lower():
+                response._will_close = True
+            return response
+
+    async def request(self, method, url, body=None, headers=None):
+        """
+        Send a request upstream, following redirects like urllib.
+
+        Returns:
+            AsyncUpstreamResponse; close() it when done
+        """
+        headers = dict(headers or {})
+        self.stats['requests'] += 1
+        started = time.perf_counter()
+        for _ in range(MAX_REDIRECTS + 1):
+            resp = await self._send(method, url, body, headers)
+            location = resp.getheader('Location')
+            if resp.status not in REDIRECT_CODES or not location:
+                resp.started = started
+                return resp
+            # Drain the redirect body so its connection can be reused
+            await resp.read()
+            resp.close()
+            self.stats['redirects'] += 1
+            url = urllib.parse.urljoin(url, location)
+            if resp.status in (301, 302, 303) and method != 'HEAD':
+                method = 'GET'
+                body = None
+                headers.pop('Content-Type', None)
+        raise http.client.HTTPException(f'too many redirects ending at {url}')
+
+    def snapshot(self):
+        stats = dict(self.stats)
+        stats['idle_connections'] = sum(len(idle) for idle in self._idle.values())
+        return stats
+
+    def close(self):
+        """Close every idle connection."""
+        idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for _, writer, _ in connections:
+                writer.close()
+
+
+class Request:
+    """One parsed client request."""
+
+    def __init__(self, method, target, version, headers, header_map, body):
+        self.method = method
+        self.target = target
+        self.version = version
+        self.headers = headers
+        self.header_map = header_map
+        self.body = body
+        self.path = target.split('?', 1)[0].split('#', 1)[0]
+
+
+class ConnectionHandler:
+    """Serves the requests of one client connection, in order."""
+
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.peer = writer.get_extra_info('peername') or ('-', 0)
+        self.keep_alive = True
+        self.relay_started = False
+        # Status of the response to the current request, once it has been sent
+        self.status = None
+        # True while a request is being answered; idle connections are closed at shutdown
+        self.busy = False
+
+    # -- request parsing -------------------------------------------------
+
+    async def read_request(self):
+        """Return the next Request, or None when the client closed the connection."""
+        try:
+            head = await asyncio.wait_for(self.reader.readuntil(b'\r\n\r\n'), KEEP_ALIVE_TIMEOUT)
+        except asyncio.IncompleteReadError as e:
+            if e.partial.strip():
+                raise BadRequest(400, 'Incomplete request head') from None
+            return None
+        except asyncio.LimitOverrunError:
+            raise BadRequest(431, 'Request header fields too large') from None
+        except asyncio.TimeoutError:
+            return None
+
+        try:
+            request_line, headers, header_map = parse_head(head)
+            method, target, version = request_line.split(' ')
+        except ValueError:
+            raise BadRequest(400, 'Bad request syntax') from None
+        if not version.startswith('HTTP/1.'):
+            raise BadRequest(505, 'HTTP version not supported')
+        if 'chunked' in header_map.get('transfer-encoding', '').lower():
+            raise BadRequest(411, 'Length required')
+
+        length = header_map.get('content-length', '0').strip() or '0'
+        if not length.isdigit():
+            # What BaseHTTPRequestHandler-based servers answer too, instead of dropping the connection
+            raise BadRequest(400, 'Bad Content-Length')
+        length = int(length)
+        body = await self.reader.readexactly(length) if length > 0 else b''
+
+        connection = header_map.get('connection', '').lower()
+        if version == 'HTTP/1.0':
+            self.keep_alive = 'keep-alive' in connection
+        else:
+            self.keep_alive = 'close' not in connection
+        return Request(method, target, version, headers, header_map, body)
+
+    # -- response helpers --------------------------------------------------
+
+    def head_bytes(self, status, headers):
+        if self.server.draining:
+            self.keep_alive = False
+        phrase = HTTPStatus(status).phrase if status in HTTPStatus._value2member_map_ else ''
+        lines = [f'HTTP/1.1 {status} {phrase}', f'Server: {SERVER_NAME}',
+                 f'Date: {email.utils.formatdate(usegmt=True)}']
+        lines += [f'{k}: {v}' for k, v in headers]
+        lines += [f'{k}: {v}' for k, v in CORS_HEADERS]
+        lines.append('Connection: keep-alive' if self.keep_alive else 'Connection: close')
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1', 'replace')
+
+    async def send(self, request, status, headers, body=b''):
+        """Send a complete response with a Content-Length."""
+        self.writer.write(self.head_bytes(status, list(headers) + [('Content-Length', str(len(body)))]))
+        if request is None or request.method != 'HEAD':
+            self.writer.write(body)
+        await self.writer.drain()
+        self.log(request, status)
+
+    async def send_text(self, request, status, text):
+        await self.send(request, status, [('Content-Type', 'text/plain')], text.encode('utf-8'))
+
+    def log(self, request, status):
+        self.status = status
+        if self.server.quiet:
+            return
+        line = f'{request.method} {request.target} {request.version}' if request else '-'
+        stamp = time.strftime('%d/%b/%Y %H:%M:%S')
+        sys.stderr.write(f'{self.peer[0]} - - [{stamp}] "{line}" {status} -\n')
+
+    # -- connection loop ---------------------------------------------------
+
+    async def run(self):
+        try:
+            while self.keep_alive:
+                try:
+                    request = await self.read_request()
+                except BadRequest as e:
+                    self.keep_alive = False
+                    await self.send_text(None, e.status, str(e))
+                    break
+                if request is None:
+                    break
+                await self.timed_dispatch(request)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception:
+            print('Unhandled error while serving a request:')
+            traceback.print_exc()
+        finally:
+            self.writer.close()
+
+    async def timed_dispatch(self, request):
+        """dispatch() the request, recording its metrics and feeding the profiler's slow-request log."""
+        metrics = self.server.metrics
+        if metrics is not None:
+            metrics.request_started()
+        self.status = None
+        self.busy = True
+        started = time.perf_counter()
+        try:
+            await self.dispatch(request)
+        finally:
+            self.busy = False
+            seconds = time.perf_counter() - started
+            if metrics is not None:
+                metrics.request_finished(route_for(request.target), request.method, self.status, seconds)
+            self.server.profiler.end_request(None, request.method, request.target, self.status, seconds)
+
+    async def dispatch(self, request):
+        if request.method == 'OPTIONS':
+            return await self.send(request, 204, [])
+        if request.method == 'POST':
+            if request.target.startswith('/proxy'):
+                return await self.proxy_forward(request, self.server.proxy_target(request.target))
+            return await self.send_text(request, 501, 'Unsupported method')
+        if request.method not in ('GET', 'HEAD'):
+            return await self.send_text(request, 501, 'Unsupported method')
+
+        if request.method == 'GET':
+            if request.path == '/__run_local_shutdown__':
+                self.keep_alive = False
+                await self.send(request, 200, [('Content-Type', 'text/plain')], b'OK')
+                if self.server.shutdown_hook is not None:
+                    # A --workers worker: the master stops (or with ?restart, replaces) every worker
+                    query = urllib.parse.parse_qs(urllib.parse.urlsplit(request.target).query, keep_blank_values=True)
+                    self.server.shutdown_hook('restart' in query)
+                    return
+                # give the response a moment to flush
+                asyncio.get_running_loop().call_later(0.1, self.server.shutdown)
+                return
+            if request.target == '/__proxy_cache__':
+                return await self.send_json(request, {
+                    'cache': self.server.proxy_cache.snapshot() if self.server.proxy_cache else None,
+                    'upstream': self.server.upstream_pool.snapshot(),
+                    'static': self.server.static_assets.snapshot(),
+                    'backend': self.server.local_backend.snapshot() if self.server.local_backend else None,
+                })
+            if request.target == '/__metrics__' and self.server.metrics is not None:
+                text = self.server.metrics.render(self.server.metric_sections())
+                return await self.send(request, 200, [('Content-Type', PROMETHEUS_CONTENT_TYPE),
+                                                      ('Cache-Control', 'no-store')], text.encode('utf-8'))
+            if request.path == '/__profile__':
+                text = self.server.profiler.handle(urllib.parse.urlsplit(request.target).query)
+                return await self.send(request, 200, [('Content-Type', 'text/plain; charset=utf-8'),
+                                                      ('Cache-Control', 'no-store')], text.encode('utf-8'))
+            if request.target == '/proxy_test':
+                return await self.proxy_test(request)
+            if request.target.startswith('/proxy'):
+                return await self.proxy_forward(request, self.server.proxy_target(request.target))
+        return await self.serve_static(request)
+
+    async def send_json(self, request, payload):
+        data = json.dumps(payload, indent=2).encode('utf-8')
+        await self.send(request, 200, [('Content-Type', 'application/json'), ('Cache-Control', 'no-store')], data)
+
+    # -- proxy -------------------------------------------------------------
+
+    def is_cacheable(self, request, target_url):
+        if self.server.proxy_cache is None or request.method != 'GET':
+            return False
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(target_url).query)
+        return any(action in CACHEABLE_PROXY_ACTIONS for action in query.get('action', []))
+
+    async def serve_cached(self, request, target_url, status=None, header_names=None):
+        """Answer from the proxy cache, loading target_url upstream once if needed."""
+        async def load():
+            headers = {h: request.header_map[h.lower()] for h in ('User-Agent', 'Accept')
+                       if h.lower() in request.header_map}
+            resp = await self.server.upstream_pool.request('GET', target_url, None, headers)
+            try:
+                body = await resp.read()
+            finally:
+                resp.close()
+            kept = [(k, v) for k, v in resp.headers
+                    if k.lower() not in HOP_BY_HOP_HEADERS
+                    and k.lower() not in UNCACHED_HEADERS]
+            return CachedResponse(resp.status, kept, body)
+
+        response, outcome = await self.server.proxy_cache.get_or_load_async(target_url, load)
+        headers = [(k, v) for k, v in response.headers
+                   if header_names is None or k.lower() in header_names]
+        headers.append(('X-Proxy-Cache', outcome.upper()))
+        await self.send(request, status or response.status, headers, response.body)
+
+    async def relay(self, request, resp, status=None, header_names=None):
+        """Stream resp to the client, passing Content-Length through or sending it chunked."""
+        headers = []
+        length = None
+        for k, v in resp.headers:
+            name = k.lower()
+            if name in HOP_BY_HOP_HEADERS or name in ('server', 'date'):
+                continue
+            if header_names is not None and name not in header_names:
+                continue
+            if name == 'content-length':
+                length = v
+                continue
+            headers.append((k, v))
+
+        chunked = False
+        if length is not None:
+            headers.append(('Content-Length', length))
+        elif request.version >= 'HTTP/1.1':
+            headers.append(('Transfer-Encoding', 'chunked'))
+            chunked = True
+        else:
+            self.keep_alive = False
+
+        self.writer.write(self.head_bytes(status or resp.status, headers))
+        self.relay_started = True
+        async for chunk in resp.iter_chunks(RELAY_CHUNK_SIZE):
+            self.writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk) if chunked else chunk)
+            await self.writer.drain()
+        if chunked:
+            self.writer.write(b'0\r\n\r\n')
+        await self.writer.drain()
+        self.log(request, status or resp.status)
+
+    async def serve_local_backend(self, request, target_url):
+        """Answer a /proxy call from the in-process Apps Script stand-in."""
+        params = parse_params(urllib.parse.urlsplit(target_url).query, request.body,
+                              request.header_map.get('content-type'))
+        data = json.dumps(self.server.local_backend.handle(params)).encode('utf-8')
+        await self.send(request, 200, [('Content-Type', 'application/json')], data)
+
+    async def proxy_forward(self, request, target_url):
+        """Forward the request to target_url and stream the response back."""
+        if self.server.local_backend is not None:
+            return await self.serve_local_backend(request, target_url)
+        self.relay_started = False
+        try:
+            if self.is_cacheable(request, target_url):
+                return await self.serve_cached(request, target_url)
+            headers = {h: request.header_map[h.lower()] for h in ('Content-Type', 'User-Agent', 'Accept')
+                       if h.lower() in request.header_map}
+            resp = await self.server.upstream_pool.request(request.method, target_url,
+                                                           request.body or None, headers)
+            try:
+                await self.relay(request, resp)
+            finally:
+                resp.close()
+        except Exception as e:
+            if self.server.metrics is not None:
+                self.server.metrics.proxy_error(e)
+            print('Proxy forwarding exception:')
+            traceback.print_exc()
+            if self.relay_started:
+                # Headers are already out; all we can do is cut the response short
+                self.keep_alive = False
+                return
+            await self.send_text(request, 502, f'Proxy error: {e}\nSee server console for details.')
+
+    async def proxy_test(self, request):
+        """Diagnostic endpoint to test server -> Apps Script connectivity."""
+        if self.server.local_backend is not None:
+            return await self.serve_local_backend(request, '/proxy_test?action=getLeaderboard')
+        target = os.environ.get('APPSCRIPT_URL') or f'{DEFAULT_APPSCRIPT_URL}?action=getLeaderboard'
+        self.relay_started = False
+        try:
+            if self.is_cacheable(request, target):
+                return await self.serve_cached(request, target, 200, ('content-type',))
+            resp = await self.server.upstream_pool.request('GET', target)
+            try:
+                await self.relay(request, resp, 200, ('content-type', 'content-length'))
+            finally:
+                resp.close()
+        except Exception as e:
+            if self.server.metrics is not None:
+                self.server.metrics.proxy_error(e)
+            print('Proxy test failed:')
+            traceback.print_exc()
+            if self.relay_started:
+                self.keep_alive = False
+                return
+            await self.send_text(request, 502, f'Proxy test error: {e}\nSee server console for details.')
+
+    # -- static files ------------------------------------------------------
+
+    def translate_path(self, path):
+        """Map a URL path onto the served directory, like SimpleHTTPRequestHandler."""
+        trailing_slash = path.rstrip().endswith('/')
+        try:
+            path = urllib.parse.unquote(path, errors='surrogatepass')
+        except UnicodeDecodeError:
+            path = urllib.parse.unquote(path)
+        path = posixpath.normpath(path)
+        result = self.server.directory
+        for word in filter(None, path.split('/')):
+            if os.path.dirname(word) or word in (os.curdir, os.pardir):
+                # Ignore components that are not a simple file/directory name
+                continue
+            result = os.path.join(result, word)
+        if trailing_slash:
+            result += '/'
+        return result
+
+    async def list_directory(self, request, path):
+        """Send the same directory listing SimpleHTTPRequestHandler does."""
+        try:
+            names = sorted(os.listdir(path), key=str.lower)
+        except OSError:
+            return await self.send_text(request, 404, 'No permission to list directory')
+        try:
+            display_path = urllib.parse.unquote(request.path, errors='surrogatepass')
+        except UnicodeDecodeError:
+            display_path = urllib.parse.unquote(request.path)
+        title = f'Directory listing for {html.escape(display_path, quote=False)}'
+        encoding = sys.getfilesystemencoding()
+        lines = ['<!DOCTYPE HTML>', '<html lang="en">', '<head>', f'<meta charset="{encoding}">',
+                 f'<title>{title}</title>\n</head>', f'<body>\n<h1>{title}</h1>', '<hr>\n<ul>']
+        for name in names:
+            full_name = os.path.join(path, name)
+            display_name = link_name = name
+            # Append / for directories or @ for symbolic links
+            if os.path.isdir(full_name):
+                display_name = link_name = name + '/'
+            if os.path.islink(full_name):
+                display_name = name + '@'
+            lines.append(f'<li><a href="{urllib.parse.quote(link_name, errors="surrogatepass")}">'
+                         f'{html.escape(display_name, quote=False)}</a></li>')
+        lines.append('</ul>\n<hr>\n</body>\n</html>\n')
+        body = '\n'.join(lines).encode(encoding, 'surrogateescape')
+        await self.send(request, 200, [('Content-Type', f'text/html; charset={encoding}')], body)
+
+    async def serve_static(self, request):
+        path = self.translate_path(request.path)
+        if os.path.isdir(path):
+            if not request.path.endswith('/'):
+                location = request.path + '/' + (request.target[len(request.path):])
+                return await self.send(request, 301, [('Location', location)])
+            for index in ('index.html', 'index.htm'):
+                index_path = os.path.join(path, index)
+                if os.path.isfile(index_path):
+                    path = index_path
+                    break
+            else:
+                return await self.list_directory(request, path)
+        if path.endswith('/'):
+            return await self.send_text(request, 404, 'File not found')
+
+        loop = asyncio.get_running_loop()
+        try:
+            # A miss stats, reads and hashes the whole file; keep that off the loop
+            static = await loop.run_in_executor(None, self.server.static_assets.open, path,
+                                                request.header_map.get('accept-encoding'),
+                                                request.header_map.get('if-none-match'),
+                                                request.header_map.get('if-modified-since'))
+        except OSError:
+            return await self.send_text(request, 404, 'File not found')
+        self.writer.write(self.head_bytes(static.status, static.headers))
+        if isinstance(static.file, CachedBody):
+            if request.method != 'HEAD':
+                self.writer.write(static.file.data)
+        elif static.file is not None:
+            with static.file:
+                if request.method != 'HEAD' and static.length:
+                    if self.server.use_sendfile:
+                        await loop.sendfile(self.writer.transport, static.file)
+                    else:
+                        while True:
+                            chunk = await loop.run_in_executor(None, static.file.read, RELAY_CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            self.writer.write(chunk)
+                            await self.writer.drain()
+        await self.writer.drain()
+        self.log(request, static.status)
+
+
+class AsyncServer:
+    """asyncio HTTP server with the same routes as CORSRequestHandler."""
+
+    def __init__(self, directory, upstream_pool=None, proxy_cache=None, quiet=False,
+                 static_assets=None, use_sendfile=True, local_backend=None, metrics=None, profiler=None,
+                 shutdown_hook=None):
+        self.directory = os.path.abspath(directory)
+        self.upstream_pool = upstream_pool or AsyncUpstreamPool()
+        self.proxy_cache = proxy_cache
+        self.static_assets = static_assets or StaticAssets()
+        self.use_sendfile = use_sendfile
+        self.local_backend = local_backend
+        self.metrics = metrics
+        # Everything runs on the loop thread, so cProfile covers the whole loop rather than single requests
+        self.profiler = profiler or Profiler(per_request=False)
+        # Set in --workers processes: called with restart=True/False instead of stopping this process alone
+        self.shutdown_hook = shutdown_hook
+        self.quiet = quiet
+        self.draining = False
+        self._connections = set()
+        self._server = None
+        self._stopped = None
+        self._publisher = None
+
+    def proxy_target(self, path):
+        target = os.environ.get('APPSCRIPT_URL') or DEFAULT_APPSCRIPT_URL
+        # e.g. /proxy?action=register -> forward the suffix as is
+        if path != '/proxy' and path.startswith('/proxy'):
+            target = target + path[len('/proxy'):]
+        return target
+
+    def metric_sections(self):
+        """Counters exported alongside the request metrics on /__metrics__."""
+        return {
+            'proxy_cache': self.proxy_cache.snapshot() if self.proxy_cache else None,
+            'upstream': self.upstream_pool.snapshot(),
+            'static': self.static_assets.snapshot(),
+            'backend': self.local_backend.snapshot() if self.local_backend else None,
+        }
+
+    async def _handle(self, reader, writer):
+        handler = ConnectionHandler(self, reader, writer)
+        self._connections.add(handler)
+        try:
+            await handler.run()
+        finally:
+            self._connections.discard(handler)
+
+    async def _publish_metrics(self):
+        while True:
+            self.metrics.publish(self.metric_sections())
+            await asyncio.sleep(PUBLISH_INTERVAL)
+
+    async def start(self, host=None, port=None, sock=None):
+        """Bind (or take over the listening sock) and start accepting; returns the bound port."""
+        self._stopped = asyncio.Event()
+        if sock is not None:
+            self._server = await asyncio.start_server(self._handle, sock=sock, limit=MAX_HEADER_BYTES, backlog=128)
+        else:
+            self._server = await asyncio.start_server(self._handle, host, port, limit=MAX_HEADER_BYTES,
+                                                      backlog=128, reuse_address=True)
+        if self.metrics is not None and self.metrics.share_dir:
+            self._publisher = asyncio.ensure_future(self._publish_metrics())
+        return self._server.sockets[0].getsockname()[1]
+
+    def shutdown(self):
+        if self._stopped is not None:
+            self._stopped.set()
+
+    async def wait_closed(self):
+        await self._stopped.wait()
+        self._server.close()
+        # Requests in progress get DRAIN_SECONDS to finish; idle keep-alive connections are closed now
+        self.draining = True
+        for handler in list(self._connections):
+            if not handler.busy:
+                handler.writer.close()
+        deadline = time.monotonic() + DRAIN_SECONDS
+        while self._connections and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        await self._server.wait_closed()
+        if self._publisher is not None:
+            self._publisher.cancel()
+            self.metrics.publish(self.metric_sections())
+        self.upstream_pool.close()
+
+
+def run_async(port, directory, open_browser_flag=True, upstream_pool=None, proxy_cache=None,
+              static_assets=None, use_sendfile=True, local_backend=None, metrics=None, profiler=None):
+    """Counterpart of run_server.run() that serves with AsyncServer."""
+    os.chdir(directory)
+    # Attempt to politely ask an existing run_local server to shutdown (if it was running here before)
+    try:
+        urllib.request.urlopen(f'http://localhost:{port}/__run_local_shutdown__', timeout=1)
+        print('Requested existing local server to shut down...')
+        time.sleep(0.5)
+    except Exception:
+        pass
+
+    async def main():
+        server = AsyncServer(directory, upstream_pool, proxy_cache, static_assets=static_assets,
+                             use_sendfile=use_sendfile, local_backend=local_backend, metrics=metrics,
+                             profiler=profiler)
+        bound = None
+        tried_ports = []
+        for p in range(port, port + 11):
+            tried_ports.append(p)
+            try:
+                bound = await server.start('', p)
+                break
+            except OSError as e:
+                print(f"OS error binding to port {p}: {e}")
+        if bound is None:
+            print(f"Failed to bind to any port in the range {tried_ports}.")
+            return
+
+        url = f'http://localhost:{bound}/index.html'
+        print(f"Serving directory (asyncio): {os.path.abspath(directory)}")
+        print(f"Open this URL in your browser: {url}")
+        if open_browser_flag:
+            try:
+                webbrowser.open(url)
+            except Exception as e:
+                print('Could not open browser automatically:', e)
+        await server.wait_closed()
+        server.profiler.stop()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print('\nShutting down server...')
+
+
+def serve_socket_async(sock, directory, **server_options):
+    """
+    Serve on a listening socket from prefork.Supervisor until SIGTERM, then
+    let the requests in progress finish.
+
+    Args:
+        server_options: Keyword arguments for AsyncServer
+    """
+    directory = os.path.abspath(directory)
+    os.chdir(directory)
+
+    async def main():
+        server = AsyncServer(directory, **server_options)
+        await server.start(sock=sock)
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, server.shutdown)
+        await server.wait_closed()
+        server.profiler.stop()
+
+    asyncio.run(main())
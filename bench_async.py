@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+bench_async.py
+Concurrency benchmark comparing run_server.py's threaded mode with the
+asyncio mode (`--async`).
+
+The stub upstream (stub_upstream.py) and each server under test run as
+separate processes, so the client, the server and the upstream do not share a
+GIL. The client is an asyncio load generator that keeps N requests in flight
+at a time, each on a new connection the way a classroom of browsers would
+arrive. For every mode and concurrency level it reports throughput, p50/p99
+latency, errors, and the server process's peak thread count and peak RSS
+(read from /proc, so those two columns are Linux only).
+
+Workloads:
+  proxy    submitScore POSTs through /proxy to the stub (default); this is
+           where the threaded server parks one thread per waiting request
+  static   GETs of index.html
+
+Usage:
+    python bench_async.py [--workload proxy] [--concurrency 50 200 500] [--requests 2000] [--latency 100]
+"""
+
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import threading
+import subprocess
+import urllib.request
+
+from bench_proxy import percentile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+
+def start_process(args, env=None):
+    return subprocess.Popen([sys.executable] + args, cwd=HERE, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+class ProcessSampler:
+    """Polls /proc/<pid>/status for the peak thread count while a run is going."""
+
+    def __init__(self, pid, interval=0.02):
+        self.pid = pid
+        self.interval = interval
+        self.peak_threads = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _read_status(self):
+        try:
+            with open(f'/proc/{self.pid}/status') as f:
+                return dict(line.split(':', 1) for line in f if ':' in line)
+        except OSError:
+            return None
+
+    def _run(self):
+        while not self._stop.is_set():
+            status = self._read_status()
+            if status is None:
+                return
+            threads = int(status['Threads'])
+            self.peak_threads = max(self.peak_threads or 0, threads)
+            self._stop.wait(self.interval)
+
+    def peak_rss_mb(self):
+        status = self._read_status()
+        if status is None or 'VmHWM' not in status:
+            return None
+        return int(status['VmHWM'].split()[0]) / 1024
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+async def fetch(port, request):
+    """Send one request on a new connection; returns the status code."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(request)
+        await writer.drain()
+        status_line = await reader.readline()
+        # Both servers close the connection after answering 'Connection: close'
+        while await reader.read(64 * 1024):
+            pass
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+async def run_load(port, requests, total, concurrency, timeout=60.0):
+    """
+    Keep concurrency requests in flight until total have been sent.
+
+    Args:
+        requests: Raw requests to send, in turn
+
+    Returns:
+        Tuple of (sorted latencies, errors, seconds)
+    """
+    latencies = []
+    errors = []
+    remaining = iter(range(total))
+
+    async def client():
+        for i in remaining:
+            start = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(fetch(port, requests[i % len(requests)]), timeout)
+            except Exception as e:
+                errors.append(e)
+                continue
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors.append(status)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return sorted(latencies), errors, time.perf_counter() - start
+
+
+def build_request(workload):
+    if workload == 'static':
+        return b'GET /index.html HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'
+    body = b'{"email": "candidate@example.com", "score": 42, "total": 50}'
+    return (b'POST /proxy?action=submitScore HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n'
+            b'Content-Type: application/json\r\nContent-Length: %d\r\n\r\n%s' % (len(body), body))
+
+
+def bench_mode(label, flags, level, args, upstream_url, request):
+    port = free_port()
+    env = dict(os.environ, APPSCRIPT_URL=upstream_url, PROXY_DISABLED='1')
+    # Pool as large as the client concurrency so neither mode queues on upstream slots
+    server = start_process(['run_server.py', '--no-open', '--port', str(port), '--cache-ttl', '0',
+                            '--upstream-connections', str(level)] + flags, env)
+    try:
+        if not wait_for_port(port):
+            print(f'{label:<10} {level:>6}  server did not start')
+            return
+        # Warm up: imports, first upstream connections, page cache
+        asyncio.run(run_load(port, [request], min(level, 50), min(level, 50)))
+        with ProcessSampler(server.pid) as sampler:
+            latencies, errors, seconds = asyncio.run(run_load(port, [request], args.requests, level))
+        rss = sampler.peak_rss_mb()
+        threads = sampler.peak_threads
+        print(f'{label:<10} {level:>6} {len(latencies) / seconds:>8.1f} '
+              f'{percentile(latencies, 50) * 1000:>9.1f} {percentile(latencies, 99) * 1000:>9.1f} '
+              f"{len(errors):>7} {threads if threads is not None else '-':>8} "
+              f"{f'{rss:.1f}' if rss is not None else '-':>8}")
+    finally:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/__run_local_shutdown__', timeout=2)
+        except Exception:
+            pass
+        try:
+            server.wait(timeout=3)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare threaded and asyncio serving under concurrent load')
+    parser.add_argument('--workload', choices=('proxy', 'static'), default='proxy',
+                        help='What each request does (default: proxy)')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[50, 200, 500],
+                        help='Requests kept in flight, one run per value (default: 50 200 500)')
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per run (default: 2000)')
+    parser.add_argument('--latency', type=float, default=100,
+                        help='Simulated upstream processing in ms (default: 100)')
+    args = parser.parse_args()
+
+    # The client keeps one socket per in-flight request
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+    upstream_port = free_port()
+    upstream = start_process(['stub_upstream.py', '--port', str(upstream_port),
+                              '--latency', str(args.latency), '--handshake', '0'])
+    if not wait_for_port(upstream_port):
+        print('Stub upstream did not start')
+        upstream.kill()
+        return
+    upstream_url = f'http://127.0.0.1:{upstream_port}/exec'
+    request = build_request(args.workload)
+
+    what = (f'submitScore POSTs via /proxy, upstream processing {args.latency:.0f} ms'
+            if args.workload == 'proxy' else 'GET /index.html')
+    print(f'{args.requests} requests per run: {what}\n')
+    print(f"{'Mode':<10} {'conc.':>6} {'req/s':>8} {'p50 (ms)':>9} {'p99 (ms)':>9} {'errors':>7} "
+          f"{'threads':>8} {'RSS MB':>8}")
+    print('-' * 72)
+    try:
+        for level in args.concurrency:
+            for label, flags in (('threaded', []), ('async', ['--async'])):
+                bench_mode(label, flags, level, args, upstream_url, request)
+    finally:
+        upstream.terminate()
+        upstream.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+bench_backend.py
+Cost of the Apps Script's row scans, measured against appscript_backend.py.
+
+SheetScanBackend below is a line-by-line port of `Appscript code.txt`. Every
+call copies the whole sheet (getDataRange().getValues()) and scans it for
+the email. A submit then makes up to four single-cell writes and appends to
+the ' | '-joined history string. The benchmark fills both backends with the
+same number of users and times register and submitScore calls against
+them, reporting per-call latency and the sheet cells read and written per
+call.
+
+The port runs in local Python, so its absolute times are far below what
+Apps Script charges for the same calls. What carries over is how they grow
+with the number of rows.
+
+With --check-flush it instead checks appscript_backend.py's batching on
+disk: one register and one submitScore against a persisted backend, then no
+further calls. The score must not be written while the batch is open, and
+must be in scores.jsonl once flush_interval has passed. Exits 1 otherwise.
+
+Usage:
+    python bench_backend.py [--rows 1000 10000 50000] [--calls 500]
+    python bench_backend.py --check-flush [--flush-interval 0.5]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+from appscript_backend import SCORES_FILE, AppsScriptBackend, create_response, now_iso
+
+
+class SheetScanBackend:
+    """The script's register / submitScore as written, over an in-memory sheet."""
+
+    def __init__(self):
+        self.sheet = [['Timestamp', 'Name', 'Email', 'Phone Number', 'Log-in Count', 'Device IDs',
+                       'Latest Score', 'Score History']]
+        self.cells_read = 0
+        self.cells_written = 0
+
+    def get_values(self):
+        # getDataRange().getValues() hands back a fresh copy of every cell
+        self.cells_read += len(self.sheet) * len(self.sheet[0])
+        return [row[:] for row in self.sheet]
+
+    def set_value(self, row_number, column, value):
+        self.sheet[row_number - 1][column - 1] = value
+        self.cells_written += 1
+
+    def append_row(self, row):
+        self.sheet.append(row)
+        self.cells_written += len(row)
+
+    def register(self, params):
+        email = params.get('email')
+        if not email:
+            return create_response(False, 'Email is required for registration.')
+        data = self.get_values()
+        for i in range(1, len(data)):
+            if data[i][2] == email:
+                return create_response(False, 'User already registered. Please submit score.')
+        self.append_row([now_iso(), params.get('name') or 'Anonymous User', email,
+                         params.get('phoneNumber') or '', 0, '', 0, ''])
+        return create_response(True, 'Registration successful! You can now submit scores.', {'email': email})
+
+    def submit_score(self, params):
+        email = params.get('email')
+        device_id = params.get('deviceID')
+        new_score = int(params['score'])
+        data = self.get_values()
+        user_row_index = -1
+        for i in range(1, len(data)):
+            if data[i][2] == email:
+                user_row_index = i
+                break
+        if user_row_index == -1:
+            return create_response(False, 'User not found. Please register first.')
+        row = data[user_row_index]
+        row_number = user_row_index + 1
+        count = int(row[4] or 0) + 1
+        self.set_value(row_number, 5, count)
+        devices = [d.strip() for d in (row[5] or '').split(',') if d.strip()]
+        new_device = device_id not in devices
+        if new_device:
+            devices.append(device_id)
+            self.set_value(row_number, 6, ', '.join(devices))
+        self.set_value(row_number, 7, new_score)
+        history = row[7] or ''
+        history += (' | ' if history else '') + f'{now_iso()[:10]} ({new_score})'
+        self.set_value(row_number, 8, history)
+        return create_response(True, 'Score submitted successfully!',
+                               {'sessionCount': count, 'latestScore': new_score, 'newDevice': new_device})
+
+    def handle(self, params):
+        action = params.get('action')
+        if action == 'register':
+            return self.register(params)
+        if action == 'submitScore':
+            return self.submit_score(params)
+        return create_response(False, 'Invalid action specified.')
+
+
+def populate(backend, rows):
+    if isinstance(backend, SheetScanBackend):
+        # Registering through the scan would take O(rows^2); fill the sheet directly
+        backend.sheet += [[now_iso(), f'User {i}', f'user{i}@example.com', '', 0, '', 0, '']
+                          for i in range(rows)]
+        return
+    for i in range(rows):
+        backend.handle({'action': 'register', 'email': f'user{i}@example.com', 'name': f'User {i}'})
+
+
+def time_calls(backend, calls, rows, action, rng):
+    """Time calls of one action; returns (mean ms per call, cells read per call, cells written per call)."""
+    read_before = getattr(backend, 'cells_read', 0)
+    written_before = getattr(backend, 'cells_written', 0)
+    start = time.perf_counter()
+    for n in range(calls):
+        if action == 'register':
+            params = {'action': 'register', 'email': f'new{n}-{rng.random()}@example.com', 'name': 'New'}
+        else:
+            params = {'action': 'submitScore', 'email': f'user{rng.randrange(rows)}@example.com',
+                      'score': str(rng.randint(0, 50)), 'deviceID': f'device{rng.randrange(3)}'}
+        result = backend.handle(params)
+        assert result['success'], result
+    seconds = time.perf_counter() - start
+    read = (getattr(backend, 'cells_read', 0) - read_before) / calls
+    written = (getattr(backend, 'cells_written', 0) - written_before) / calls
+    return seconds / calls * 1000, read, written
+
+
+def check_idle_flush(flush_interval):
+    """Return True if an acknowledged score reaches the disk with no further calls."""
+    with tempfile.TemporaryDirectory() as data_dir:
+        backend = AppsScriptBackend(data_dir, batch_size=64, flush_interval=flush_interval)
+        try:
+            backend.handle({'action': 'register', 'email': 'idle@example.com', 'name': 'Idle'})
+            reply = backend.handle({'action': 'submitScore', 'email': 'idle@example.com',
+                                    'score': '37', 'deviceID': 'device-1'})
+            acknowledged = time.monotonic()
+            path = os.path.join(data_dir, SCORES_FILE)
+
+            def on_disk():
+                if not os.path.exists(path):
+                    return []
+                with open(path, encoding='utf-8') as f:
+                    return [json.loads(line) for line in f if line.strip()]
+
+            batched = not on_disk()
+            # Only the background flusher can write it now
+            time.sleep(flush_interval * 1.5)
+            records = on_disk()
+            waited = time.monotonic() - acknowledged
+        finally:
+            backend.close()
+
+    written = [r for r in records if r['email'] == 'idle@example.com' and r['score'] == 37]
+    print(f"submitScore acknowledged: {reply['success']}; pending in the batch right after: {batched}")
+    print(f'{len(written)} score record(s) on disk {waited:.2f} s later, with no further calls '
+          f'(flush_interval {flush_interval} s)')
+    return reply['success'] and len(written) == 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare row-scanning and indexed Apps Script backends')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 50000],
+                        help='Registered users to test with (default: 1000 10000 50000)')
+    parser.add_argument('--calls', type=int, default=500, help='Calls timed per action (default: 500)')
+    parser.add_argument('--check-flush', action='store_true',
+                        help='Check that a persisted backend writes an acknowledged score with no further calls')
+    parser.add_argument('--flush-interval', type=float, default=0.5,
+                        help='flush_interval for --check-flush, in seconds (default: 0.5)')
+    args = parser.parse_args()
+
+    if args.check_flush:
+        if check_idle_flush(args.flush_interval):
+            print('✓ Batched score written by the background flush')
+            return 0
+        print('✗ Batched score not on disk after flush_interval')
+        return 1
+
+    print(f"{'Rows':>7} {'Backend':<9} {'Action':<12} {'ms/call':>9} {'cells read':>11} {'cells written':>14}")
+    print('-' * 67)
+    for rows in args.rows:
+        for label, backend in (('scan', SheetScanBackend()), ('indexed', AppsScriptBackend())):
+            populate(backend, rows)
+            for action in ('submitScore', 'register'):
+                rng = random.Random(rows)
+                ms, read, written = time_calls(backend, args.calls, rows, action, rng)
+                if label == 'indexed':
+                    # Whole rows are written in batches; count cells like the sheet would
+                    read, written = 0, '1 row + log'
+                print(f'{rows:>7} {label:<9} {action:<12} {ms:>9.3f} {read:>11,.0f} '
+                      f"{written if isinstance(written, str) else f'{written:.1f}':>14}")
+        print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
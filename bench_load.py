@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark for parallel question bank loading
+
+Times load_bank() serially and in process pools of growing size, and checks
+that every pool produces exactly the same bank as the serial load. Use
+--copies to simulate a larger bank: the sets are duplicated into a temporary
+directory under new set numbers before timing.
+
+Usage:
+    python bench_load.py [--repeat 3] [--copies 1] [--max-workers N]
+"""
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+
+from question_bank import DEFAULT_SOURCE_DIR, discover_sets, load_bank
+
+
+def make_scaled_copy(source_dir, copies, target_dir):
+    """Copy every set copies times into target_dir, numbering them setN.json."""
+    number = 1
+    for _ in range(copies):
+        for path in discover_sets(source_dir):
+            shutil.copyfile(path, Path(target_dir) / f"set{number}.json")
+            number += 1
+    return number - 1
+
+
+def best_time(source_dir, workers, repeat):
+    """Return (best seconds, bank) over repeat loads."""
+    best = None
+    bank = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        bank = load_bank(source_dir, workers=workers)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, bank
+
+
+def bank_signature(bank):
+    """Everything about a bank that must not depend on the worker count."""
+    sets = [(s["file"], s["start"], s["end"], s["non_objects"], s["error"]) for s in bank.sets]
+    return bank.questions, sets
+
+
+def worker_counts(max_workers):
+    """1, 2, 4, ... up to max_workers (always including max_workers)."""
+    counts = []
+    n = 1
+    while n < max_workers:
+        counts.append(n)
+        n *= 2
+    counts.append(max_workers)
+    return counts
+
+
+def run(source_dir, repeat, max_workers):
+    set_count = len(discover_sets(source_dir))
+    serial_time, serial_bank = best_time(source_dir, 1, repeat)
+    expected = bank_signature(serial_bank)
+
+    print(f"{set_count} sets, {len(serial_bank)} questions, best of {repeat}\n")
+    print(f"{'Workers':>8} {'Time (ms)':>10} {'Speedup':>9} {'Same':>6}")
+    print("-" * 36)
+    print(f"{'serial':>8} {serial_time * 1000:>10.1f} {1.0:>8.2f}x {'yes':>6}")
+
+    for workers in worker_counts(max_workers):
+        if workers == 1:
+            continue
+        elapsed, bank = best_time(source_dir, workers, repeat)
+        same = "yes" if bank_signature(bank) == expected else "NO"
+        print(f"{workers:>8} {elapsed * 1000:>10.1f} {serial_time / elapsed:>8.2f}x {same:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark serial vs process-pool loading of the question bank")
+    parser.add_argument("--repeat", type=int, default=3, help="Loads per configuration; the best is reported (default: 3)")
+    parser.add_argument("--copies", type=int, default=1, help="Load the bank duplicated this many times (default: 1)")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1,
+                        help="Largest pool to try (default: CPU count)")
+    parser.add_argument("--source", default=str(DEFAULT_SOURCE_DIR), help="Directory containing setN.json files")
+    args = parser.parse_args()
+
+    print(f"CPU count: {os.cpu_count()}")
+    if args.copies <= 1:
+        run(Path(args.source), args.repeat, args.max_workers)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        make_scaled_copy(Path(args.source), args.copies, tmp)
+        run(Path(tmp), args.repeat, args.max_workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+bench_proxy.py
+Latency benchmark for run_server.py's /proxy path, with and without the
+keep-alive upstream pool.
+
+Starts stub_upstream.py in-process (with a simulated per-connection handshake
+and per-request processing time), serves run_server.CORSRequestHandler on a
+free port, and sends a classroom-sized burst of submitScore POSTs from
+concurrent clients. Reports p50/p99 latency, throughput and how many upstream
+connections were opened.
+
+With --poll it simulates every open tab polling getLeaderboard at once and
+reports how many upstream calls reach the stub with and without the proxy
+cache (hits, misses and coalesced waits come from the cache's counters).
+
+With --queue it sends one burst of more concurrent submitScore calls than
+the pool has connections, through both the threaded proxy and the asyncio
+pool, with a connect timeout far shorter than the time the last call waits
+for a connection. Every call must queue for a slot and succeed: the run
+fails (exit status 1) if any returns a 502 or raises PoolTimeout.
+
+With --leaderboard ROWS it instead fetches a large getLeaderboard response
+through the proxy and reports time to first byte and the peak Python memory
+allocated while the burst runs, which stays flat when responses are streamed.
+
+Usage:
+    python bench_proxy.py [--requests 400] [--concurrency 20] [--handshake 60] [--latency 20]
+    python bench_proxy.py --poll [--requests 400] [--concurrency 100]
+    python bench_proxy.py --queue [--pool-size 2] [--concurrency 16] [--latency 500]
+    python bench_proxy.py --leaderboard 50000 [--chunked] [--requests 40] [--concurrency 8]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import json
+import tracemalloc
+import argparse
+import threading
+import http.client
+import socketserver
+
+from proxy_cache import ProxyCache
+from run_server import CORSRequestHandler
+from stub_upstream import start_stub_upstream
+from upstream_pool import PoolTimeout, UpstreamPool
+
+# Connect timeout for --queue; waiting for a slot must not be bounded by it
+QUEUE_CONNECT_TIMEOUT = 1.0
+
+
+class QuietThreadingServer(socketserver.ThreadingTCPServer):
+    # Same settings as the server run_server.run() builds
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def start_proxy(upstream_pool, proxy_cache=None):
+    """Serve CORSRequestHandler with the given pool and cache on a free local port."""
+    class Handler(CORSRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    Handler.upstream_pool = upstream_pool
+    Handler.proxy_cache = proxy_cache
+    server = QuietThreadingServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_load(port, path, total, concurrency, body=None):
+    """
+    Send total requests from concurrency client threads.
+
+    Returns:
+        Tuple of (sorted latencies, sorted times to first byte, errors, seconds)
+    """
+    latencies = []
+    first_bytes = []
+    errors = []
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def worker():
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    return
+            start = time.perf_counter()
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                method = 'POST' if body is not None else 'GET'
+                conn.request(method, path, body=body, headers={'Content-Type': 'application/json'})
+                resp = conn.getresponse()
+                first_byte = time.perf_counter() - start
+                # Read in pieces so the client side does not hold whole bodies either
+                while resp.read(64 * 1024):
+                    pass
+                conn.close()
+                ok = resp.status == 200
+            except Exception as e:
+                ok = False
+                resp = e
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                    first_bytes.append(first_byte)
+                else:
+                    errors.append(resp)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sorted(latencies), sorted(first_bytes), errors, time.perf_counter() - start
+
+
+def run_submit_burst(upstream, args):
+    body = json.dumps({'email': 'candidate@example.com', 'score': 42, 'total': 50}).encode('utf-8')
+
+    print(f'{args.requests} submitScore POSTs, {args.concurrency} concurrent clients, '
+          f'upstream handshake {args.handshake:.0f} ms + processing {args.latency:.0f} ms\n')
+    print(f"{'Mode':<22} {'p50 (ms)':>9} {'p99 (ms)':>9} {'req/s':>8} {'upstream conns':>15} {'errors':>7}")
+    print('-' * 75)
+
+    modes = [('urlopen per request', None),
+             (f'pool ({args.pool_size}/host)', UpstreamPool(max_per_host=args.pool_size))]
+    for label, pool in modes:
+        proxy = start_proxy(pool)
+        before = upstream.connection_count
+        latencies, _, errors, seconds = run_load(proxy.server_address[1], '/proxy?action=submitScore',
+                                                 args.requests, args.concurrency, body)
+        opened = upstream.connection_count - before
+        proxy.shutdown()
+        proxy.server_close()
+        if pool:
+            pool.close()
+        print(f'{label:<22} {percentile(latencies, 50) * 1000:>9.1f} {percentile(latencies, 99) * 1000:>9.1f} '
+              f'{len(latencies) / seconds:>8.1f} {opened:>15} {len(errors):>7}')
+
+
+def run_poll_burst(upstream, args):
+    print(f'{args.requests} getLeaderboard polls from {args.concurrency} concurrent tabs, '
+          f'upstream processing {args.latency:.0f} ms\n')
+    print(f"{'Mode':<14} {'p50 (ms)':>9} {'p99 (ms)':>9} {'upstream calls':>15} {'hits':>6} "
+          f"{'misses':>7} {'coalesced':>10} {'errors':>7}")
+    print('-' * 84)
+
+    for label, cache in (('no cache', None), ('cache', ProxyCache(ttl=30))):
+        pool = UpstreamPool(max_per_host=args.pool_size)
+        proxy = start_proxy(pool, cache)
+        before = upstream.request_count
+        latencies, _, errors, _ = run_load(proxy.server_address[1], '/proxy?action=getLeaderboard',
+                                           args.requests, args.concurrency)
+        calls = upstream.request_count - before
+        proxy.shutdown()
+        proxy.server_close()
+        pool.close()
+        stats = cache.snapshot() if cache else {'hits': '-', 'misses': '-', 'coalesced': '-'}
+        print(f'{label:<14} {percentile(latencies, 50) * 1000:>9.1f} {percentile(latencies, 99) * 1000:>9.1f} '
+              f"{calls:>15} {stats['hits']:>6} {stats['misses']:>7} {stats['coalesced']:>10} {len(errors):>7}")
+
+
+def run_queue_burst(upstream, args):
+    from async_server import AsyncUpstreamPool
+
+    body = json.dumps({'email': 'candidate@example.com', 'score': 42, 'total': 50}).encode('utf-8')
+    waves = -(-args.concurrency // args.pool_size)
+    print(f'{args.concurrency} concurrent submitScore POSTs, {args.pool_size} upstream connections, '
+          f'upstream processing {args.latency:.0f} ms')
+    print(f'The last call queues about {(waves - 1) * args.latency / 1000:.1f} s for a connection; '
+          f'connect timeout {QUEUE_CONNECT_TIMEOUT:.0f} s\n')
+    print(f"{'Mode':<16} {'p50 (ms)':>9} {'max (ms)':>9} {'ok':>5} {'502':>5} {'other errors':>13}")
+    print('-' * 62)
+
+    pool = UpstreamPool(max_per_host=args.pool_size, connect_timeout=QUEUE_CONNECT_TIMEOUT)
+    proxy = start_proxy(pool)
+    latencies, _, errors, _ = run_load(proxy.server_address[1], '/proxy?action=submitScore',
+                                       args.concurrency, args.concurrency, body)
+    proxy.shutdown()
+    proxy.server_close()
+    pool.close()
+    bad_gateway = sum(1 for e in errors if getattr(e, 'status', None) == 502)
+    rows = [('threaded proxy', latencies, bad_gateway, len(errors) - bad_gateway)]
+
+    async def async_burst():
+        async_pool = AsyncUpstreamPool(max_per_host=args.pool_size, connect_timeout=QUEUE_CONNECT_TIMEOUT)
+
+        async def call():
+            start = time.perf_counter()
+            resp = await async_pool.request('POST', f'{upstream.url}?action=submitScore', body,
+                                            {'Content-Type': 'application/json'})
+            try:
+                await resp.read()
+            finally:
+                resp.close()
+            return resp.status, time.perf_counter() - start
+
+        results = await asyncio.gather(*(call() for _ in range(args.concurrency)), return_exceptions=True)
+        async_pool.close()
+        return results
+
+    results = asyncio.run(async_burst())
+    ok = sorted(r[1] for r in results if not isinstance(r, BaseException) and r[0] == 200)
+    timeouts = sum(1 for r in results if isinstance(r, PoolTimeout))
+    rows.append(('asyncio pool', ok, timeouts, len(results) - len(ok) - timeouts))
+
+    failed = 0
+    for label, times, refused, other in rows:
+        failed += refused + other
+        longest = times[-1] * 1000 if times else 0.0
+        print(f'{label:<16} {percentile(times, 50) * 1000:>9.1f} {longest:>9.1f} {len(times):>5} '
+              f'{refused:>5} {other:>13}')
+    if failed:
+        sys.exit(f'\n✗ {failed} call(s) failed instead of waiting for a free upstream connection')
+    print('\n✓ Every call waited for a free upstream connection')
+
+
+def run_leaderboard_burst(upstream, args):
+    size = len(upstream.leaderboard_body)
+    framing = 'chunked' if args.chunked else 'Content-Length'
+    print(f'{args.requests} getLeaderboard GETs of {size:,} bytes ({framing}), '
+          f'{args.concurrency} concurrent clients\n')
+    print(f"{'Mode':<22} {'TTFB p50':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} {'peak MB':>8} {'errors':>7}")
+    print('-' * 70)
+
+    pool = UpstreamPool(max_per_host=args.pool_size)
+    proxy = start_proxy(pool)
+    tracemalloc.start()
+    latencies, first_bytes, errors, _ = run_load(proxy.server_address[1], '/proxy?action=getLeaderboard',
+                                                 args.requests, args.concurrency)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    proxy.shutdown()
+    proxy.server_close()
+    pool.close()
+    print(f"{'pool, streamed':<22} {percentile(first_bytes, 50) * 1000:>9.1f} "
+          f'{percentile(latencies, 50) * 1000:>9.1f} {percentile(latencies, 99) * 1000:>9.1f} '
+          f'{peak / 1e6:>8.1f} {len(errors):>7}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark /proxy latency with and without upstream pooling')
+    parser.add_argument('--requests', type=int, default=400, help='Requests per mode (default: 400)')
+    parser.add_argument('--concurrency', type=int, default=20, help='Concurrent clients (default: 20)')
+    parser.add_argument('--handshake', type=float, default=60, help='Simulated upstream connection setup in ms (default: 60)')
+    parser.add_argument('--latency', type=float, default=20, help='Simulated upstream processing in ms (default: 20)')
+    parser.add_argument('--pool-size', type=int, default=8, help='Pooled connections per host (default: 8)')
+    parser.add_argument('--redirect', action='store_true', help='Make the stub redirect once per call, like Apps Script')
+    parser.add_argument('--leaderboard', type=int, default=0,
+                        help='Fetch a getLeaderboard of this many rows instead of posting scores')
+    parser.add_argument('--chunked', action='store_true', help='Make the stub send getLeaderboard chunked')
+    parser.add_argument('--poll', action='store_true', help='Poll getLeaderboard with and without the proxy cache')
+    parser.add_argument('--queue', action='store_true',
+                        help='Send more concurrent calls than pooled connections and fail if any is refused')
+    args = parser.parse_args()
+
+    upstream = start_stub_upstream(latency=args.latency / 1000, handshake=args.handshake / 1000,
+                                   redirect=args.redirect, leaderboard=args.leaderboard or 50,
+                                   chunked=args.chunked)
+    os.environ['APPSCRIPT_URL'] = upstream.url
+    if args.leaderboard:
+        run_leaderboard_burst(upstream, args)
+    elif args.poll:
+        run_poll_burst(upstream, args)
+    elif args.queue:
+        run_queue_burst(upstream, args)
+    else:
+        run_submit_burst(upstream, args)
+    upstream.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for replace_in_lines() in search.py
+
+Compares the precompiled single-pass engine against the previous
+find-and-slice loop on index.html and default-questions/set43.json, and on
+the same text joined into one long line (the worst case for the old loop,
+which re-lowercased the whole line after every substitution).
+
+Usage:
+    python bench_replace.py [--repeat 3] [--phrase the] [--replacement THE]
+"""
+
+import time
+import argparse
+from pathlib import Path
+
+from search import replace_in_lines, read_lines_preserving_newlines
+
+# Get the script directory
+SCRIPT_DIR = Path(__file__).parent.absolute()
+BENCH_FILES = ["index.html", "default-questions/set43.json"]
+
+
+def legacy_replace_in_lines(lines, phrase, replacement):
+    """The replacement loop search.py used before the compiled engine."""
+    replacements = 0
+    phrase_lower = phrase.lower()
+    for i, line in enumerate(lines, 1):
+        if phrase_lower in line.lower():
+            new_line = line
+            start = 0
+            while True:
+                pos = new_line.lower().find(phrase_lower, start)
+                if pos == -1:
+                    break
+                new_line = new_line[:pos] + replacement + new_line[pos + len(phrase):]
+                start = pos + len(replacement)
+                replacements += 1
+            lines[i - 1] = new_line
+    return replacements
+
+
+def best_time(func, lines, phrase, replacement, repeat):
+    """Run func on fresh copies of lines and return (best seconds, count, result)."""
+    best = None
+    count = 0
+    result = None
+    for _ in range(repeat):
+        work = list(lines)
+        start = time.perf_counter()
+        count = func(work, phrase, replacement)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+        result = work
+    return best, count, result
+
+
+def run_case(label, lines, phrase, replacement, repeat):
+    """Benchmark one input and print a result row."""
+    chars = sum(len(line) for line in lines)
+    old_time, old_count, old_result = best_time(legacy_replace_in_lines, lines, phrase, replacement, repeat)
+    new_time, new_count, new_result = best_time(replace_in_lines, lines, phrase, replacement, repeat)
+    same = "yes" if (old_count, old_result) == (new_count, new_result) else "NO"
+    speedup = old_time / new_time if new_time else float("inf")
+    print(f"{label:<34} {chars:>10,} {new_count:>7,} {old_time * 1000:>10.1f} "
+          f"{new_time * 1000:>10.1f} {speedup:>8.1f}x {same:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark case-insensitive replacement")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the best is reported (default: 3)")
+    parser.add_argument("--phrase", default="the", help="Phrase to replace (default: the)")
+    parser.add_argument("--replacement", default="THE", help="Replacement text (default: THE)")
+    args = parser.parse_args()
+
+    print(f"Replacing '{args.phrase}' -> '{args.replacement}' (best of {args.repeat})\n")
+    print(f"{'Input':<34} {'Chars':>10} {'Hits':>7} {'Old (ms)':>10} {'New (ms)':>10} "
+          f"{'Speedup':>9} {'Same':>6}")
+    print("-" * 92)
+
+    for rel_path in BENCH_FILES:
+        path = SCRIPT_DIR / rel_path
+        if not path.exists():
+            print(f"{rel_path:<34} (missing)")
+            continue
+        lines = read_lines_preserving_newlines(path)
+        run_case(rel_path, lines, args.phrase, args.replacement, args.repeat)
+
+        # One long "minified" line, at growing sizes, shows how each engine
+        # scales. Only fractions of the file are used: the old loop is quadratic.
+        joined = "".join(line.rstrip("\r\n") for line in lines)
+        for fraction in (16, 8, 4):
+            chunk = joined[:len(joined) // fraction]
+            run_case(f"  single line, 1/{fraction} of file", [chunk], args.phrase, args.replacement, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+bench_static.py
+Server CPU cost of static GETs in run_server.py, with and without the
+in-memory static cache and sendfile().
+
+Copies index.html and the question sets to a temporary directory, writes
+their .gz siblings there, and serves that directory from a run_server.py
+process. An asyncio client then replays a room loading the app: index.html
+followed by the question sets, with half of the clients accepting gzip. For
+each mode the benchmark reports throughput, p50/p99 latency and the server
+process's CPU time per 1000 requests (read from /proc, so Linux only), as
+the median of --repeat runs.
+
+Modes:
+  disk       --static-cache-mb 0 --no-sendfile: open, read and copy every body
+  sendfile   --static-cache-mb 0: open every file and send it with sendfile()
+  cache      the default: bodies from memory, revalidated with one stat()
+
+Usage:
+    python bench_static.py [--requests 3000] [--concurrency 50] [--repeat 3] [--async]
+"""
+
+import os
+import glob
+import shutil
+import statistics
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+
+from bench_async import HERE, free_port, run_load, start_process, wait_for_port
+from bench_proxy import percentile
+from static_assets import precompress_tree
+
+MODES = [
+    ('disk', ['--static-cache-mb', '0', '--no-sendfile']),
+    ('sendfile', ['--static-cache-mb', '0']),
+    ('cache', []),
+]
+
+
+def cpu_seconds(pid):
+    """User plus system CPU time of a process, from /proc/<pid>/stat."""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+    # utime and stime are fields 14 and 15; the split above starts at field 3
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def prepare_site(directory):
+    """Copy the app shell and question sets into directory and precompress them; returns the URL paths."""
+    shutil.copy(os.path.join(HERE, 'index.html'), directory)
+    sets_dir = os.path.join(directory, 'default-questions')
+    os.makedirs(sets_dir)
+    for path in glob.glob(os.path.join(HERE, 'default-questions', '*.json')):
+        shutil.copy(path, sets_dir)
+    precompress_tree(directory)
+    paths = ['/index.html'] + [f'/default-questions/{name}' for name in sorted(os.listdir(sets_dir))
+                               if name.endswith('.json')]
+    return paths
+
+
+def build_requests(paths):
+    requests = []
+    for i, path in enumerate(paths):
+        for gzip_ok in (False, True):
+            accept = b'Accept-Encoding: gzip, deflate\r\n' if gzip_ok else b''
+            requests.append(b'GET %s HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n%s\r\n'
+                            % (path.encode('ascii'), accept))
+        if i == 0:
+            # The app shell is requested by everyone, the sets are spread out
+            requests *= 4
+    return requests
+
+
+def bench_mode(flags, site, requests, args):
+    """
+    Run one load against a fresh server.
+
+    Returns:
+        Tuple of (req/s, p50, p99, CPU seconds per request or None, errors), or None if the server did not start
+    """
+    port = free_port()
+    command = ['run_server.py', '--no-open', '--port', str(port), '--dir', site] + flags
+    if args.use_async:
+        command.append('--async')
+    server = start_process(command, dict(os.environ, PROXY_DISABLED='1'))
+    try:
+        if not wait_for_port(port):
+            return None
+        # Warm up: imports, page cache and (where enabled) the in-memory cache
+        asyncio.run(run_load(port, requests, len(requests), 10))
+        before = cpu_seconds(server.pid)
+        latencies, errors, seconds = asyncio.run(run_load(port, requests, args.requests, args.concurrency))
+        after = cpu_seconds(server.pid)
+        cpu = (after - before) / args.requests if before is not None else None
+        return (len(latencies) / seconds, percentile(latencies, 50), percentile(latencies, 99),
+                cpu, len(errors))
+    finally:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/__run_local_shutdown__', timeout=2)
+        except Exception:
+            pass
+        try:
+            server.wait(timeout=3)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure server CPU per static request with and without the static cache')
+    parser.add_argument('--requests', type=int, default=3000, help='Requests per mode (default: 3000)')
+    parser.add_argument('--concurrency', type=int, default=50, help='Requests kept in flight (default: 50)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per mode; the median is reported (default: 3)')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='Benchmark the asyncio server instead')
+    args = parser.parse_args()
+
+    site = tempfile.mkdtemp(prefix='bench_static_')
+    try:
+        paths = prepare_site(site)
+        requests = build_requests(paths)
+        engine = 'asyncio' if args.use_async else 'threaded'
+        print(f'{args.requests} GETs ({engine} server): index.html and {len(paths) - 1} question sets, '
+              f'half with Accept-Encoding: gzip, {args.concurrency} in flight\n')
+        print(f"{'Mode':<10} {'req/s':>8} {'p50 (ms)':>9} {'p99 (ms)':>9} {'CPU ms / 1000 req':>17} {'errors':>7}")
+        print('-' * 64)
+        results = {label: [] for label, _ in MODES}
+        # Modes take turns so drift on a busy machine hits them all alike
+        for _ in range(args.repeat):
+            for label, flags in MODES:
+                result = bench_mode(flags, site, requests, args)
+                if result is not None:
+                    results[label].append(result)
+        for label, _ in MODES:
+            runs = results[label]
+            if not runs:
+                print(f'{label:<10} server did not start')
+                continue
+            rate, p50, p99, cpu, errors = (statistics.median(column) if None not in column else None
+                                           for column in zip(*runs))
+            cpu = f'{cpu * 1000 * 1000:.0f}' if cpu is not None else '-'
+            print(f'{label:<10} {rate:>8.1f} {p50 * 1000:>9.1f} {p99 * 1000:>9.1f} {cpu:>17} {errors:>7.0f}')
+    finally:
+        shutil.rmtree(site, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Question Bank Compiler for GES Promotion Quiz Application
+
+Validates, deduplicates and numbers every question set in default-questions/
+and writes one content-hashed bundle plus a small manifest into bank/.
+The web app reads bank/manifest.json and then the bundle it names, instead of
+probing set1.json through set80.json one request at a time.
+
+Usage:
+    python build_bank.py [--source default-questions] [--out bank] [--verbose] [--workers N]
+                         [--keep-versions N]
+
+Output:
+    bank/manifest.json          - small, always revalidated by the client
+    bank/questions.<hash>.json  - immutable bundle, safe to cache forever
+    bank/questions.<hash>.bin   - the same questions in the compact columnar
+                                  encoding (see columnar_bank.py); only written
+                                  when it is smaller than the JSON bundle once
+                                  both are gzipped
+    bank/sources.<hash>.json    - sidecar with the source file, index, line and
+                                  hash of every question, so the browser never
+                                  has to scan raw JSON text to locate them
+    bank/patch.<hash>.json      - delta from an earlier version to this one (see
+                                  build_patch()); the manifest maps each earlier
+                                  version to its patch
+    bank/history.json           - question hashes of the last few versions,
+                                  which the next build diffs against (not
+                                  published by build_site.py)
+
+Delta updates: a browser that cached an earlier bank fetches only the patch
+from its version, not every question again. Each build writes one patch per
+version in history.json straight to the new version, so the chain between
+consecutive versions is always compacted into a single hop. Only the last
+--keep-versions versions are kept; older browsers download the whole bundle.
+"""
+
+import sys
+import json
+import difflib
+import hashlib
+import argparse
+from pathlib import Path
+
+from columnar_bank import encode_questions
+from question_bank import (
+    DEFAULT_SOURCE_DIR,
+    SCRIPT_DIR,
+    load_bank,
+    question_digest,
+    question_hash,
+)
+from static_assets import compress
+
+DEFAULT_OUTPUT_DIR = SCRIPT_DIR / "bank"
+
+MANIFEST_NAME = "manifest.json"
+BUNDLE_PREFIX = "questions."
+SOURCES_PREFIX = "sources."
+PATCH_PREFIX = "patch."
+HISTORY_NAME = "history.json"
+BANK_FORMAT = 1
+HASH_LENGTH = 12
+# Earlier versions a build writes patches from
+DEFAULT_KEEP_VERSIONS = 5
+
+
+def compile_bank(source_dir, base_dir=None, workers=1):
+    """
+    Load, validate and deduplicate every set into a single numbered bank.
+
+    Args:
+        source_dir: Directory containing the JSON question sets
+        base_dir: Directory that set paths are reported relative to
+                  (defaults to the parent of source_dir)
+        workers: Parse sets in this many processes (0 = one per CPU)
+
+    Returns:
+        Dictionary with 'questions' (numbered list), 'sources' (one
+        (file, index, line, digest) tuple per question) and 'sets'
+        (per-file report)
+    """
+    loaded = load_bank(source_dir, base_dir, workers)
+    questions = []
+    sources = []
+    sets = []
+    seen_hashes = set()
+
+    for loaded_set in loaded.sets:
+        report = {
+            "file": loaded_set["file"],
+            "start": len(questions),
+            "count": 0,
+            "invalid": loaded_set["non_objects"],
+            "duplicates": 0,
+            "error": loaded_set["error"],
+        }
+
+        for q in loaded.set_questions(loaded_set):
+            if not q.is_valid():
+                report["invalid"] += 1
+                continue
+            q_hash = question_hash(q)
+            if q_hash in seen_hashes:
+                report["duplicates"] += 1
+                continue
+            seen_hashes.add(q_hash)
+            questions.append({"id": len(questions) + 1, **q.core()})
+            sources.append((q.file, q.index, q.line, question_digest(q, q_hash)))
+            report["count"] += 1
+
+        sets.append(report)
+
+    return {"questions": questions, "sources": sources, "sets": sets}
+
+
+def content_hash(data):
+    """Return the short content hash used in bundle file names."""
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def build_sources(bank, version):
+    """
+    Build the source sidecar as parallel columns, one entry per question.
+
+    Args:
+        bank: Result of compile_bank()
+        version: Version of the bundle the sidecar describes
+
+    Returns:
+        Dictionary ready to be serialized
+    """
+    files = []
+    file_ids = {}
+    columns = {"file": [], "index": [], "line": [], "hash": []}
+    for rel_path, index, line, digest in bank["sources"]:
+        if rel_path not in file_ids:
+            file_ids[rel_path] = len(files)
+            files.append(rel_path)
+        columns["file"].append(file_ids[rel_path])
+        columns["index"].append(index)
+        columns["line"].append(line)
+        columns["hash"].append(digest)
+    return {"format": BANK_FORMAT, "version": version, "files": files, **columns}
+
+
+def load_history(out_dir):
+    """
+    Read the question hashes of earlier versions, oldest first.
+
+    A missing or unreadable history only means no patches are written.
+    """
+    try:
+        with open(Path(out_dir) / HISTORY_NAME, encoding="utf-8") as f:
+            history = json.load(f)
+    except (OSError, ValueError):
+        return []
+    if not isinstance(history, dict) or history.get("format") != BANK_FORMAT:
+        return []
+    return [v for v in history.get("versions", [])
+            if isinstance(v, dict) and "version" in v and isinstance(v.get("hashes"), list)]
+
+
+def build_patch(previous, bank, version):
+    """
+    Build the delta that turns an earlier version of the bank into this one.
+
+    'ops' rebuilds the new question list in order: {"copy": [start, count]}
+    takes a run of the earlier list, {"insert": [...]} adds new questions.
+    Ids are not stored, since the bank numbers questions by position.
+    'added', 'removed' and 'changed' ([old, new] pairs of questions edited in
+    place) list question hashes for reporting.
+
+    Args:
+        previous: Entry of load_history() for the earlier version
+        bank: Result of compile_bank()
+        version: Version of the bundle being written
+
+    Returns:
+        Dictionary ready to be serialized
+    """
+    old = previous["hashes"]
+    new = [digest for _, _, _, digest in bank["sources"]]
+    old_set = set(old)
+    new_set = set(new)
+
+    ops = []
+    changed = []
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append({"copy": [i1, i2 - i1]})
+            continue
+        if tag == "replace":
+            changed += [[o, n] for o, n in zip(old[i1:i2], new[j1:j2])
+                        if o not in new_set and n not in old_set]
+        if j2 > j1:
+            inserted = [{k: v for k, v in q.items() if k != "id"} for q in bank["questions"][j1:j2]]
+            ops.append({"insert": inserted})
+
+    edited = {n for _, n in changed} | {o for o, _ in changed}
+    return {
+        "format": BANK_FORMAT,
+        "from": previous["version"],
+        "to": version,
+        "count": len(new),
+        "added": [h for h in new if h not in old_set and h not in edited],
+        "removed": [h for h in old if h not in new_set and h not in edited],
+        "changed": changed,
+        "ops": ops,
+    }
+
+
+def write_bank(bank, out_dir, keep_versions=DEFAULT_KEEP_VERSIONS):
+    """
+    Write the bundle, sidecar, patches and manifest, removing files from
+    earlier builds.
+
+    Args:
+        bank: Result of compile_bank()
+        out_dir: Output directory (created if missing)
+        keep_versions: Earlier versions to write patches from (0 for none)
+
+    Returns:
+        The manifest dictionary that was written
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    bundle_bytes = json.dumps(
+        bank["questions"], ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+    version = content_hash(bundle_bytes)
+    bundle_name = f"{BUNDLE_PREFIX}{version}.json"
+
+    sources_bytes = json.dumps(
+        build_sources(bank, version), ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+    sources_name = f"{SOURCES_PREFIX}{content_hash(sources_bytes)}.json"
+
+    # Both bundles travel gzipped, so the columnar one is only published when
+    # it is the smaller download; the client falls back to the JSON bundle.
+    bundle_gzip = len(compress(bundle_bytes, "gzip"))
+    binary_bytes = encode_questions(bank["questions"])
+    binary_gzip = len(compress(binary_bytes, "gzip"))
+    binary = {}
+    if binary_gzip < bundle_gzip:
+        binary = {
+            "binary": f"{BUNDLE_PREFIX}{content_hash(binary_bytes)}.bin",
+            "binaryBytes": len(binary_bytes),
+            "binaryGzipBytes": binary_gzip,
+        }
+    else:
+        print(f"Warning: columnar bundle is {binary_gzip:,} bytes gzipped, not smaller than "
+              f"the JSON bundle ({bundle_gzip:,}); publishing the JSON bundle only")
+    download_bytes = binary.get("binaryBytes", len(bundle_bytes))
+
+    # A patch that is not smaller than the whole bundle is not worth fetching
+    history = [v for v in load_history(out_dir) if v["version"] != version]
+    history = history[-keep_versions:] if keep_versions > 0 else []
+    patches = {}
+    patch_outputs = []
+    for previous in history:
+        patch_bytes = json.dumps(
+            build_patch(previous, bank, version), ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+        if len(patch_bytes) < download_bytes:
+            patch_name = f"{PATCH_PREFIX}{content_hash(patch_bytes)}.json"
+            patches[previous["version"]] = {"file": patch_name, "bytes": len(patch_bytes)}
+            patch_outputs.append((patch_name, patch_bytes))
+
+    manifest = {
+        "format": BANK_FORMAT,
+        "version": version,
+        "count": len(bank["questions"]),
+        "bundle": bundle_name,
+        "bytes": len(bundle_bytes),
+        "gzipBytes": bundle_gzip,
+        **binary,
+        "sources": sources_name,
+        "patches": patches,
+        "sets": [
+            {"file": s["file"], "start": s["start"], "count": s["count"]}
+            for s in bank["sets"]
+            if s["count"] > 0
+        ],
+    }
+
+    outputs = [(bundle_name, bundle_bytes), (sources_name, sources_bytes)]
+    if binary:
+        outputs.append((binary["binary"], binary_bytes))
+    outputs += patch_outputs
+    for name, data in outputs:
+        path = out_dir / name
+        if not path.exists():
+            path.write_bytes(data)
+
+    # Manifest is written last so a client never sees a manifest that points
+    # at a bundle which is not on disk yet.
+    manifest_path = out_dir / MANIFEST_NAME
+    tmp_path = manifest_path.with_suffix(".json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    tmp_path.replace(manifest_path)
+
+    versions = history + [{"version": version, "hashes": [digest for _, _, _, digest in bank["sources"]]}]
+    history_path = out_dir / HISTORY_NAME
+    tmp_path = history_path.with_suffix(".json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"format": BANK_FORMAT, "versions": versions}, f, separators=(",", ":"))
+        f.write("\n")
+    tmp_path.replace(history_path)
+
+    current = {name for name, _ in outputs}
+    for pattern in (f"{BUNDLE_PREFIX}*.json", f"{BUNDLE_PREFIX}*.bin", f"{SOURCES_PREFIX}*.json",
+                    f"{PATCH_PREFIX}*.json"):
+        for stale in out_dir.glob(pattern):
+            if stale.name not in current:
+                stale.unlink()
+
+    return manifest
+
+
+def print_report(bank, manifest, verbose=False):
+    """Print a per-set summary of the build."""
+    total_invalid = 0
+    total_duplicates = 0
+    errors = []
+
+    for s in bank["sets"]:
+        total_invalid += s["invalid"]
+        total_duplicates += s["duplicates"]
+        if s["error"]:
+            errors.append(s)
+        if verbose or s["error"] or s["invalid"]:
+            status = f"ERROR: {s['error']}" if s["error"] else "ok"
+            print(f"  {s['file']:<32} {s['count']:>5} kept  {s['duplicates']:>4} dup  "
+                  f"{s['invalid']:>3} invalid  {status}")
+
+    print("\n" + "=" * 70)
+    print(f"Sets scanned:        {len(bank['sets'])}")
+    print(f"Questions kept:      {manifest['count']}")
+    print(f"Duplicates removed:  {total_duplicates}")
+    print(f"Invalid items:       {total_invalid}")
+    print(f"Sets with errors:    {len(errors)}")
+    print(f"Bundle:              {manifest['bundle']} ({manifest['bytes']:,} bytes, "
+          f"{manifest['gzipBytes']:,} gzipped)")
+    if "binary" in manifest:
+        print(f"Columnar bundle:     {manifest['binary']} ({manifest['binaryBytes']:,} bytes, "
+              f"{manifest['binaryGzipBytes']:,} gzipped)")
+    else:
+        print("Columnar bundle:     not published (not smaller than the JSON bundle gzipped)")
+    for old_version, patch in manifest["patches"].items():
+        print(f"Patch from {old_version}: {patch['file']} ({patch['bytes']:,} bytes)")
+    print("=" * 70)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compile default-questions/ into a single content-hashed bundle"
+    )
+    parser.add_argument(
+        "--source",
+        default=str(DEFAULT_SOURCE_DIR),
+        help="Directory containing setN.json files (default: default-questions)"
+    )
+    parser.add_argument(
+        "--out",
+        default=str(DEFAULT_OUTPUT_DIR),
+        help="Output directory for the bundle and manifest (default: bank)"
+    )
+    parser.add_argument(
+        "--verbose",
+        "-v",
+        action="store_true",
+        help="Print a line for every set, not just those with problems"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Parse sets in N processes, 0 for one per CPU (default: 1)"
+    )
+    parser.add_argument(
+        "--keep-versions",
+        type=int,
+        default=DEFAULT_KEEP_VERSIONS,
+        help=f"Write delta patches from the last N versions, 0 for none (default: {DEFAULT_KEEP_VERSIONS})"
+    )
+
+    args = parser.parse_args()
+
+    source_dir = Path(args.source)
+    if not source_dir.is_dir():
+        print(f"Directory not found: {source_dir}")
+        sys.exit(1)
+
+    bank = compile_bank(source_dir, workers=args.workers)
+    if not bank["questions"]:
+        print("No valid questions found. Nothing written.")
+        sys.exit(1)
+
+    manifest = write_bank(bank, args.out, keep_versions=args.keep_versions)
+    print_report(bank, manifest, verbose=args.verbose)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+"""
+Site Builder for GES Promotion Quiz Application
+
+Builds the optimized copy of the web app that GitHub Pages serves into
+docs/, because Pages can publish a branch's /docs folder. The authored files
+stay as they are. docs/ is generated and is rewritten on every build.
+
+  - index.html: HTML comments and indentation are removed. The inline
+    <script> and <style> blocks lose their comments and whitespace.
+    Script line breaks are kept wherever automatic semicolon insertion could
+    depend on them. String, template and regex literals are copied untouched.
+  - JSON: bank/manifest.json is written without indentation. The bank
+    bundles are already compact and content-hashed, so they are copied as-is.
+  - Fingerprints: the bank manifest is also written as manifest.<hash>.json.
+    index.html is rewritten to load that name, so every question asset the
+    page fetches can be cached forever.
+  - Offline: sw.js and its versioned precache manifest are generated by
+    service_worker.py. They cover index.html, the bank manifest and the
+    sources sidecar. The questions themselves are kept by the page, which
+    updates them with the bank's delta patches. index.html registers the
+    worker. bank/history.json is a build input and is not published.
+  - Compression: every compressible file gets a .gz sibling, plus a .br one
+    when the brotli package is installed. These are for servers that send
+    them directly, such as `python run_server.py --dir docs`.
+
+The question sets in default-questions/ are copied byte for byte. The page
+only reads them when the bank is missing, and it reports questions by their
+line number in those files.
+
+Usage:
+    python build_site.py [--out docs] [--no-compress] [--verbose]
+"""
+
+import os
+import re
+import sys
+import json
+import shutil
+import argparse
+from pathlib import Path
+
+from build_bank import HISTORY_NAME, MANIFEST_NAME, content_hash
+from question_bank import SCRIPT_DIR
+from service_worker import WORKER_NAME, build_service_worker
+from static_assets import ENCODINGS, MIN_COMPRESS_BYTES, is_compressible, is_variant, precompress_file
+
+DEFAULT_SITE_DIR = SCRIPT_DIR / "docs"
+PAGE_NAME = "index.html"
+BANK_DIR = "bank"
+SETS_DIR = "default-questions"
+
+JS_WHITESPACE = " \t\r\n\f\v\u00a0\ufeff\u2028\u2029"
+# Line terminators: a break in any of these can end a statement
+JS_NEWLINES = "\r\n\u2028\u2029"
+# A '/' after one of these starts a regular expression literal, not a division
+REGEX_PRECEDERS = set("(,=:[!&|?{};+-*%<>~^")
+REGEX_KEYWORDS = {"return", "typeof", "instanceof", "in", "of", "new", "delete",
+                  "void", "throw", "case", "do", "else", "yield", "await"}
+# A line break after OPENERS or before CLOSERS never changes where a statement ends
+OPENERS = set("{([,;:=")
+CLOSERS = set(")]},;.")
+
+# Comments, then the raw-text elements whose bodies are minified separately or kept
+HTML_BLOCK = re.compile(
+    r"<!--.*?-->|<(script|style|pre|textarea)\b((?:[^>\"']|\"[^\"]*\"|'[^']*')*)>(.*?)</\1\s*>",
+    re.IGNORECASE | re.DOTALL,
+)
+HTML_TAG = re.compile(r"<(/?)([A-Za-z][\w-]*|!)(?:[^>\"']|\"[^\"]*\"|'[^']*')*>")
+TAG_PART = re.compile(r"\"[^\"]*\"|'[^']*'|\s+")
+TYPE_ATTR = re.compile(r"\btype\s*=\s*[\"']?([^\"'\s>]*)", re.IGNORECASE)
+CSS_TOKEN = re.compile(r"\"(?:[^\"\\\n]|\\.)*\"|'(?:[^'\\\n]|\\.)*'|/\*.*?\*/", re.DOTALL)
+JS_TYPES = {"", "text/javascript", "application/javascript", "module"}
+# Whitespace next to these tags never renders, so it can go entirely
+BLOCK_TAGS = {
+    "!", "html", "head", "body", "title", "meta", "link", "script", "style", "div", "section",
+    "header", "footer", "main", "nav", "aside", "article", "form", "fieldset", "p", "ul", "ol",
+    "li", "dl", "dt", "dd", "table", "thead", "tbody", "tfoot", "tr", "td", "th", "h1", "h2",
+    "h3", "h4", "h5", "h6", "hr", "br", "option", "select", "noscript", "template",
+}
+
+
+def _is_word(ch):
+    return bool(ch) and (ch.isalnum() or ch in "_$\\" or ord(ch) > 127)
+
+
+def _needs_space(before, after):
+    """Whether two tokens separated by spaces would merge into something else without them."""
+    if _is_word(before) and _is_word(after):
+        return True
+    # a - -b, a + +b, a / /re/, 1 .toFixed()
+    return before + after in ("++", "--", "//") or (before.isdigit() and after == ".")
+
+
+def minify_js(source):
+    """
+    Strip comments and redundant whitespace from a script.
+
+    Args:
+        source: JavaScript source text
+
+    Returns:
+        The equivalent, shorter script
+    """
+    out = []
+    i, n = 0, len(source)
+    prev_token = ""     # last word or punctuator emitted, to tell regexes from divisions
+    pending = ""        # collapsed whitespace before the next token: "", " " or "\n"
+    templates = []      # one brace depth per open template ${ substitution
+
+    def emit(text, token):
+        nonlocal pending, prev_token
+        if pending and out:
+            before, after = out[-1][-1], text[0]
+            if pending == "\n" and before not in OPENERS and after not in CLOSERS:
+                out.append("\n")
+            elif _needs_space(before, after):
+                out.append(" ")
+        pending = ""
+        out.append(text)
+        prev_token = token
+
+    def template(start, j):
+        """Emit template text from start up to its closing backtick or next ${."""
+        while j < n:
+            c = source[j]
+            if c == "\\":
+                j += 2
+            elif c == "`":
+                emit(source[start:j + 1], "`")
+                return j + 1
+            elif source.startswith("${", j):
+                emit(source[start:j + 2], "{")
+                templates.append(0)
+                return j + 2
+            else:
+                j += 1
+        emit(source[start:], "`")
+        return n
+
+    while i < n:
+        c = source[i]
+        if c in JS_WHITESPACE:
+            j = i
+            while j < n and source[j] in JS_WHITESPACE:
+                j += 1
+            if pending != "\n":
+                pending = "\n" if any(ch in JS_NEWLINES for ch in source[i:j]) else " "
+            i = j
+        elif source.startswith("//", i):
+            j = source.find("\n", i)
+            i = n if j == -1 else j
+        elif source.startswith("/*", i):
+            j = source.find("*/", i + 2)
+            j = n if j == -1 else j + 2
+            if pending != "\n":
+                pending = "\n" if "\n" in source[i:j] else " "
+            i = j
+        elif c in "'\"":
+            j = i + 1
+            while j < n and source[j] not in (c, "\n"):
+                j += 2 if source[j] == "\\" else 1
+            emit(source[i:j + 1], "'")
+            i = j + 1
+        elif c == "`":
+            i = template(i, i + 1)
+        elif templates and c == "}" and templates[-1] == 0:
+            templates.pop()
+            i = template(i, i + 1)
+        elif c == "/" and (not prev_token or prev_token in REGEX_PRECEDERS or prev_token in REGEX_KEYWORDS):
+            j = i + 1
+            in_class = False
+            while j < n and source[j] != "\n":
+                ch = source[j]
+                if ch == "\\":
+                    j += 1
+                elif ch == "[":
+                    in_class = True
+                elif ch == "]":
+                    in_class = False
+                elif ch == "/" and not in_class:
+                    break
+                j += 1
+            j += 1
+            while j < n and _is_word(source[j]):
+                j += 1
+            emit(source[i:j], "/re/")
+            i = j
+        elif _is_word(c):
+            j = i + 1
+            while j < n and (_is_word(source[j]) or (source[j] == "." and source[i].isdigit())):
+                j += 1
+            emit(source[i:j], source[i:j])
+            i = j
+        else:
+            if templates and c == "{":
+                templates[-1] += 1
+            elif templates and c == "}":
+                templates[-1] -= 1
+            emit(c, c)
+            i += 1
+    return "".join(out)
+
+
+def minify_css(source):
+    """Strip comments and redundant whitespace from a stylesheet, leaving strings alone."""
+    out = []
+    pos = 0
+
+    def squeeze(text):
+        text = re.sub(r"\s+", " ", text)
+        return re.sub(r" ?([{};,>]) ?", r"\1", text)
+
+    plain = []
+    for m in CSS_TOKEN.finditer(source):
+        plain.append(source[pos:m.start()])
+        if m.group(0).startswith("/*"):
+            plain.append(" ")
+        else:
+            out.append(squeeze("".join(plain)))
+            out.append(m.group(0))
+            plain = []
+        pos = m.end()
+    plain.append(source[pos:])
+    out.append(squeeze("".join(plain)))
+    return "".join(out).strip()
+
+
+def _minify_tag(tag):
+    """Collapse the whitespace between a tag's attributes, leaving quoted values alone."""
+    tag = TAG_PART.sub(lambda m: m.group(0) if m.group(0)[0] in "\"'" else " ", tag)
+    return re.sub(r" (/?>)$", r"\1", tag)
+
+
+def _minify_markup(markup, block_before, block_after):
+    """
+    Minify HTML that holds no comments or raw-text elements.
+
+    Args:
+        markup: The HTML
+        block_before / block_after: Whether the markup is next to a block-level
+            tag on that side, so whitespace at that edge can be dropped
+    """
+    out = []
+    pos = 0
+    after_block = block_before
+    for m in HTML_TAG.finditer(markup):
+        text = markup[pos:m.start()]
+        is_block = m.group(2).lower() in BLOCK_TAGS
+        if text.strip():
+            out.append(re.sub(r"\s+", " ", text))
+        elif text and not (after_block or is_block):
+            out.append(" ")
+        out.append(_minify_tag(m.group(0)))
+        after_block = is_block
+        pos = m.end()
+    text = markup[pos:]
+    if text.strip():
+        out.append(re.sub(r"\s+", " ", text))
+    elif text and not (after_block or block_after):
+        out.append(" ")
+    return "".join(out)
+
+
+def minify_html(html):
+    """
+    Minify a page, including its inline scripts and styles.
+
+    Conditional comments (<!--[if ...]>) are kept. <pre> and <textarea>
+    bodies, and scripts of types other than JavaScript, are copied verbatim.
+    """
+    out = []
+    pos = 0
+    prev_block = True
+    for m in HTML_BLOCK.finditer(html):
+        tag = m.group(1)
+        is_block = tag is None or tag.lower() in ("script", "style")
+        out.append(_minify_markup(html[pos:m.start()], prev_block, is_block))
+        if tag is None:
+            if m.group(0).startswith("<!--[if"):
+                out.append(m.group(0))
+        else:
+            attrs, body = m.group(2), m.group(3)
+            kind = tag.lower()
+            script_type = TYPE_ATTR.search(attrs)
+            if kind == "script" and (script_type.group(1).lower() if script_type else "") in JS_TYPES:
+                body = minify_js(body)
+            elif kind == "style":
+                body = minify_css(body)
+            out.append(f"{_minify_tag(f'<{tag}{attrs}>')}{body}</{tag}>")
+        prev_block = is_block
+        pos = m.end()
+    out.append(_minify_markup(html[pos:], prev_block, True))
+    return "".join(out)
+
+
+def minify_json(data):
+    """Re-serialize JSON bytes without insignificant whitespace."""
+    return json.dumps(json.loads(data), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def rewrite_references(html, renames):
+    """
+    Point the page at fingerprinted file names.
+
+    Args:
+        html: Page source
+        renames: Dictionary of file name -> fingerprinted file name
+
+    Returns:
+        Tuple of (rewritten page, names that had no reference in it). A
+        reference is the name after a '/' and before a closing quote,
+        backtick, '?' or '#'.
+    """
+    missing = []
+    for name, hashed in renames.items():
+        html, count = re.subn(rf"(?<=/){re.escape(name)}(?=[`'\"?#])", hashed, html)
+        if not count:
+            missing.append(name)
+    return html, missing
+
+
+def _is_variant(path):
+    return path.name.endswith(".tmp") or is_variant(path.name)
+
+
+def collect_site(root):
+    """
+    Work out the content of the site.
+
+    Args:
+        root: Project directory
+
+    Returns:
+        Tuple of (dictionary of site path -> (source path or None for
+        generated files, bytes to write or None to copy the source), list of
+        warnings)
+    """
+    root = Path(root)
+    files = {}
+    renames = {}
+    warnings = []
+    # The manifest and sources sidecar the page loads. The question bundle is
+    # left out: the page caches it itself and applies patches to it, where a
+    # precached copy would be downloaded in full on every deploy.
+    precache = []
+
+    bank_dir = root / BANK_DIR
+    if bank_dir.is_dir():
+        for path in sorted(bank_dir.iterdir()):
+            if not path.is_file() or _is_variant(path) or path.name == HISTORY_NAME:
+                continue
+            if path.name == MANIFEST_NAME:
+                data = minify_json(path.read_bytes())
+                hashed = f"{Path(MANIFEST_NAME).stem}.{content_hash(data)}.json"
+                files[f"{BANK_DIR}/{MANIFEST_NAME}"] = (path, data)
+                files[f"{BANK_DIR}/{hashed}"] = (path, data)
+                renames[MANIFEST_NAME] = hashed
+                manifest = json.loads(data)
+                precache.append(f"{BANK_DIR}/{hashed}")
+                if manifest.get("sources"):
+                    precache.append(f"{BANK_DIR}/{manifest['sources']}")
+            else:
+                files[f"{BANK_DIR}/{path.name}"] = (path, None)
+    else:
+        warnings.append(f"{BANK_DIR}/ not found; the site will load the individual question sets")
+
+    sets_dir = root / SETS_DIR
+    if sets_dir.is_dir():
+        for path in sorted(sets_dir.rglob("*")):
+            if path.is_file() and not _is_variant(path):
+                files[path.relative_to(root).as_posix()] = (path, None)
+
+    page = root / PAGE_NAME
+    html = minify_html(page.read_text(encoding="utf-8"))
+    html, missing = rewrite_references(html, renames)
+    warnings += [f"{PAGE_NAME} has no reference to {name}; left unfingerprinted" for name in missing]
+    files[PAGE_NAME] = (page, html.encode("utf-8"))
+
+    entries = [(PAGE_NAME, files[PAGE_NAME][1])]
+    for rel in precache:
+        if rel in files:
+            source, data = files[rel]
+            entries.append((rel, data if data is not None else source.read_bytes()))
+        else:
+            warnings.append(f"{rel} is named by the bank manifest but missing; not precached")
+    for rel, data in build_service_worker(entries).items():
+        if rel == WORKER_NAME:
+            data = minify_js(data.decode("utf-8")).encode("utf-8")
+        files[rel] = (None, data)
+    return files, warnings
+
+
+def build_site(root, out_dir, compress=True):
+    """
+    Write the optimized site, leaving unchanged files (and their compressed
+    siblings) untouched and removing anything a previous build left behind.
+
+    Args:
+        root: Project directory
+        out_dir: Site directory, owned entirely by this build
+        compress: Write .gz/.br siblings
+
+    Returns:
+        Dictionary with 'files' (one {'file', 'source', 'built', 'gzip', 'br'}
+        row per site file), 'removed' (stale files deleted) and 'warnings'
+    """
+    out_dir = Path(out_dir)
+    files, warnings = collect_site(root)
+    keep = set()
+    rows = []
+
+    for rel, (source, data) in sorted(files.items()):
+        dest = out_dir / rel
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if data is None:
+            src_st = source.stat()
+            try:
+                dest_st = dest.stat()
+                fresh = dest_st.st_size == src_st.st_size and dest_st.st_mtime_ns == src_st.st_mtime_ns
+            except OSError:
+                fresh = False
+            if not fresh:
+                shutil.copy2(source, dest)
+        elif not dest.is_file() or dest.read_bytes() != data:
+            dest.write_bytes(data)
+
+        keep.add(dest)
+        kept = {}
+        if compress and is_compressible(dest.name) and dest.stat().st_size >= MIN_COMPRESS_BYTES:
+            kept = precompress_file(str(dest))
+            for coding, suffix in ENCODINGS:
+                if coding in kept:
+                    keep.add(dest.with_name(dest.name + suffix))
+        rows.append({
+            "file": rel,
+            "source": source.stat().st_size if source else len(data),
+            "built": dest.stat().st_size,
+            "gzip": kept.get("gzip"),
+            "br": kept.get("br"),
+        })
+
+    removed = 0
+    for dirpath, dirnames, filenames in os.walk(out_dir, topdown=False):
+        for name in filenames:
+            path = Path(dirpath) / name
+            if path not in keep:
+                path.unlink()
+                removed += 1
+        if Path(dirpath) != out_dir and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+
+    return {"files": rows, "removed": removed, "warnings": warnings}
+
+
+def print_report(result, verbose=False):
+    """Print source and built sizes, with the compressed variants, per file."""
+    def size(n):
+        return f"{n:,}" if n is not None else "-"
+
+    groups = {}
+    for row in result["files"]:
+        top = row["file"].split("/")[0]
+        # The question sets are copied unchanged; one line covers them unless asked for more
+        key = row["file"] if verbose or top != SETS_DIR else f"{SETS_DIR}/ ({{n}} files)"
+        group = groups.setdefault(key, {"n": 0, "source": 0, "built": 0, "gzip": None, "br": None, "wire": 0})
+        group["n"] += 1
+        for field in ("source", "built"):
+            group[field] += row[field]
+        for field in ("gzip", "br"):
+            if row[field] is not None:
+                group[field] = (group[field] or 0) + row[field]
+        group["wire"] += min(v for v in (row["built"], row["gzip"], row["br"]) if v is not None)
+
+    width = max([len(k) for k in groups] + [10])
+    print(f"  {'File':<{width}} {'Source':>12} {'Minified':>12} {'gzip':>12} {'br':>12} {'Wire':>7}")
+    total_source = total_wire = 0
+    for key, g in groups.items():
+        total_source += g["source"]
+        total_wire += g["wire"]
+        print(f"  {key.format(n=g['n']):<{width}} {size(g['source']):>12} {size(g['built']):>12} "
+              f"{size(g['gzip']):>12} {size(g['br']):>12} {g['wire'] / g['source']:>7.1%}")
+    if total_source:
+        print(f"  {'Total':<{width}} {size(total_source):>12} {'':>12} {'':>12} {'':>12} "
+              f"{total_wire / total_source:>7.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the minified, fingerprinted and precompressed site into docs/"
+    )
+    parser.add_argument(
+        "--out",
+        default=str(DEFAULT_SITE_DIR),
+        help="Site directory, replaced by the build (default: docs)"
+    )
+    parser.add_argument(
+        "--no-compress",
+        action="store_true",
+        help="Skip writing .gz/.br siblings"
+    )
+    parser.add_argument(
+        "--verbose",
+        "-v",
+        action="store_true",
+        help="Print a line for every question set, not just their total"
+    )
+
+    args = parser.parse_args()
+
+    if not (SCRIPT_DIR / PAGE_NAME).is_file():
+        print(f"Page not found: {SCRIPT_DIR / PAGE_NAME}")
+        sys.exit(1)
+
+    result = build_site(SCRIPT_DIR, args.out, compress=not args.no_compress)
+    for warning in result["warnings"]:
+        print(f"Warning: {warning}")
+    print_report(result, verbose=args.verbose)
+    if result["removed"]:
+        print(f"\nRemoved {result['removed']} stale files from {args.out}")
+
+
+if __name__ == "__main__":
+    main()
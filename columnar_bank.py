@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Compact Columnar Encoding for the Compiled Question Bank
+
+Writes the numbered questions from build_bank.py as one binary blob: every
+distinct string (question text, option key, option text, answer,
+explanation) is stored once in a string table, and each question is a row of
+references into that table. Option texts such as "All of the above" or
+"Ghana Education Service" that repeat across sets cost two bytes per use
+instead of a full copy, and the client decodes each distinct string once.
+
+Layout (integers are unsigned little-endian and every section starts on a
+four-byte boundary, so each can be viewed directly as a typed array in the
+browser):
+
+    header          magic "GESB", then u32 format, question count, string
+                    count, option count and reference width (2 or 4)
+    string lengths  u32 UTF-8 byte length of each string
+    question        one run-coded reference per question
+    answer          one string index per question
+    explanation     one run-coded reference per question
+    option counts   number of options of each question
+    option keys     one string index per option
+    option texts    one run-coded reference per option
+    string data     the UTF-8 bytes of every string back to back, padded so
+                    the blob length is a multiple of four
+
+Strings are grouped by kind (option keys and answers, option texts,
+questions, explanations) and, within a kind, ordered by first use, so
+similar text sits together and compresses well. That order also makes most
+references "the next string": a run-coded reference is 0 for the string
+after the highest one the column has used so far, and index + 1 otherwise.
+The index columns then gzip to almost nothing, which is what lets the blob
+beat the gzipped JSON bundle; build_bank.py only publishes it when it does.
+
+References are u16 while the bank has fewer than 65,535 distinct strings,
+u32 otherwise. Question i's id is i + 1.
+
+Usage:
+    python columnar_bank.py bank/questions.<hash>.bin
+"""
+
+import sys
+import json
+import struct
+import argparse
+from array import array
+
+MAGIC = b"GESB"
+FORMAT = 2
+HEADER = struct.Struct("<4s5I")
+TYPECODES = {2: "H", 4: "I"}
+
+
+def _pack(values, width=4):
+    data = array(TYPECODES[width], values)
+    if sys.byteorder != "little":
+        data.byteswap()
+    raw = data.tobytes()
+    return raw + b"\0" * (-len(raw) % 4)
+
+
+def _unpack(data, offset, count, width=4):
+    values = array(TYPECODES[width])
+    values.frombytes(data[offset:offset + count * width])
+    if sys.byteorder != "little":
+        values.byteswap()
+    size = count * width
+    return values, offset + size + (-size % 4)
+
+
+def _run_code(indices):
+    """Run-code a column of string indices (see the module docstring)."""
+    codes = []
+    expected = 0
+    for index in indices:
+        codes.append(0 if index == expected else index + 1)
+        if index >= expected:
+            expected = index + 1
+    return codes
+
+
+def _run_decode(codes):
+    """Inverse of _run_code()."""
+    indices = []
+    expected = 0
+    for code in codes:
+        index = expected if code == 0 else code - 1
+        indices.append(index)
+        if index >= expected:
+            expected = index + 1
+    return indices
+
+
+def encode_questions(questions):
+    """
+    Encode validated questions into the columnar binary format.
+
+    Args:
+        questions: List of question dictionaries (question, options, answer,
+                   explanation), in bank order
+
+    Returns:
+        bytes
+    """
+    kinds = ([], [], [], [])
+    string_ids = {}
+
+    def collect(value, kind):
+        if value not in string_ids:
+            string_ids[value] = None
+            kinds[kind].append(value)
+
+    for q in questions:
+        collect(q["answer"], 0)
+        for key, text in q["options"].items():
+            collect(str(key), 0)
+            collect(str(text), 1)
+        collect(q["question"], 2)
+        collect(q["explanation"], 3)
+
+    strings = [value for kind in kinds for value in kind]
+    for index, value in enumerate(strings):
+        string_ids[value] = index
+    width = 2 if len(strings) < 0xFFFF else 4
+
+    question_col = _run_code(string_ids[q["question"]] for q in questions)
+    answer_col = [string_ids[q["answer"]] for q in questions]
+    explanation_col = _run_code(string_ids[q["explanation"]] for q in questions)
+    option_counts = [len(q["options"]) for q in questions]
+    option_keys = [string_ids[str(key)] for q in questions for key in q["options"]]
+    option_texts = _run_code(string_ids[str(text)] for q in questions for text in q["options"].values())
+
+    encoded = [value.encode("utf-8") for value in strings]
+    string_data = b"".join(encoded)
+    string_data += b"\0" * (-len(string_data) % 4)
+
+    return b"".join((
+        HEADER.pack(MAGIC, FORMAT, len(questions), len(strings), len(option_keys), width),
+        _pack([len(data) for data in encoded]),
+        _pack(question_col, width),
+        _pack(answer_col, width),
+        _pack(explanation_col, width),
+        _pack(option_counts, width),
+        _pack(option_keys, width),
+        _pack(option_texts, width),
+        string_data,
+    ))
+
+
+def decode_questions(data):
+    """
+    Decode a blob written by encode_questions().
+
+    Args:
+        data: bytes
+
+    Returns:
+        List of question dictionaries with sequential ids
+
+    Raises:
+        ValueError: If the blob is not in a format this decoder understands
+    """
+    if len(data) < HEADER.size:
+        raise ValueError("columnar bank is truncated")
+    magic, version, count, string_count, option_count, width = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != FORMAT or width not in TYPECODES:
+        raise ValueError(f"not a format {FORMAT} columnar bank")
+
+    offset = HEADER.size
+    string_lengths, offset = _unpack(data, offset, string_count)
+    question_col, offset = _unpack(data, offset, count, width)
+    answer_col, offset = _unpack(data, offset, count, width)
+    explanation_col, offset = _unpack(data, offset, count, width)
+    option_counts, offset = _unpack(data, offset, count, width)
+    option_keys, offset = _unpack(data, offset, option_count, width)
+    option_texts, offset = _unpack(data, offset, option_count, width)
+
+    strings = []
+    for length in string_lengths:
+        strings.append(data[offset:offset + length].decode("utf-8"))
+        offset += length
+
+    question_col = _run_decode(question_col)
+    explanation_col = _run_decode(explanation_col)
+    option_texts = _run_decode(option_texts)
+    questions = []
+    p = 0
+    for i in range(count):
+        options = {}
+        for _ in range(option_counts[i]):
+            options[strings[option_keys[p]]] = strings[option_texts[p]]
+            p += 1
+        questions.append({
+            "id": i + 1,
+            "question": strings[question_col[i]],
+            "options": options,
+            "answer": strings[answer_col[i]],
+            "explanation": strings[explanation_col[i]],
+        })
+    return questions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode a columnar question bank and print a summary")
+    parser.add_argument("path", help="Path to a questions.<hash>.bin file")
+    parser.add_argument("--json", action="store_true", help="Print the decoded questions as JSON")
+    args = parser.parse_args()
+
+    with open(args.path, "rb") as f:
+        data = f.read()
+    try:
+        questions = decode_questions(data)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+
+    if args.json:
+        json.dump(questions, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        _, _, count, string_count, option_count, _ = HEADER.unpack_from(data, 0)
+        print(f"{count} questions, {string_count} distinct strings, "
+              f"{option_count} options, {len(data):,} bytes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,8 +5,20 @@ GitHub Deployment Script for GES Exam Web App
 This script automates pushing the web app to GitHub Pages.
 It handles Git initialization, authentication, and pushing to the gesexam repository.
 
+Only what changed is deployed: deploy-manifest.json records the SHA-256 of
+every deployable asset (index.html, the question sets, the bank/ bundle) as
+of the last deploy. The question bank is rebuilt only when a set changed,
+only changed files are staged, a size/diff report is printed, and a run with
+nothing changed stops before touching git.
+
+Question sets are validated first (validate_sets.py): strict JSON, required
+fields, answer keys, duplicate ids and encoding. Any problem aborts the
+deploy with a report. Before staging, build_site.py writes the minified,
+fingerprinted and precompressed copy of the site that GitHub Pages
+publishes into docs/.
+
 Usage:
-    python deploy_to_github.py [--dry-run] [--verbose]
+    python deploy_to_github.py [--dry-run] [--verbose] [--full]
 
 Configuration:
     - GitHub Username: MYKHIL
@@ -17,11 +29,18 @@ Configuration:
 
 import os
 import sys
+import json
+import hashlib
 import subprocess
 import argparse
 from pathlib import Path
 from datetime import datetime
 
+import build_bank
+import build_site
+import validate_sets
+from static_assets import is_variant
+
 # Configuration
 GITHUB_USERNAME = "MYKHIL"
 GITHUB_REPO = "gesexam"
@@ -33,6 +52,87 @@ GITHUB_URL_SSH = f"git@github.com:{GITHUB_USERNAME}/{GITHUB_REPO}.git"
 SCRIPT_DIR = Path(__file__).parent.absolute()
 PROJECT_DIR = SCRIPT_DIR
 
+# Content hashes of everything deployed by the last successful run
+DEPLOY_MANIFEST = "deploy-manifest.json"
+# Deployable assets (the .gitignore whitelist), relative to the project
+DEPLOY_PATTERNS = ("index.html", "default-questions/**/*", "bank/**/*", "docs/**/*",
+                   ".gitignore", "deploy.py", "firestore.rules")
+# The optimized site built by build_site.py, which GitHub Pages publishes
+SITE_DIR = "docs"
+# The question sets build_question_bank() compiles into bank/
+BANK_SOURCE_PREFIX = "default-questions/"
+
+
+def file_sha256(path):
+    """Hex SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def scan_assets(root, previous=None):
+    """
+    Hash every deployable asset under root.
+
+    .gz/.br siblings that `run_server.py --precompress` leaves next to the
+    sources are local serving aids and are skipped; only the ones
+    build_site.py writes into the site are deployed.
+
+    Args:
+        root: Project directory
+        previous: Entries of an earlier scan; files whose size and mtime are
+                  unchanged keep their recorded hash instead of being re-read
+
+    Returns:
+        Dict of posix relative path -> {"sha256", "bytes", "mtime_ns"}
+    """
+    root = Path(root)
+    previous = previous or {}
+    assets = {}
+    for pattern in DEPLOY_PATTERNS:
+        for path in sorted(root.glob(pattern)):
+            if not path.is_file():
+                continue
+            rel = path.relative_to(root).as_posix()
+            if is_variant(rel) and not rel.startswith(f"{SITE_DIR}/"):
+                continue
+            st = path.stat()
+            old = previous.get(rel)
+            if old and old.get("bytes") == st.st_size and old.get("mtime_ns") == st.st_mtime_ns:
+                sha = old["sha256"]
+            else:
+                sha = file_sha256(path)
+            assets[rel] = {"sha256": sha, "bytes": st.st_size, "mtime_ns": st.st_mtime_ns}
+    return assets
+
+
+def diff_assets(old, new):
+    """
+    Compare two asset scans by content hash.
+
+    Returns:
+        Dict with sorted path lists "added", "changed", "removed", "unchanged"
+    """
+    return {
+        "added": sorted(p for p in new if p not in old),
+        "changed": sorted(p for p in new if p in old and new[p]["sha256"] != old[p]["sha256"]),
+        "removed": sorted(p for p in old if p not in new),
+        "unchanged": sorted(p for p in new if p in old and new[p]["sha256"] == old[p]["sha256"]),
+    }
+
+
+def format_size(n):
+    """Human-readable byte count, signed when asked for a delta"""
+    sign = "-" if n < 0 else ""
+    n = abs(n)
+    for unit in ("B", "KB", "MB"):
+        if n < 1024 or unit == "MB":
+            return f"{sign}{n:.0f} {unit}" if unit == "B" else f"{sign}{n:.1f} {unit}"
+        n /= 1024
+
+
 class GitDeployment:
     def __init__(self, repo_path=None, use_ssh=False, dry_run=False, verbose=False):
         self.repo_path = Path(repo_path or PROJECT_DIR)
@@ -146,14 +246,97 @@ class GitDeployment:
         self.run_command(["git", "add", "."])
         self.log("✓ Files staged")
         return True
-    
-    def commit_changes(self, message=None):
+
+    def stage_files(self, paths):
+        """Stage only the given paths, including deletions"""
+        self.log(f"Staging {len(paths)} changed file(s)...")
+        self.run_command(["git", "add", "-A", "--"] + sorted(paths))
+        self.log("✓ Files staged")
+        return True
+
+    def load_deploy_manifest(self):
+        """Asset hashes recorded by the last successful deploy ({} if none)"""
+        path = self.repo_path / DEPLOY_MANIFEST
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f).get("files", {})
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, AttributeError) as e:
+            self.log(f"⚠ Ignoring unreadable {DEPLOY_MANIFEST}: {e}", "WARNING")
+            return {}
+
+    def save_deploy_manifest(self, assets):
+        """Record the deployed asset hashes for the next run to compare against"""
+        if self.dry_run:
+            self.log(f"[DRY-RUN] Would write {DEPLOY_MANIFEST}", "DRY-RUN")
+            return
+        path = self.repo_path / DEPLOY_MANIFEST
+        manifest = {
+            "generated": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "files": assets,
+        }
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+            f.write("\n")
+        os.replace(tmp, path)
+
+    def bank_is_current(self, previous, current):
+        """True when no question set changed since the last deploy and its bank/ output is intact"""
+        def sources(assets):
+            return {p: a["sha256"] for p, a in assets.items()
+                    if p.startswith(BANK_SOURCE_PREFIX) and p.endswith(".json")}
+
+        built = {p: a for p, a in previous.items() if p.startswith("bank/")}
+        if not built or sources(previous) != sources(current):
+            return False
+        return all(current.get(p, {}).get("sha256") == a["sha256"] for p, a in built.items())
+
+    def commits_ahead(self, branch):
+        """Number of local commits not yet on origin/<branch> (0 if unknown)"""
+        result = self.run_command(["git", "rev-list", "--count", f"origin/{branch}..HEAD"], check=False)
+        if result and result.returncode == 0:
+            return int(result.stdout.strip() or 0)
+        return 0
+
+    def report_changes(self, changes, previous, current):
+        """Print the per-deploy size/diff report"""
+        rows = []
+        for status in ("added", "changed", "removed"):
+            for path in changes[status]:
+                before = previous[path]["bytes"] if path in previous else None
+                after = current[path]["bytes"] if path in current else None
+                rows.append((status, path, before, after))
+
+        width = max([len(r[1]) for r in rows] + [4])
+        self.log("Deploy report:")
+        print(f"  {'Status':<8} {'File':<{width}} {'Before':>10} {'After':>10} {'Delta':>10}")
+        for status, path, before, after in rows:
+            delta = (after or 0) - (before or 0)
+            print(f"  {status:<8} {path:<{width}} "
+                  f"{format_size(before) if before is not None else '-':>10} "
+                  f"{format_size(after) if after is not None else '-':>10} "
+                  f"{('+' if delta >= 0 else '') + format_size(delta):>10}")
+
+        shipped = sum(current[p]["bytes"] for p in changes["added"] + changes["changed"])
+        kept = sum(current[p]["bytes"] for p in changes["unchanged"])
+        net = sum(a["bytes"] for a in current.values()) - sum(a["bytes"] for a in previous.values())
+        print(f"  {len(rows)} file(s) changed ({format_size(shipped)} to send), "
+              f"{len(changes['unchanged'])} unchanged ({format_size(kept)} not re-sent), "
+              f"net {'+' if net >= 0 else ''}{format_size(net)}")
+        return len(rows)
+
+    def commit_changes(self, message=None, details=None):
         """Commit staged changes"""
         if not message:
             message = f"Deploy: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
         
         self.log(f"Committing changes: {message}")
-        self.run_command(["git", "commit", "-m", message])
+        cmd = ["git", "commit", "-m", message]
+        if details:
+            cmd += ["-m", details]
+        self.run_command(cmd)
         self.log("✓ Changes committed")
         return True
     
@@ -212,13 +395,85 @@ class GitDeployment:
         self.log("1. Go to repository Settings")
         self.log("2. Scroll to 'GitHub Pages' section")
         self.log("3. Under 'Source', select 'Deploy from a branch'")
-        self.log("4. Choose branch 'main' (or 'gh-pages') and folder '/ (root)'")
+        self.log(f"4. Choose branch 'main' (or 'gh-pages') and folder '/{SITE_DIR}' (the optimized site)")
         self.log("5. Click Save")
         self.log("\nYour site will be available at:")
         self.log(f"   https://{GITHUB_USERNAME}.github.io/{GITHUB_REPO}/")
         self.log("="*60 + "\n")
     
-    def deploy(self, branch=None, force=False, message=None):
+    def build_question_bank(self):
+        """Compile default-questions/ into the content-hashed bundle under bank/"""
+        self.log("Building question bank...")
+        source_dir = self.repo_path / "default-questions"
+        if not source_dir.is_dir():
+            self.log(f"✗ Question folder not found: {source_dir}", "ERROR")
+            return False
+
+        bank = build_bank.compile_bank(source_dir, base_dir=self.repo_path)
+        if not bank["questions"]:
+            self.log("✗ No valid questions found", "ERROR")
+            return False
+
+        for s in bank["sets"]:
+            if s["error"]:
+                self.log(f"⚠ Skipped {s['file']}: {s['error']}", "WARNING")
+
+        if self.dry_run:
+            self.log(f"[DRY-RUN] Would write bank with {len(bank['questions'])} questions", "DRY-RUN")
+            return True
+
+        manifest = build_bank.write_bank(bank, self.repo_path / "bank")
+        self.log(f"✓ Question bank built: {manifest['count']} questions -> bank/{manifest['bundle']}")
+        if manifest["patches"]:
+            self.log(f"✓ Delta patches for {len(manifest['patches'])} earlier version(s); "
+                     f"largest {format_size(max(p['bytes'] for p in manifest['patches'].values()))}")
+        return True
+
+    def validate_question_sets(self):
+        """Strictly check every question set; False (with a report) if any fails"""
+        self.log("Validating question sets...")
+        source_dir = self.repo_path / "default-questions"
+        results = validate_sets.validate_sets(source_dir, base_dir=self.repo_path)
+        if not results:
+            self.log(f"✗ No question sets found in {source_dir}", "ERROR")
+            return False
+
+        total = validate_sets.print_report(results)
+        if total:
+            failed = sum(1 for r in results if r["problems"])
+            self.log(f"✗ {total} problem(s) in {failed} of {len(results)} question set(s); "
+                     f"fix them (python validate_sets.py --all lists every one) "
+                     f"or deploy with --skip-validation", "ERROR")
+            return False
+
+        questions = sum(r["questions"] for r in results)
+        self.log(f"✓ {len(results)} question sets valid ({questions} questions)")
+        return True
+
+    def build_optimized_site(self):
+        """Minify, fingerprint and precompress the site into docs/"""
+        self.log(f"Building optimized site into {SITE_DIR}/...")
+        if not (self.repo_path / build_site.PAGE_NAME).is_file():
+            self.log(f"✗ {build_site.PAGE_NAME} not found in {self.repo_path}", "ERROR")
+            return False
+
+        if self.dry_run:
+            self.log(f"[DRY-RUN] Would build the site into {SITE_DIR}/", "DRY-RUN")
+            return True
+
+        result = build_site.build_site(self.repo_path, self.repo_path / SITE_DIR)
+        for warning in result["warnings"]:
+            self.log(f"⚠ {warning}", "WARNING")
+        build_site.print_report(result)
+        source = sum(row["source"] for row in result["files"])
+        wire = sum(min(v for v in (row["built"], row["gzip"], row["br"]) if v is not None)
+                   for row in result["files"])
+        self.log(f"✓ Site built: {len(result['files'])} files, {format_size(source)} -> "
+                 f"{format_size(wire)} over the wire")
+        return True
+
+    def deploy(self, branch=None, force=False, message=None, build=True, full=False, optimize=True,
+               validate=True):
         """Execute the complete deployment process"""
         try:
             self.log("Starting GitHub deployment process...\n")
@@ -234,26 +489,68 @@ class GitDeployment:
             # Configure remote
             if not self.add_remote():
                 return False
-            
-            # Check for changes
-            if not self.check_changes():
-                self.log("No changes to commit. Repository is up to date.", "INFO")
-                self.check_github_pages_setup()
-                return True
-            
-            # Create .gitignore to filter files
-            self.create_gitignore()
 
-            # Stage and commit
-            if not self.add_all_files():
+            # Refuse to ship sets that the browser would silently drop
+            if validate and not self.validate_question_sets():
                 return False
-            
-            if not self.commit_changes(message):
+
+            # Compare the deployable assets with what the last deploy shipped
+            previous = {} if full else self.load_deploy_manifest()
+            current = scan_assets(self.repo_path, previous)
+
+            # Recompile the question bank only when a question set changed
+            if build:
+                if self.bank_is_current(previous, current):
+                    self.log("✓ Question bank up to date (no question set changed)")
+                else:
+                    if not self.build_question_bank():
+                        return False
+                    current = scan_assets(self.repo_path, current)
+
+            # Minify, fingerprint and precompress what Pages serves, before staging
+            if optimize and not self.build_optimized_site():
                 return False
+
+            # Create .gitignore to filter files
+            self.create_gitignore()
+            current = scan_assets(self.repo_path, current)
+
+            current_branch = branch or self.get_current_branch() or "master"
+            changes = diff_assets(previous, current)
+            if not (changes["added"] or changes["changed"] or changes["removed"]):
+                # An earlier deploy may have committed but failed to push
+                if self.commits_ahead(current_branch):
+                    self.log("No asset changes; pushing earlier unpushed commits")
+                    if not self.push_to_github(branch, force):
+                        return False
+                else:
+                    self.log(f"No changes since the last deploy ({len(current)} assets match "
+                             f"{DEPLOY_MANIFEST}). Nothing to do.", "INFO")
+                self.check_github_pages_setup()
+                return True
+
+            count = self.report_changes(changes, previous, current)
+
+            # Stage and commit only what changed, with the manifest recording it
+            manifest_path = self.repo_path / DEPLOY_MANIFEST
+            old_manifest = manifest_path.read_bytes() if manifest_path.exists() else None
+            self.save_deploy_manifest(current)
+            try:
+                if not self.stage_files(changes["added"] + changes["changed"] + changes["removed"]
+                                        + [DEPLOY_MANIFEST]):
+                    return False
+                if not self.commit_changes(message, details=f"{count} asset(s) changed"):
+                    return False
+            except Exception:
+                # Nothing was deployed; let the next run see the same changes
+                if not self.dry_run:
+                    if old_manifest is None:
+                        manifest_path.unlink(missing_ok=True)
+                    else:
+                        manifest_path.write_bytes(old_manifest)
+                raise
             
             # Pull latest changes before pushing (to avoid non-fast-forward errors)
-            # Use detected branch or default
-            current_branch = branch or self.get_current_branch() or "master"
             self.pull_latest_changes(current_branch)
 
             # Push to GitHub (auto-detect branch if not specified)
@@ -281,15 +578,29 @@ class GitDeployment:
             "!/index.html\n"
             "!/default-questions/\n"
             "!/default-questions/**\n"
+            "!/bank/\n"
+            "!/bank/**\n"
+            f"!/{SITE_DIR}/\n"
+            f"!/{SITE_DIR}/**\n"
             "!/.gitignore\n"  # Keep .gitignore itself
             "!/deploy.py\n"   # Keep the deployment script too (optional but recommended)
             "!/firestore.rules\n" # Keep firestore security rules
+            f"!/{DEPLOY_MANIFEST}\n"  # Hashes of the deployed assets
+            # run_server.py --precompress siblings; only the site's own are published
+            "*.gz\n"
+            "*.br\n"
+            f"!/{SITE_DIR}/**/*.gz\n"
+            f"!/{SITE_DIR}/**/*.br\n"
         )
         
         try:
+            # Leave an identical file alone so its mtime (and the manifest) stay put
+            if gitignore_path.exists() and gitignore_path.read_text(encoding='utf-8') == content:
+                self.log("✓ .gitignore already up to date")
+                return True
             with open(gitignore_path, "w", encoding='utf-8') as f:
                 f.write(content)
-            self.log("✓ .gitignore configured (Whitelisting: index.html, default-questions)")
+            self.log(f"✓ .gitignore configured (Whitelisting: index.html, default-questions, bank, {SITE_DIR})")
             return True
         except Exception as e:
             self.log(f"Failed to create .gitignore: {e}", "ERROR")
@@ -308,6 +619,10 @@ Examples:
   python deploy_to_github.py --branch gh-pages  # Deploy to gh-pages branch
   python deploy_to_github.py --force         # Force push (use with caution)
   python deploy_to_github.py --message "Custom commit message"
+  python deploy_to_github.py --skip-build    # Reuse the existing bank/ bundle
+  python deploy_to_github.py --skip-optimize # Deploy without rebuilding docs/
+  python deploy_to_github.py --skip-validation  # Deploy even if a question set fails validation
+  python deploy_to_github.py --full          # Rebuild and stage everything, ignoring the manifest
         """
     )
     
@@ -343,6 +658,26 @@ Examples:
         "-m",
         help="Custom commit message"
     )
+    parser.add_argument(
+        "--skip-build",
+        action="store_true",
+        help="Deploy without recompiling the question bank (bank/)"
+    )
+    parser.add_argument(
+        "--skip-optimize",
+        action="store_true",
+        help=f"Deploy without rebuilding the minified, precompressed site ({SITE_DIR}/)"
+    )
+    parser.add_argument(
+        "--skip-validation",
+        action="store_true",
+        help="Deploy even when question sets fail the strict pre-deploy checks"
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help=f"Ignore {DEPLOY_MANIFEST}: rebuild the bank and stage every asset"
+    )
     
     args = parser.parse_args()
     
@@ -358,7 +693,11 @@ Examples:
     success = deployer.deploy(
         branch=args.branch,
         force=args.force,
-        message=args.message
+        message=args.message,
+        build=not args.skip_build,
+        full=args.full,
+        optimize=not args.skip_optimize,
+        validate=not args.skip_validation
     )
     
     sys.exit(0 if success else 1)
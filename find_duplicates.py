@@ -1,61 +1,120 @@
-import json
-import os
+import time
+import argparse
 from pathlib import Path
 
-# Dynamically discover all JSON files in the Default questions directory
-questions_dir = Path('default-questions')
-json_files = sorted(questions_dir.glob('*.json'))
-
-if not json_files:
-    print("No JSON files found in 'Default questions' directory.")
-    exit(1)
-
-file_map = {}
-all_questions = {}
-
-print(f"Discovered {len(json_files)} JSON file(s) in 'Default questions' directory:\n")
-
-for file_path in json_files:
-    print(f"  - {file_path.name}")
-
-print(f"\nLoading files...\n")
-
-for file_path in json_files:
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            questions = json.load(f)
-            print(f"Loaded {len(questions)} questions from {file_path.name}")
-            for q in questions:
-                q_hash = json.dumps(q, sort_keys=True)
-                if q_hash not in file_map:
-                    file_map[q_hash] = []
-                file_map[q_hash].append(file_path.name)
-                all_questions[q_hash] = q
-    except Exception as e:
-        print(f"Error loading {file_path.name}: {e}")
-
-duplicates = {q_hash: files for q_hash, files in file_map.items() if len(files) > 1}
-
-total_files = len(json_files)
-total_questions = sum(len(questions) for questions in [json.load(open(f)) for f in json_files])
-unique_questions = len(all_questions)
-duplicate_occurrences = sum(len(files) - 1 for files in file_map.values())
-
-print(f"\n{'='*80}")
-print(f"Total JSON files found: {total_files}")
-print(f"Total questions across all files: {total_questions}")
-print(f"Total unique questions: {unique_questions}")
-print(f"Total duplicate occurrences: {duplicate_occurrences}")
-print(f"DUPLICATE QUESTIONS FOUND: {len(duplicates)}")
-print(f"{'='*80}\n")
-
-if duplicates:
-    print("DUPLICATES:\n")
-    for i, (q_hash, files_with_dup) in enumerate(duplicates.items(), 1):
-        q = all_questions[q_hash]
-        print(f"{i}. Question ID {q['id']}: {q['question'][:75]}...")
-        print(f"   Found in: {', '.join(sorted(files_with_dup))}")
+from question_bank import load_bank, question_hash
+from near_duplicates import find_near_duplicates, DEFAULT_THRESHOLD
+
+
+def report_exact_duplicates(file_map, all_questions):
+    duplicates = {q_hash: files for q_hash, files in file_map.items() if len(files) > 1}
+
+    print(f"DUPLICATE QUESTIONS FOUND: {len(duplicates)}")
+    print(f"{'='*80}\n")
+
+    if duplicates:
+        print("DUPLICATES:\n")
+        for i, (q_hash, files_with_dup) in enumerate(duplicates.items(), 1):
+            q = all_questions[q_hash]
+            print(f"{i}. Question ID {q.id}: {str(q.question)[:75]}...")
+            print(f"   Found in: {', '.join(sorted(files_with_dup))}")
+            print()
+    else:
+        print("✓ No duplicates found!")
+
+
+def report_near_duplicates(entries, threshold):
+    start = time.perf_counter()
+    clusters = find_near_duplicates([q for _, _, q in entries], threshold)
+    elapsed = time.perf_counter() - start
+
+    print(f"NEAR-DUPLICATE CLUSTERS FOUND: {len(clusters)} "
+          f"(similarity >= {threshold:.2f}, {len(entries)} questions in {elapsed:.2f}s)")
+    print(f"{'='*80}\n")
+
+    if not clusters:
+        print("✓ No near-duplicates found!")
+        return
+
+    removable = sum(len(c['members']) - 1 for c in clusters)
+    print(f"Questions that could be removed by keeping one per cluster: {removable}\n")
+    for i, cluster in enumerate(clusters, 1):
+        if cluster['min'] == cluster['max']:
+            score = f"{cluster['max']:.2f}"
+        else:
+            score = f"{cluster['min']:.2f}-{cluster['max']:.2f}"
+        print(f"{i}. Similarity {score}, {len(cluster['members'])} questions:")
+        for member in cluster['members']:
+            filename, index, q = entries[member]
+            print(f"   - {filename} #{index} (id {q.get('id')}): {str(q.get('question'))[:70]}")
         print()
-else:
-    print("✓ No duplicates found!")
 
+
+def main():
+    parser = argparse.ArgumentParser(description="Report duplicate questions across the default question sets")
+    parser.add_argument('--near', action='store_true',
+                        help="Also report near-duplicates (renumbered or lightly reworded questions)")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f"Minimum similarity for near-duplicates, 0-1 (default: {DEFAULT_THRESHOLD})")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Parse the sets in N processes, 0 for one per CPU (default: 1)")
+    args = parser.parse_args()
+
+    # Every file is read and parsed once; sets that fail to parse are
+    # reported below instead of stopping the run
+    questions_dir = Path('default-questions')
+    bank = load_bank(questions_dir, workers=args.workers)
+
+    if not bank.sets:
+        print("No JSON files found in 'Default questions' directory.")
+        exit(1)
+
+    file_map = {}
+    all_questions = {}
+    entries = []
+
+    print(f"Discovered {len(bank.sets)} JSON file(s) in 'Default questions' directory:\n")
+
+    for loaded_set in bank.sets:
+        print(f"  - {loaded_set['path'].name}")
+
+    print(f"\nLoading files...\n")
+
+    for loaded_set in bank.sets:
+        filename = loaded_set['path'].name
+        if loaded_set['error']:
+            print(f"Error loading {filename}: {loaded_set['error']}")
+            continue
+        questions = bank.set_questions(loaded_set)
+        print(f"Loaded {len(questions)} questions from {filename}")
+        for q in questions:
+            # Key on the question content only, so a renumbered copy
+            # (different id) is still reported as a duplicate
+            q_hash = question_hash(q)
+            if q_hash not in file_map:
+                file_map[q_hash] = []
+            file_map[q_hash].append(filename)
+            all_questions[q_hash] = q
+            entries.append((filename, q.index, q))
+
+    total_files = len(bank.sets)
+    total_questions = len(bank)
+    unique_questions = len(all_questions)
+    duplicate_occurrences = sum(len(files) - 1 for files in file_map.values())
+    failed_files = len(bank.errors)
+
+    print(f"\n{'='*80}")
+    print(f"Total JSON files found: {total_files}")
+    print(f"Files that could not be parsed: {failed_files}")
+    print(f"Total questions across all files: {total_questions}")
+    print(f"Total unique questions: {unique_questions}")
+    print(f"Total duplicate occurrences: {duplicate_occurrences}")
+    report_exact_duplicates(file_map, all_questions)
+
+    if args.near:
+        print(f"\n{'='*80}")
+        report_near_duplicates(entries, args.threshold)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+load_test.py
+Load-test harness for run_server.py that replays what a room of candidates
+does, rather than one request type at a time.
+
+Each virtual user runs sessions back to back until the test ends:
+
+  1. app shell      GET /index.html (gzip accepted)
+  2. question bank  GET bank/manifest.json and the bundle it names (the
+                    columnar .bin when present); when bank/ is missing, probe
+                    default-questions/set1..set80.json like the app does, six
+                    at a time like a browser
+  3. register       POST /proxy?action=register, in the first session only
+  4. quiz           --rounds rounds of: think, heartbeat POST, and on every
+                    other round a rankings poll (GET /proxy?action=getLeaderboard)
+  5. submit         POST /proxy?action=submitScore with the user's deviceID
+
+The app sends its heartbeats to Firestore, not /proxy, so the heartbeat here
+is the nearest call the Apps Script answers: an uncached POST of
+getLeaderboard for one row. A /proxy reply counts as an error unless its JSON
+body says success: true, as the script and appscript_backend.py reject bad
+calls with a 200.
+
+By default the harness starts stub_upstream.py as the fake Apps Script and
+run_server.py pointed at it, each in its own process, and drives them from an
+asyncio client. It reports per-step throughput, latency percentiles and error
+rates, plus the server's CPU time, peak threads and peak RSS (from /proc, so
+Linux only). Use --url to load an already running server instead; server
+resource columns are then left out.
+
+Usage:
+    python load_test.py [--users 100] [--duration 30] [--think 500] [--async]
+    python load_test.py --url http://127.0.0.1:4000 --users 50
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+from bench_async import HERE, ProcessSampler, free_port, start_process, wait_for_port
+from bench_proxy import percentile
+from bench_static import cpu_seconds
+
+STEPS = ('app shell', 'manifest', 'bank', 'set', 'register', 'heartbeat', 'rankings', 'submit')
+# The app probes default-questions/set1.json .. set80.json when there is no compiled bank
+SET_PROBE_COUNT = 80
+# Parallel connections a browser opens to one host
+BROWSER_CONNECTIONS = 6
+# The app's default questions per session
+QUIZ_LENGTH = 25
+
+
+class StepStats:
+    """Latencies, errors and bytes for one kind of request."""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.bytes = 0
+        self.statuses = defaultdict(int)
+
+
+async def http_request(host, port, method, target, body=None, headers=None, timeout=30.0):
+    """
+    Send one HTTP/1.1 request on a new connection.
+
+    Returns:
+        Tuple of (status, body bytes)
+    """
+    async def exchange():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            lines = [f'{method} {target} HTTP/1.1', f'Host: {host}:{port}', 'Connection: close']
+            lines += [f'{k}: {v}' for k, v in (headers or {}).items()]
+            if body is not None:
+                lines.append(f'Content-Length: {len(body)}')
+            writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + (body or b''))
+            await writer.drain()
+            data = await reader.read()
+        finally:
+            writer.close()
+        head, _, payload = data.partition(b'\r\n\r\n')
+        status = int(head.split(b' ', 2)[1])
+        if b'transfer-encoding: chunked' in head.lower():
+            payload = dechunk(payload)
+        return status, payload
+
+    return await asyncio.wait_for(exchange(), timeout)
+
+
+def dechunk(data):
+    out = []
+    while data:
+        size_line, _, data = data.partition(b'\r\n')
+        size = int(size_line.split(b';', 1)[0] or b'0', 16)
+        if size == 0:
+            break
+        out.append(data[:size])
+        data = data[size + 2:]
+    return b''.join(out)
+
+
+def reply_succeeded(payload):
+    """True if a /proxy body is the script's JSON with success: true."""
+    try:
+        reply = json.loads(payload)
+    except ValueError:
+        return False
+    return isinstance(reply, dict) and reply.get('success') is True
+
+
+class VirtualUser:
+    """One candidate going through sessions against the server."""
+
+    def __init__(self, harness, user_id):
+        self.harness = harness
+        self.user_id = user_id
+        # Unique per run, so a persisted backend does not see a repeat registration
+        self.email = f'loadtest{user_id}-{harness.run_id}@example.com'
+        self.device_id = f'loadtest-device-{user_id}-{harness.run_id}'
+        self.registered = False
+
+    async def call(self, step, method, target, body=None, headers=None, expected=(200,), check_success=False):
+        """
+        Send one request and record it under step.
+
+        Args:
+            check_success: Also count a 200 whose JSON body lacks
+                           success: true as an error, like a /proxy call
+                           the Apps Script rejected
+
+        Returns:
+            The body of a successful 200, else None
+        """
+        stats = self.harness.stats[step]
+        start = time.perf_counter()
+        try:
+            status, payload = await http_request(self.harness.host, self.harness.port, method, target,
+                                                 body, headers)
+        except Exception:
+            stats.errors += 1
+            stats.statuses['error'] += 1
+            return None
+        stats.statuses[status] += 1
+        if status not in expected:
+            stats.errors += 1
+            return None
+        if check_success and status == 200 and not reply_succeeded(payload):
+            stats.errors += 1
+            stats.statuses['success: false'] += 1
+            return None
+        stats.latencies.append(time.perf_counter() - start)
+        stats.bytes += len(payload)
+        return payload if status == 200 else None
+
+    async def proxy(self, step, action, method='POST', **params):
+        target = '/proxy?' + urllib.parse.urlencode(dict(action=action, **params))
+        if method == 'GET':
+            return await self.call(step, 'GET', target, headers={'Accept': 'application/json'},
+                                   check_success=True)
+        # Apps Script reads e.parameter, so the client posts form fields
+        body = urllib.parse.urlencode(dict(action=action, **params)).encode('utf-8')
+        return await self.call(step, 'POST', target, body,
+                               {'Content-Type': 'application/x-www-form-urlencoded'}, check_success=True)
+
+    async def think(self):
+        # Jittered so users do not march in lockstep
+        await asyncio.sleep(self.harness.think * random.uniform(0.5, 1.5))
+
+    async def load_bank(self):
+        gzip_ok = {'Accept-Encoding': 'gzip, deflate, br'}
+        # A missing manifest is the app's normal fallback path, not an error
+        manifest = await self.call('manifest', 'GET', '/bank/manifest.json', expected=(200, 404))
+        if manifest is not None:
+            try:
+                manifest = json.loads(manifest)
+            except ValueError:
+                manifest = None
+        if manifest:
+            name = manifest.get('binary') or manifest.get('bundle')
+            await self.call('bank', 'GET', f'/bank/{name}', headers=gzip_ok)
+            return
+        cache_buster = f'v={int(time.time() * 1000)}'
+        connections = asyncio.Semaphore(BROWSER_CONNECTIONS)
+
+        async def probe(number):
+            async with connections:
+                await self.call('set', 'GET', f'/default-questions/set{number}.json?{cache_buster}',
+                                headers=gzip_ok, expected=(200, 404))
+
+        await asyncio.gather(*(probe(number) for number in range(1, SET_PROBE_COUNT + 1)))
+
+    async def session(self):
+        await self.call('app shell', 'GET', '/index.html', headers={'Accept-Encoding': 'gzip, br'})
+        await self.load_bank()
+        if not self.registered:
+            # The app registers a candidate once; later sessions only submit
+            self.registered = await self.proxy('register', 'register', email=self.email,
+                                               name=f'Candidate {self.user_id}',
+                                               phoneNumber='0240000000') is not None
+        for round_number in range(self.harness.rounds):
+            await self.think()
+            await self.proxy('heartbeat', 'getLeaderboard', limit=1)
+            if round_number % 2:
+                await self.proxy('rankings', 'getLeaderboard', method='GET')
+        score = random.randint(0, QUIZ_LENGTH)
+        await self.proxy('submit', 'submitScore', email=self.email, score=score, totalQuestions=QUIZ_LENGTH,
+                         deviceID=self.device_id)
+        self.harness.sessions += 1
+
+    async def run(self, deadline):
+        while time.monotonic() < deadline:
+            await self.session()
+
+
+class LoadHarness:
+    def __init__(self, host, port, users, duration, think, rounds):
+        self.host = host
+        self.port = port
+        self.users = users
+        self.duration = duration
+        self.think = think
+        self.rounds = rounds
+        self.stats = defaultdict(StepStats)
+        self.sessions = 0
+        self.seconds = 0.0
+        self.run_id = f'{int(time.time()):x}'
+
+    async def run(self):
+        start = time.monotonic()
+        deadline = start + self.duration
+        tasks = []
+        for user_id in range(self.users):
+            tasks.append(asyncio.ensure_future(VirtualUser(self, user_id).run(deadline)))
+            # Ramp up over the first second instead of arriving in one packet storm
+            await asyncio.sleep(1.0 / self.users)
+        await asyncio.gather(*tasks)
+        self.seconds = time.monotonic() - start
+
+    def report(self):
+        print(f"{'Step':<11} {'requests':>9} {'req/s':>8} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} "
+              f"{'errors':>7} {'KB/req':>8}")
+        print('-' * 78)
+        total_requests = total_errors = 0
+        all_latencies = []
+        for step in STEPS:
+            stats = self.stats.get(step)
+            if stats is None:
+                continue
+            ok = len(stats.latencies)
+            count = ok + stats.errors
+            latencies = sorted(stats.latencies)
+            total_requests += count
+            total_errors += stats.errors
+            all_latencies += latencies
+            error_rate = f'{stats.errors / count:.1%}' if count else '-'
+            print(f'{step:<11} {count:>9} {count / self.seconds:>8.1f} {percentile(latencies, 50) * 1000:>9.1f} '
+                  f'{percentile(latencies, 95) * 1000:>9.1f} {percentile(latencies, 99) * 1000:>9.1f} '
+                  f'{error_rate:>7} {stats.bytes / max(ok, 1) / 1024:>8.1f}')
+        all_latencies.sort()
+        print('-' * 78)
+        error_rate = f'{total_errors / total_requests:.1%}' if total_requests else '-'
+        print(f"{'all':<11} {total_requests:>9} {total_requests / self.seconds:>8.1f} "
+              f'{percentile(all_latencies, 50) * 1000:>9.1f} {percentile(all_latencies, 95) * 1000:>9.1f} '
+              f'{percentile(all_latencies, 99) * 1000:>9.1f} {error_rate:>7}')
+        print(f'\n{self.sessions} sessions completed in {self.seconds:.1f}s')
+        failures = {step: dict(stats.statuses) for step, stats in self.stats.items() if stats.errors}
+        if failures:
+            print('Failed responses by status:', failures)
+
+
+def start_servers(args):
+    """Start the stub upstream and run_server.py; returns (server process, port, stub process)."""
+    stub_port = free_port()
+    stub = start_process(['stub_upstream.py', '--port', str(stub_port), '--latency', str(args.latency),
+                          '--handshake', str(args.handshake), '--redirect'])
+    if not wait_for_port(stub_port):
+        stub.kill()
+        raise SystemExit('Stub upstream did not start')
+    port = free_port()
+    env = dict(os.environ, APPSCRIPT_URL=f'http://127.0.0.1:{stub_port}/exec', PROXY_DISABLED='1')
+    command = ['run_server.py', '--no-open', '--port', str(port), '--dir', args.dir] + args.server_arg
+    if args.use_async:
+        command.append('--async')
+    server = start_process(command, env)
+    if not wait_for_port(port):
+        server.kill()
+        stub.kill()
+        raise SystemExit('run_server.py did not start')
+    return server, port, stub
+
+
+def stop_process(process, port=None):
+    if port is not None:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/__run_local_shutdown__', timeout=2)
+            process.wait(timeout=3)
+            return
+        except Exception:
+            pass
+    process.terminate()
+    try:
+        process.wait(timeout=3)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a realistic session mix against run_server.py')
+    parser.add_argument('--users', type=int, default=100, help='Concurrent virtual users (default: 100)')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run (default: 30)')
+    parser.add_argument('--think', type=float, default=500,
+                        help='Mean pause between quiz rounds in ms (default: 500; the app heartbeats every 30 s)')
+    parser.add_argument('--rounds', type=int, default=6, help='Quiz rounds per session (default: 6)')
+    parser.add_argument('--url', help='Load this running server instead of starting one')
+    parser.add_argument('--dir', '-d', default=HERE, help='Directory to serve (default: this project)')
+    parser.add_argument('--latency', type=float, default=50,
+                        help='Fake Apps Script processing time in ms (default: 50)')
+    parser.add_argument('--handshake', type=float, default=60,
+                        help='Fake Apps Script connection setup in ms (default: 60)')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='Start the server with --async')
+    parser.add_argument('--server-arg', action='append', default=[],
+                        help='Extra argument for run_server.py, repeatable (e.g. --server-arg=--cache-ttl=0)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for think times and scores (default: 1)')
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    # One socket per in-flight request
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+    server = stub = None
+    if args.url:
+        parts = urllib.parse.urlsplit(args.url)
+        host, port = parts.hostname, parts.port or 80
+    else:
+        server, port, stub = start_servers(args)
+        host = '127.0.0.1'
+
+    harness = LoadHarness(host, port, args.users, args.duration, args.think / 1000, args.rounds)
+    mode = 'asyncio' if args.use_async else 'threaded'
+    target = args.url or f'run_server.py ({mode}) on port {port}'
+    print(f'{args.users} users for {args.duration:.0f}s against {target}, '
+          f'{args.rounds} rounds per session, think {args.think:.0f} ms\n')
+    try:
+        if server is None:
+            asyncio.run(harness.run())
+            harness.report()
+            return
+        before = cpu_seconds(server.pid)
+        with ProcessSampler(server.pid) as sampler:
+            asyncio.run(harness.run())
+        after = cpu_seconds(server.pid)
+        harness.report()
+        rss = sampler.peak_rss_mb()
+        cpu = (f'{after - before:.1f}s ({(after - before) / harness.seconds:.0%} of one core)'
+               if before is not None else '-')
+        print(f"Server: CPU {cpu}, peak threads {sampler.peak_threads or '-'}, "
+              f"peak RSS {f'{rss:.1f} MB' if rss is not None else '-'}")
+    finally:
+        if server is not None:
+            stop_process(server, port)
+            stop_process(stub)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Near-Duplicate Question Detection for GES Promotion Quiz Application
+
+Finds questions that are the same or nearly the same even when they have
+been renumbered, moved to another set or lightly reworded. Each question is
+reduced to word shingles of its normalized text, sketched with one-permutation
+MinHash, and bucketed with LSH so only likely pairs are compared. Candidate
+pairs are confirmed with the exact Jaccard similarity of their shingles and
+grouped into clusters.
+
+Usage:
+    python find_duplicates.py --near [--threshold 0.8]
+"""
+
+import re
+import zlib
+
+SHINGLE_SIZE = 2
+# 12 bands of 6 rows: pairs at 0.8 similarity collide in some band ~97% of
+# the time, pairs at 0.5 only ~17%, which keeps the exact checks few
+NUM_BINS = 72
+BANDS = 12
+ROWS = NUM_BINS // BANDS
+DEFAULT_THRESHOLD = 0.8
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def normalized_words(q):
+    """
+    Reduce a question to lowercase words.
+
+    The question text and its option texts are used; options are sorted so
+    that shuffling A-D does not hide a duplicate. Punctuation, numbering and
+    the id are ignored.
+    """
+    options = q.get("options") if isinstance(q.get("options"), dict) else {}
+    text = " ".join([str(q.get("question") or "")] + sorted(str(v) for v in options.values()))
+    return WORD_PATTERN.findall(text.lower())
+
+
+def shingle_set(words, size=SHINGLE_SIZE):
+    """Return the set of hashed word shingles for a list of words."""
+    if len(words) <= size:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))}
+    return {
+        zlib.crc32(" ".join(words[i:i + size]).encode("utf-8"))
+        for i in range(len(words) - size + 1)
+    }
+
+
+def minhash_signature(shingles, num_bins=NUM_BINS):
+    """
+    One-permutation MinHash sketch of a shingle set.
+
+    A single hash is split into a bin (low bits) and a value (high bits) and
+    the minimum value is kept per bin, so the cost is one pass over the
+    shingles instead of one pass per hash function. Empty bins borrow the
+    value of the next non-empty bin (rotation densification), tagged with
+    the distance so borrowed and genuine values never collide.
+
+    Returns:
+        Tuple of num_bins ints (value and borrow distance packed together)
+    """
+    bins = [None] * num_bins
+    for h in shingles:
+        b = h % num_bins
+        value = h // num_bins
+        current = bins[b]
+        if current is None or value < current:
+            bins[b] = value
+
+    if all(v is None for v in bins):
+        return (0,) * num_bins
+
+    # Walk backwards over two laps so every empty bin sees the next filled one
+    signature = [0] * num_bins
+    value = 0
+    distance = 0
+    for b in range(2 * num_bins - 1, -1, -1):
+        current = bins[b % num_bins]
+        if current is None:
+            distance += 1
+        else:
+            value = current
+            distance = 0
+        if b < num_bins:
+            signature[b] = value * num_bins + distance
+    return tuple(signature)
+
+
+def jaccard(a, b):
+    """Exact Jaccard similarity of two sets."""
+    if not a and not b:
+        return 1.0
+    common = len(a & b)
+    return common / (len(a) + len(b) - common)
+
+
+def candidate_pairs(signatures, bands=BANDS, rows=ROWS):
+    """
+    Find pairs that share at least one LSH band.
+
+    Args:
+        signatures: List of MinHash signatures
+        bands: Number of bands
+        rows: Signature positions per band
+
+    Returns:
+        Set of (i, j) index pairs with i < j
+    """
+    pairs = set()
+    for band in range(bands):
+        buckets = {}
+        lo = band * rows
+        for i, sig in enumerate(signatures):
+            buckets.setdefault(sig[lo:lo + rows], []).append(i)
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            for x in range(len(members)):
+                for y in range(x + 1, len(members)):
+                    pairs.add((members[x], members[y]))
+    return pairs
+
+
+def find_near_duplicates(questions, threshold=DEFAULT_THRESHOLD):
+    """
+    Group questions whose shingle similarity reaches threshold.
+
+    Args:
+        questions: List of question dictionaries
+        threshold: Minimum Jaccard similarity (0-1) for two questions to be
+                   considered near-duplicates
+
+    Returns:
+        List of clusters sorted by similarity, highest first. Each cluster is
+        a dictionary with 'members' (indices into questions) and 'min' / 'max'
+        similarity over the confirmed pairs that joined it.
+    """
+    # Questions with identical shingles are grouped up front, so LSH and the
+    # exact checks only run over distinct texts
+    groups = {}
+    for i, q in enumerate(questions):
+        groups.setdefault(frozenset(shingle_set(normalized_words(q))), []).append(i)
+    shingles = list(groups)
+    members_of = list(groups.values())
+    signatures = [minhash_signature(s) for s in shingles]
+
+    parent = list(range(len(questions)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i, j):
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[root_j] = root_i
+
+    edges = []
+    for members in members_of:
+        for other in members[1:]:
+            edges.append((members[0], other, 1.0))
+            union(members[0], other)
+
+    for a, b in candidate_pairs(signatures):
+        score = jaccard(shingles[a], shingles[b])
+        if score >= threshold:
+            i, j = members_of[a][0], members_of[b][0]
+            edges.append((i, j, score))
+            union(i, j)
+
+    clusters = {}
+    for i, j, score in edges:
+        cluster = clusters.setdefault(find(i), {"members": set(), "min": 1.0, "max": 0.0})
+        cluster["members"].update((i, j))
+        cluster["min"] = min(cluster["min"], score)
+        cluster["max"] = max(cluster["max"], score)
+
+    result = [
+        {"members": sorted(c["members"]), "min": c["min"], "max": c["max"]}
+        for c in clusters.values()
+    ]
+    result.sort(key=lambda c: (-c["max"], -len(c["members"]), c["members"][0]))
+    return result
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+prefork.py
+Pre-forking supervisor behind `run_server.py --workers N`.
+
+One Python process parses every request and compresses every body on a
+single core. Here the master process binds the port and forks N workers,
+each running the normal threaded or asyncio server:
+
+  - With SO_REUSEPORT (Linux, the BSDs, macOS) every worker opens its own
+    listening socket on the port, and the kernel spreads new connections
+    across them. The master's socket only holds the port and never listens.
+  - Without it, the master listens and the workers share that one socket,
+    taking turns to accept.
+
+The master itself serves nothing. It restarts workers that die, and it turns
+signals into graceful stops and restarts:
+
+  SIGTERM / SIGINT   stop: every worker stops accepting, finishes the
+                     requests it is answering and exits
+  SIGHUP             rolling restart: one worker at a time, a replacement is
+                     forked and listening before the old worker is stopped,
+                     so the port keeps answering throughout
+
+Workers raise those signals themselves when they get
+GET /__run_local_shutdown__ (stop) or /__run_local_shutdown__?restart.
+Restarted workers come from the master's memory image: caches and
+upstream connections start fresh, but changed Python code needs a full
+restart.
+
+os.fork() is required, so there are no workers on Windows.
+
+Usage:
+    python run_server.py --workers 4 [--async]
+    curl 'http://localhost:4000/__run_local_shutdown__?restart'
+"""
+
+import os
+import sys
+import time
+import select
+import signal
+import socket
+import traceback
+
+# Seconds a worker gets to finish its requests after SIGTERM before SIGKILL
+GRACE_SECONDS = 10.0
+# Seconds a new worker gets to start listening
+READY_TIMEOUT = 10.0
+# A worker exiting this soon after it started counts as a crash on startup
+CRASH_WINDOW = 2.0
+# Give up after this many crashes on startup in a row
+MAX_CRASHES = 5
+LISTEN_BACKLOG = 128
+
+
+def can_prefork():
+    return hasattr(os, 'fork')
+
+
+def signal_supervisor(restart=False):
+    """Ask the master of this worker to stop every worker, or to restart them."""
+    os.kill(os.getppid(), signal.SIGHUP if restart else signal.SIGTERM)
+
+
+def bind_socket(port, reuse_port):
+    """A TCP socket bound to port on all interfaces, not yet listening."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(('', port))
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+class Supervisor:
+    """Forks the workers, replaces the ones that die, and stops or restarts them on signals."""
+
+    def __init__(self, workers, serve, reuse_port=None):
+        """
+        Args:
+            workers: Number of worker processes
+            serve: Called in each worker with its listening socket; returns
+                   once the worker has stopped after SIGTERM
+            reuse_port: Give every worker its own SO_REUSEPORT socket
+                        (default: wherever the platform has SO_REUSEPORT)
+        """
+        self.workers = workers
+        self.serve = serve
+        self.reuse_port = hasattr(socket, 'SO_REUSEPORT') if reuse_port is None else reuse_port
+        self.sock = None
+        self.port = None
+        # pid -> monotonic start time of the current workers
+        self.pids = {}
+        self.crashes = 0
+        self._stopping = False
+        self._restart = False
+
+    def bind(self, port):
+        """Claim port; raises OSError when it is taken."""
+        self.sock = bind_socket(port, self.reuse_port)
+        if not self.reuse_port:
+            self.sock.listen(LISTEN_BACKLOG)
+        self.port = port
+
+    # -- workers ---------------------------------------------------------------
+
+    def _spawn(self):
+        """Fork a worker and wait until it is listening; returns (pid, ready)."""
+        read_fd, write_fd = os.pipe()
+        # Anything still buffered would otherwise be printed by the child too
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            code = 0
+            try:
+                # Ctrl+C reaches the whole process group; the master decides what happens
+                signal.signal(signal.SIGINT, signal.SIG_IGN)
+                signal.signal(signal.SIGHUP, signal.SIG_IGN)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                if self.reuse_port:
+                    self.sock.close()
+                    sock = bind_socket(self.port, True)
+                    sock.listen(LISTEN_BACKLOG)
+                else:
+                    sock = self.sock
+                os.write(write_fd, b'1')
+                os.close(write_fd)
+                self.serve(sock)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+
+        os.close(write_fd)
+        try:
+            ready = bool(select.select([read_fd], [], [], READY_TIMEOUT)[0]) and os.read(read_fd, 1) == b'1'
+        finally:
+            os.close(read_fd)
+        self.pids[pid] = time.monotonic()
+        return pid, ready
+
+    def _terminate(self, pids):
+        """SIGTERM pids and wait for them, SIGKILLing any still running after GRACE_SECONDS."""
+        remaining = set(pids)
+        for pid in remaining:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + GRACE_SECONDS
+        while remaining:
+            for pid in list(remaining):
+                try:
+                    done, _ = os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    done = pid
+                if done:
+                    remaining.discard(pid)
+            if remaining and time.monotonic() >= deadline:
+                print(f'Workers {sorted(remaining)} did not stop in {GRACE_SECONDS:.0f}s; killing them')
+                for pid in remaining:
+                    try:
+                        os.kill(pid, signal.SIGKILL)
+                        os.waitpid(pid, 0)
+                    except (ProcessLookupError, ChildProcessError):
+                        pass
+                return
+            time.sleep(0.05)
+
+    def _reap(self):
+        """Collect exited workers and start replacements."""
+        while self.pids:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            started = self.pids.pop(pid, None)
+            if started is None or self._stopping:
+                continue
+            code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+            self.crashes = self.crashes + 1 if time.monotonic() - started < CRASH_WINDOW else 0
+            if self.crashes >= MAX_CRASHES:
+                print(f'Workers exited on startup {self.crashes} times in a row; stopping')
+                self._stopping = True
+                return
+            print(f'Worker {pid} exited ({code}); starting a replacement')
+            self._spawn()
+
+    def _rolling_restart(self):
+        print(f'Restarting {len(self.pids)} workers')
+        for old in list(self.pids):
+            pid, ready = self._spawn()
+            if not ready:
+                print(f'Replacement worker {pid} did not start listening; keeping the running workers')
+                self.pids.pop(pid, None)
+                self._terminate([pid])
+                return
+            self.pids.pop(old, None)
+            self._terminate([old])
+        print('Workers restarted')
+
+    # -- master loop -----------------------------------------------------------
+
+    def _on_stop(self, signum, frame):
+        self._stopping = True
+
+    def _on_restart(self, signum, frame):
+        self._restart = True
+
+    def run(self):
+        """Fork the workers and supervise them until SIGTERM or SIGINT."""
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_restart)
+        try:
+            for _ in range(self.workers):
+                self._spawn()
+            while not self._stopping:
+                if self._restart:
+                    self._restart = False
+                    self._rolling_restart()
+                self._reap()
+                time.sleep(0.2)
+        finally:
+            print('\nStopping workers...')
+            self._terminate(list(self.pids))
+            self.pids.clear()
+            self.sock.close()
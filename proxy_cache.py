@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+proxy_cache.py
+In-process LRU/TTL cache with request coalescing for run_server.py's
+read-only /proxy GETs (getLeaderboard and friends).
+
+Every open tab polls the leaderboard once per heartbeat. With the cache, the
+first request in a TTL window goes upstream and the rest are answered from
+memory; requests that arrive while that first call is still in flight wait
+for it instead of starting their own, so N clients cost one upstream call per
+window instead of N.
+
+Only complete 200 responses are stored. Entries expire after `ttl` seconds
+and the least recently used ones are evicted when either `max_entries` or
+`max_bytes` is exceeded.
+
+The asyncio server (async_server.py) shares the same store and counters
+through get_or_load_async(), where waiting requests await a future instead of
+blocking a thread.
+
+Usage:
+    cache = ProxyCache(ttl=30)
+    response, outcome = cache.get_or_load(url, load_from_upstream)
+    # outcome is 'hit', 'miss' or 'coalesced'; cache.snapshot() has the counters
+"""
+
+import time
+import asyncio
+import threading
+from collections import OrderedDict, namedtuple
+
+# status: int, headers: list of (name, value), body: bytes
+CachedResponse = namedtuple('CachedResponse', 'status headers body')
+
+
+class _Flight:
+    """An upstream load in progress that other requests can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class ProxyCache:
+    """Thread-safe LRU/TTL response cache that coalesces concurrent misses."""
+
+    def __init__(self, ttl=30.0, max_entries=64, max_bytes=16 * 1024 * 1024, max_entry_bytes=None):
+        """
+        Args:
+            ttl: Seconds a stored response is served before it is refetched
+            max_entries: Most responses kept at once
+            max_bytes: Most body bytes kept at once
+            max_entry_bytes: Larger responses are passed through but not stored
+                             (default: a quarter of max_bytes)
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else max_bytes // 4
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._async_flights = {}
+        self._bytes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'stored': 0,
+                      'expired': 0, 'evicted': 0, 'uncacheable': 0, 'errors': 0}
+
+    def _lookup(self, key, now):
+        """Return a fresh stored response for key, or None. Caller holds the lock."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        response, expires = entry
+        if expires <= now:
+            self._remove(key)
+            self.stats['expired'] += 1
+            return None
+        self._entries.move_to_end(key)
+        return response
+
+    def _remove(self, key):
+        response, _ = self._entries.pop(key)
+        self._bytes -= len(response.body)
+
+    def _store(self, key, response, now):
+        """Store response under key and evict down to the limits. Caller holds the lock."""
+        if response.status != 200 or len(response.body) > self.max_entry_bytes:
+            self.stats['uncacheable'] += 1
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (response, now + self.ttl)
+        self._bytes += len(response.body)
+        self.stats['stored'] += 1
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.stats['evicted'] += 1
+
+    def get_or_load(self, key, loader):
+        """
+        Return the response for key, calling loader() at most once at a time.
+
+        Args:
+            key: Cache key (the upstream URL)
+            loader: Function returning a CachedResponse; called only on a miss
+
+        Returns:
+            Tuple of (CachedResponse, 'hit' | 'miss' | 'coalesced')
+
+        Raises:
+            Whatever loader() raised, in the caller that ran it and in every
+            request that was waiting on it
+        """
+        with self._lock:
+            response = self._lookup(key, time.monotonic())
+            if response is not None:
+                self.stats['hits'] += 1
+                return response, 'hit'
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.stats['misses'] += 1
+            else:
+                self.stats['coalesced'] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.response, 'coalesced'
+
+        try:
+            flight.response = loader()
+        except BaseException as e:
+            flight.error = e
+            with self._lock:
+                self.stats['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                if flight.response is not None:
+                    self._store(key, flight.response, time.monotonic())
+            flight.done.set()
+        return flight.response, 'miss'
+
+    async def get_or_load_async(self, key, loader):
+        """
+        Coroutine version of get_or_load() for the asyncio server.
+
+        Args:
+            key: Cache key (the upstream URL)
+            loader: Coroutine function returning a CachedResponse
+
+        Returns:
+            Tuple of (CachedResponse, 'hit' | 'miss' | 'coalesced')
+        """
+        with self._lock:
+            response = self._lookup(key, time.monotonic())
+            if response is not None:
+                self.stats['hits'] += 1
+                return response, 'hit'
+            flight = self._async_flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._async_flights[key] = asyncio.get_running_loop().create_future()
+                self.stats['misses'] += 1
+            else:
+                self.stats['coalesced'] += 1
+
+        if not leader:
+            # shield() so one waiter giving up does not cancel the load for the others
+            return await asyncio.shield(flight), 'coalesced'
+
+        try:
+            response = await loader()
+        except BaseException as e:
+            with self._lock:
+                del self._async_flights[key]
+                self.stats['errors'] += 1
+            if isinstance(e, asyncio.CancelledError):
+                flight.cancel()
+            else:
+                flight.set_exception(e)
+                # Mark the exception retrieved in case nobody was waiting
+                flight.exception()
+            raise
+        with self._lock:
+            del self._async_flights[key]
+            self._store(key, response, time.monotonic())
+        flight.set_result(response)
+        return response, 'miss'
+
+    def clear(self):
+        """Drop every stored response."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def snapshot(self):
+        """Copy of the counters plus current size."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+            stats['in_flight'] = len(self._flights) + len(self._async_flights)
+        return stats
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+Shared Question Bank Loader for GES Promotion Quiz Application
+
+One place that discovers, reads and parses the JSON sets in
+default-questions/. Every file is read and parsed exactly once; raw control
+characters inside strings are tolerated, and a file that still fails to
+parse is reported in its set entry instead of aborting the whole load.
+
+The result is a compact in-memory QuestionBank that build_bank.py,
+find_duplicates.py, search_index.py and future tooling share instead of each
+re-reading the corpus.
+
+Large sets can be parsed in a process pool (workers > 1); results are merged
+in client load order, so the bank is identical to a serial load.
+
+Usage:
+    python question_bank.py [--source default-questions] [--workers N]
+"""
+
+import os
+import re
+import sys
+import json
+import hashlib
+import argparse
+from pathlib import Path
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+# Get the script directory
+SCRIPT_DIR = Path(__file__).parent.absolute()
+DEFAULT_SOURCE_DIR = SCRIPT_DIR / "default-questions"
+
+SET_NAME_PATTERN = re.compile(r"^set(\d+)\.json$", re.IGNORECASE)
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def set_sort_key(path):
+    """
+    Sort key that orders setN.json numerically, the way the client loads them.
+
+    Files that do not follow the setN.json pattern are placed after the
+    numbered sets, in alphabetical order.
+    """
+    match = SET_NAME_PATTERN.match(path.name)
+    if match:
+        return (0, int(match.group(1)), path.name)
+    return (1, 0, path.name)
+
+
+def discover_sets(source_dir):
+    """
+    Find all question set files in a directory.
+
+    Args:
+        source_dir: Directory containing the JSON question sets
+
+    Returns:
+        List of Paths in client load order
+    """
+    source_dir = Path(source_dir)
+    if not source_dir.is_dir():
+        return []
+    return sorted(source_dir.glob("*.json"), key=set_sort_key)
+
+
+def is_valid_question(item):
+    """Mirror of isValidQuestion() in index.html."""
+    return (
+        isinstance(item, dict)
+        and isinstance(item.get("question"), str)
+        and isinstance(item.get("options"), dict)
+        and isinstance(item.get("answer"), str)
+        and isinstance(item.get("explanation"), str)
+    )
+
+
+def question_hash(q):
+    """
+    Mirror of createQuestionHash() in index.html.
+
+    Produces the same string as JSON.stringify() of the core fields, so keys
+    computed here match the ones the browser uses for seenHashes.
+    """
+    core = {
+        "question": q.get("question"),
+        "options": q.get("options"),
+        "answer": q.get("answer"),
+        "explanation": q.get("explanation"),
+    }
+    return json.dumps(core, ensure_ascii=False, separators=(",", ":"))
+
+
+def question_digest(q, q_hash=None):
+    """
+    Short, stable fingerprint of question_hash(), used to identify a question.
+
+    Pass q_hash when it has already been computed to avoid serializing twice.
+    """
+    key = q_hash if q_hash is not None else question_hash(q)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+
+def parse_set_text(text):
+    """
+    Parse a top-level JSON array, recording where each element starts.
+
+    Elements are decoded one at a time with raw_decode(), so the offsets come
+    for free from the parse itself instead of searching the text afterwards.
+
+    Args:
+        text: File contents
+
+    Returns:
+        Tuple of (decoded value, list of 1-indexed start lines or None if the
+        value is not an array)
+
+    Raises:
+        json.JSONDecodeError: If the text is not valid JSON
+    """
+    decoder = json.JSONDecoder(strict=False)
+    pos = WHITESPACE.match(text, 0).end()
+    if text[pos:pos + 1] != "[":
+        return decoder.decode(text), None
+
+    items = []
+    lines = []
+    line = 1
+    last = 0
+    pos = WHITESPACE.match(text, pos + 1).end()
+    if text[pos:pos + 1] != "]":
+        while True:
+            item, end = decoder.raw_decode(text, pos)
+            line += text.count("\n", last, pos)
+            last = pos
+            items.append(item)
+            lines.append(line)
+
+            pos = WHITESPACE.match(text, end).end()
+            char = text[pos:pos + 1]
+            if char == "]":
+                break
+            if char != ",":
+                raise json.JSONDecodeError("Expecting ',' delimiter", text, pos)
+            pos = WHITESPACE.match(text, pos + 1).end()
+
+    pos = WHITESPACE.match(text, pos + 1).end()
+    if pos != len(text):
+        raise json.JSONDecodeError("Extra data", text, pos)
+    return items, lines
+
+
+def load_set(path):
+    """
+    Parse one question set.
+
+    Raw control characters inside strings are tolerated (strict=False);
+    anything else that is not a JSON array is reported as an error.
+
+    Args:
+        path: Path to the JSON file
+
+    Returns:
+        Tuple of (list of items, list of start lines, error message or None)
+    """
+    try:
+        with open(path, "r", encoding="utf-8-sig") as f:
+            text = f.read()
+    except (OSError, UnicodeDecodeError) as e:
+        return [], [], str(e)
+    return parse_set_items(text)
+
+
+def parse_set_items(text):
+    """Parse set text into (items, start lines, error message or None)."""
+    try:
+        data, lines = parse_set_text(text.lstrip("\ufeff"))
+    except json.JSONDecodeError as e:
+        return [], [], str(e)
+
+    if lines is None:
+        return [], [], "top-level value is not an array"
+    return data, lines, None
+
+
+class Question(namedtuple("Question", "file index line id question options answer explanation")):
+    """One question as it appears in its source set, plus where it came from."""
+
+    __slots__ = ()
+
+    def get(self, key, default=None):
+        """Dictionary-style access, so a Question can stand in for a raw set item."""
+        return getattr(self, key) if key in self._fields else default
+
+    def is_valid(self):
+        """Same check as isValidQuestion() in index.html."""
+        return (
+            isinstance(self.question, str)
+            and isinstance(self.options, dict)
+            and isinstance(self.answer, str)
+            and isinstance(self.explanation, str)
+        )
+
+    def core(self):
+        """The fields that define a question's identity, as a dictionary."""
+        return {
+            "question": self.question,
+            "options": self.options,
+            "answer": self.answer,
+            "explanation": self.explanation,
+        }
+
+    def to_dict(self):
+        """The question in the on-disk set format."""
+        return {"id": self.id, **self.core()}
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def questions_from_items(items, lines, rel_path):
+    """
+    Convert parsed set items into Question records.
+
+    Option texts and answer letters repeat heavily across sets, so they are
+    interned to keep the in-memory bank small.
+
+    Returns:
+        Tuple of (list of Questions, number of items that were not objects)
+    """
+    questions = []
+    non_objects = 0
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            non_objects += 1
+            continue
+        options = item.get("options")
+        if isinstance(options, dict):
+            options = {_intern(k): _intern(v) for k, v in options.items()}
+        questions.append(Question(
+            rel_path,
+            index,
+            lines[index],
+            item.get("id"),
+            item.get("question"),
+            options,
+            _intern(item.get("answer")),
+            item.get("explanation"),
+        ))
+    return questions, non_objects
+
+
+class QuestionBank:
+    """All questions from every set, in client load order, plus per-set reports."""
+
+    def __init__(self, questions=None, sets=None):
+        self.questions = questions or []
+        self.sets = sets or []
+
+    def __len__(self):
+        return len(self.questions)
+
+    def __iter__(self):
+        return iter(self.questions)
+
+    @property
+    def errors(self):
+        """Set reports for files that could not be read or parsed."""
+        return [s for s in self.sets if s["error"]]
+
+    def set_questions(self, set_report):
+        """The questions that came from one set, in file order."""
+        return self.questions[set_report["start"]:set_report["end"]]
+
+
+def relative_name(path, base_dir):
+    """Path of a set relative to base_dir, in the form the client uses."""
+    try:
+        return Path(path).relative_to(base_dir).as_posix()
+    except ValueError:
+        return Path(path).name
+
+
+def resolve_workers(workers):
+    """
+    Turn a --workers value into a process count.
+
+    None or 1 means serial, 0 means one worker per CPU.
+    """
+    if workers is None:
+        return 1
+    if workers == 0:
+        return os.cpu_count() or 1
+    return max(1, workers)
+
+
+def map_in_order(func, args, workers=1):
+    """
+    Apply func to every item of args, in a process pool when workers > 1.
+
+    Results come back in the order of args regardless of which worker
+    finished first. func must be a module-level function so it can be
+    pickled.
+
+    Args:
+        func: Function taking one argument
+        args: List of arguments
+        workers: Process count (see resolve_workers())
+
+    Returns:
+        List of results
+    """
+    workers = min(resolve_workers(workers), len(args))
+    if workers <= 1:
+        return [func(arg) for arg in args]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(func, args))
+
+
+def load_set_questions(job):
+    """
+    Read, parse and normalize one set; the unit of work for load_bank().
+
+    Args:
+        job: Tuple of (path, path relative to the base directory)
+
+    Returns:
+        Tuple of (list of Questions, number of non-object items, error or None)
+    """
+    path, rel_path = job
+    items, lines, error = load_set(path)
+    questions, non_objects = questions_from_items(items, lines, rel_path)
+    return questions, non_objects, error
+
+
+def load_bank(source_dir=None, base_dir=None, workers=1):
+    """
+    Read and parse every set exactly once.
+
+    Args:
+        source_dir: Directory containing the JSON question sets
+        base_dir: Directory that set paths are reported relative to
+                  (defaults to the parent of source_dir)
+        workers: Parse sets in this many processes (0 = one per CPU)
+
+    Returns:
+        QuestionBank. Each entry of bank.sets has 'file', 'path', 'start' and
+        'end' (slice of bank.questions), 'non_objects' and 'error'.
+    """
+    source_dir = Path(source_dir or DEFAULT_SOURCE_DIR)
+    base_dir = Path(base_dir) if base_dir else source_dir.parent
+    bank = QuestionBank()
+
+    jobs = [(path, relative_name(path, base_dir)) for path in discover_sets(source_dir)]
+    results = map_in_order(load_set_questions, jobs, workers)
+
+    for (path, rel_path), (questions, non_objects, error) in zip(jobs, results):
+        bank.sets.append({
+            "file": rel_path,
+            "path": path,
+            "start": len(bank.questions),
+            "end": len(bank.questions) + len(questions),
+            "non_objects": non_objects,
+            "error": error,
+        })
+        bank.questions.extend(questions)
+
+    return bank
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the question bank and report per-file problems")
+    parser.add_argument(
+        "--source",
+        default=str(DEFAULT_SOURCE_DIR),
+        help="Directory containing setN.json files (default: default-questions)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Parse sets in N processes, 0 for one per CPU (default: 1)"
+    )
+    args = parser.parse_args()
+
+    bank = load_bank(args.source, workers=args.workers)
+    for s in bank.sets:
+        status = f"ERROR: {s['error']}" if s["error"] else "ok"
+        print(f"  {s['file']:<32} {s['end'] - s['start']:>5} questions  {status}")
+    print(f"\nLoaded {len(bank)} questions from {len(bank.sets)} set(s), {len(bank.errors)} with errors")
+
+
+if __name__ == "__main__":
+    main()
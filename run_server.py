@@ -24,10 +24,84 @@ import threading
 import time
 import subprocess
 import sys
+import json
+import shutil
+import signal
+import tempfile
+
+from appscript_backend import AppsScriptBackend, parse_params
+from proxy_cache import CachedResponse, ProxyCache
+from prefork import Supervisor, can_prefork, signal_supervisor
+from server_metrics import PROMETHEUS_CONTENT_TYPE, PUBLISH_INTERVAL, Profiler, ServerMetrics, route_for
+from static_assets import CachedBody, StaticAssets, precompress_tree
+from upstream_pool import UpstreamPool
+
+DEFAULT_APPSCRIPT_URL = 'https://script.google.com/macros/s/AKfycbzgf6NXFQoIPWlw7Py2TmzFo0DuQD1mci1QfgFAL8eN4wE7N8b3LFBO2gmKqE46Gt07/exec'
+
+# Headers that describe one hop only and must not be copied from the upstream
+# response to the browser (the upstream connection is keep-alive, ours is not)
+HOP_BY_HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailer', 'transfer-encoding', 'upgrade',
+}
+
+# Upstream headers never stored in the proxy cache: send_response() adds a
+# fresh Date and Server, the length is recomputed, and a cookie set for one
+# client must not be handed to everyone who gets the cached copy
+UNCACHED_HEADERS = {'content-length', 'date', 'server', 'set-cookie'}
+
+# Proxy responses are relayed to the browser in pieces of at most this size
+RELAY_CHUNK_SIZE = 64 * 1024
+
+# Read-only Apps Script actions whose GET responses may be cached and shared
+CACHEABLE_PROXY_ACTIONS = {'getLeaderboard'}
 
 
 class CORSRequestHandler(SimpleHTTPRequestHandler):
     """Simple HTTP handler that adds CORS headers to responses."""
+    # Shared keep-alive pool for /proxy calls; None falls back to one urlopen per request
+    upstream_pool = None
+    upstream_timeout = 15
+    # Cache for read-only proxy GETs; None sends every request upstream
+    proxy_cache = None
+    # In-process stand-in for the Apps Script (appscript_backend.py); None forwards upstream
+    local_backend = None
+    # Precompressed variants, ETags, Cache-Control and in-memory bodies for static files
+    static_assets = StaticAssets()
+    # Send files too large for the static cache with socket.sendfile() instead of copying them through Python
+    use_sendfile = hasattr(os, 'sendfile')
+    # Request counters and latency histograms for /__metrics__; None turns them off
+    metrics = None
+    # cProfile / stack sampling toggled through /__profile__, and the slow-request log
+    profiler = Profiler()
+    # Set in --workers processes: called with restart=True/False instead of stopping this process alone
+    shutdown_hook = None
+
+    def parse_request(self):
+        # Timing starts once the request line is in, so idle keep-alive time is not counted
+        self._request_started = time.perf_counter()
+        self._status = None
+        if self.metrics is not None:
+            self.metrics.request_started()
+        self._profile = self.profiler.begin_request()
+        return super().parse_request()
+
+    def handle_one_request(self):
+        self._request_started = None
+        try:
+            super().handle_one_request()
+        finally:
+            if self._request_started is not None:
+                seconds = time.perf_counter() - self._request_started
+                path = getattr(self, 'path', '')
+                if self.metrics is not None:
+                    self.metrics.request_finished(route_for(path), self.command, self._status, seconds)
+                self.profiler.end_request(self._profile, self.command, path, self._status, seconds)
+
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+
     def end_headers(self):
         # Allow cross-origin requests (helpful when testing fetch/XHR in the browser)
         self.send_header('Access-Control-Allow-Origin', '*')
@@ -39,35 +113,173 @@ class CORSRequestHandler(SimpleHTTPRequestHandler):
         self.send_response(204)
         self.end_headers()
 
+    def send_head(self):
+        """Static GET/HEAD with precompressed variants, strong ETags and 304s."""
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            index = next((os.path.join(path, name) for name in ('index.html', 'index.htm')
+                          if os.path.isfile(os.path.join(path, name))), None)
+            if index is None or not urllib.parse.urlsplit(self.path).path.endswith('/'):
+                # Trailing-slash redirects and directory listings stay as they were
+                return super().send_head()
+            path = index
+        if path.endswith('/'):
+            self.send_error(404, 'File not found')
+            return None
+        try:
+            static = self.static_assets.open(path, self.headers.get('Accept-Encoding'),
+                                             self.headers.get('If-None-Match'),
+                                             self.headers.get('If-Modified-Since'))
+        except OSError:
+            self.send_error(404, 'File not found')
+            return None
+        self.send_response(static.status)
+        for k, v in static.headers:
+            self.send_header(k, v)
+        self.end_headers()
+        return static.file
+
+    def copyfile(self, source, outputfile):
+        if isinstance(source, CachedBody):
+            outputfile.write(source.data)
+        elif self.use_sendfile and outputfile is self.wfile:
+            # Falls back to plain sends where the socket does not support sendfile
+            self.connection.sendfile(source)
+        else:
+            super().copyfile(source, outputfile)
+
+    def _open_upstream(self, url, method='GET', body=None, headers=None, timeout=None):
+        """Send a request upstream through the pool (or urlopen without one); returns the response."""
+        if self.upstream_pool is not None:
+            return self.upstream_pool.request(method, url, body=body, headers=headers)
+        req = urllib.request.Request(url, data=body, method=method, headers=headers or {})
+        return urllib.request.urlopen(req, timeout=timeout or self.upstream_timeout)
+
+    def _relay_response(self, resp, status=None, header_names=None):
+        """
+        Send resp to the client, streaming the body as it arrives.
+
+        The upstream Content-Length is passed through when known; otherwise the
+        body is delimited by closing the connection, as this handler speaks
+        HTTP/1.0. Only RELAY_CHUNK_SIZE bytes are held in memory at a time,
+        whatever the size of the response.
+        """
+        self.send_response(status or resp.getcode())
+        length = None
+        for k, v in resp.getheaders():
+            name = k.lower()
+            if name in HOP_BY_HOP_HEADERS:
+                continue
+            if header_names is not None and name not in header_names:
+                continue
+            if name == 'content-length':
+                length = v
+                continue
+            self.send_header(k, v)
+
+        if length is not None:
+            self.send_header('Content-Length', length)
+        else:
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        # Ensure CORS
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self._relay_started = True
+
+        while True:
+            chunk = resp.read1(RELAY_CHUNK_SIZE)
+            if not chunk:
+                break
+            self.wfile.write(chunk)
+
+    def _is_cacheable(self, target_url):
+        if self.proxy_cache is None or self.command != 'GET':
+            return False
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(target_url).query)
+        return any(action in CACHEABLE_PROXY_ACTIONS for action in query.get('action', []))
+
+    def _serve_cached(self, target_url, status=None, header_names=None):
+        """Answer from the proxy cache, loading target_url upstream once if needed."""
+        def load():
+            headers = {h: self.headers[h] for h in ('User-Agent', 'Accept') if h in self.headers}
+            with self._open_upstream(target_url, 'GET', None, headers) as resp:
+                kept = [(k, v) for k, v in resp.getheaders()
+                        if k.lower() not in HOP_BY_HOP_HEADERS and k.lower() not in UNCACHED_HEADERS]
+                return CachedResponse(resp.getcode(), kept, resp.read())
+
+        response, outcome = self.proxy_cache.get_or_load(target_url, load)
+        self.send_response(status or response.status)
+        for k, v in response.headers:
+            if header_names is None or k.lower() in header_names:
+                self.send_header(k, v)
+        self.send_header('Content-Length', str(len(response.body)))
+        self.send_header('X-Proxy-Cache', outcome.upper())
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(response.body)
+
+    def _send_json(self, payload):
+        self._send_text(json.dumps(payload, indent=2), 'application/json')
+
+    def _send_text(self, text, content_type):
+        data = text.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(data)
+
+    @classmethod
+    def _metric_sections(cls):
+        """Counters exported alongside the request metrics on /__metrics__."""
+        return {
+            'proxy_cache': cls.proxy_cache.snapshot() if cls.proxy_cache else None,
+            'upstream': cls.upstream_pool.snapshot() if cls.upstream_pool else None,
+            'static': cls.static_assets.snapshot(),
+            'backend': cls.local_backend.snapshot() if cls.local_backend else None,
+        }
+
+    def _serve_local_backend(self, target_url):
+        """Answer a /proxy call from local_backend instead of the Apps Script."""
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length > 0 else None
+        params = parse_params(urllib.parse.urlsplit(target_url).query, body, self.headers.get('Content-Type'))
+        data = json.dumps(self.local_backend.handle(params)).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
     def _proxy_forward(self, target_url):
         """Forward the current request to target_url and stream response back to client."""
+        if self.local_backend is not None:
+            return self._serve_local_backend(target_url)
+        self._relay_started = False
         try:
+            if self._is_cacheable(target_url):
+                return self._serve_cached(target_url)
+
             length = int(self.headers.get('Content-Length', 0))
             body = self.rfile.read(length) if length > 0 else None
 
-            req = urllib.request.Request(target_url, data=body, method=self.command)
             # Copy selected headers
-            for h in ('Content-Type', 'User-Agent', 'Accept'):
-                if h in self.headers:
-                    req.add_header(h, self.headers[h])
-
-            with urllib.request.urlopen(req, timeout=15) as resp:
-                status = resp.getcode()
-                data = resp.read()
-                self.send_response(status)
-                # Copy response headers (but do not copy transfer-encoding)
-                for k, v in resp.getheaders():
-                    if k.lower() == 'transfer-encoding':
-                        continue
-                    self.send_header(k, v)
-                # Ensure CORS
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(data)
+            headers = {h: self.headers[h] for h in ('Content-Type', 'User-Agent', 'Accept') if h in self.headers}
+
+            with self._open_upstream(target_url, self.command, body, headers) as resp:
+                self._relay_response(resp)
         except Exception as e:
+            if self.metrics is not None:
+                self.metrics.proxy_error(e)
             # Log full traceback to server console for easier diagnosis
             print('Proxy forwarding exception:')
             traceback.print_exc()
+            if self._relay_started:
+                # Headers are already out; all we can do is cut the response short
+                self.close_connection = True
+                return
             self.send_response(502)
             self.send_header('Content-Type', 'text/plain')
             self.send_header('Access-Control-Allow-Origin', '*')
@@ -80,7 +292,7 @@ class CORSRequestHandler(SimpleHTTPRequestHandler):
         if self.path.startswith('/proxy'):
             # forward to configured Apps Script URL
             # You can set APPSCRIPT_URL environment variable or edit below
-            target = os.environ.get('APPSCRIPT_URL') or 'https://script.google.com/macros/s/AKfycbzgf6NXFQoIPWlw7Py2TmzFo0DuQD1mci1QfgFAL8eN4wE7N8b3LFBO2gmKqE46Gt07/exec'
+            target = os.environ.get('APPSCRIPT_URL') or DEFAULT_APPSCRIPT_URL
             # If the path contains a suffix, append it
             # e.g. /proxy?action=register -> forward as is
             if self.path != '/proxy' and self.path.startswith('/proxy'):
@@ -92,12 +304,17 @@ class CORSRequestHandler(SimpleHTTPRequestHandler):
 
     def do_GET(self):
         # Special shutdown path for graceful restart: calling this will cause the server to shutdown
-        if self.path == '/__run_local_shutdown__':
+        if urllib.parse.urlsplit(self.path).path == '/__run_local_shutdown__':
             self.send_response(200)
             self.send_header('Content-Type', 'text/plain')
             self.send_header('Access-Control-Allow-Origin', '*')
             self.end_headers()
             self.wfile.write(b'OK')
+            if self.shutdown_hook is not None:
+                # A --workers worker: the master stops (or with ?restart, replaces) every worker
+                self.shutdown_hook('restart' in urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query,
+                                                                     keep_blank_values=True))
+                return
             # Shutdown in separate thread to avoid blocking current request handling
             def _shutdown_server():
                 try:
@@ -108,21 +325,41 @@ class CORSRequestHandler(SimpleHTTPRequestHandler):
                     pass
             threading.Thread(target=_shutdown_server, daemon=True).start()
             return
+        # Hit/miss/coalesce counters for the proxy cache and upstream pool
+        if self.path == '/__proxy_cache__':
+            return self._send_json({
+                'cache': self.proxy_cache.snapshot() if self.proxy_cache else None,
+                'upstream': self.upstream_pool.snapshot() if self.upstream_pool else None,
+                'static': self.static_assets.snapshot(),
+                'backend': self.local_backend.snapshot() if self.local_backend else None,
+            })
+        # Request, upstream-phase and cache metrics in the Prometheus text format
+        if self.path == '/__metrics__' and self.metrics is not None:
+            return self._send_text(self.metrics.render(self._metric_sections()), PROMETHEUS_CONTENT_TYPE)
+        # Switch the profiler on or off (?start=cprofile|sample, ?stop) and report what it collected
+        if urllib.parse.urlsplit(self.path).path == '/__profile__':
+            return self._send_text(self.profiler.handle(urllib.parse.urlsplit(self.path).query),
+                                   'text/plain; charset=utf-8')
         # Diagnostic endpoint to test server -> Apps Script connectivity
         if self.path == '/proxy_test':
-            target = os.environ.get('APPSCRIPT_URL') or 'https://script.google.com/macros/s/AKfycbzgf6NXFQoIPWlw7Py2TmzFo0DuQD1mci1QfgFAL8eN4wE7N8b3LFBO2gmKqE46Gt07/exec?action=getLeaderboard'
+            if self.local_backend is not None:
+                return self._serve_local_backend('/proxy_test?action=getLeaderboard')
+            target = os.environ.get('APPSCRIPT_URL') or f'{DEFAULT_APPSCRIPT_URL}?action=getLeaderboard'
+            self._relay_started = False
             try:
-                with urllib.request.urlopen(target, timeout=10) as resp:
-                    data = resp.read()
-                    self.send_response(200)
-                    self.send_header('Content-Type', resp.headers.get('Content-Type', 'application/json'))
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    self.wfile.write(data)
+                if self._is_cacheable(target):
+                    return self._serve_cached(target, 200, ('content-type',))
+                with self._open_upstream(target, timeout=10) as resp:
+                    self._relay_response(resp, 200, ('content-type', 'content-length'))
                     return
             except Exception as e:
+                if self.metrics is not None:
+                    self.metrics.proxy_error(e)
                 print('Proxy test failed:')
                 traceback.print_exc()
+                if self._relay_started:
+                    self.close_connection = True
+                    return
                 self.send_response(502)
                 self.send_header('Content-Type', 'text/plain')
                 self.send_header('Access-Control-Allow-Origin', '*')
@@ -130,7 +367,7 @@ class CORSRequestHandler(SimpleHTTPRequestHandler):
                 self.wfile.write(f'Proxy test error: {e}\nSee server console for details.'.encode('utf-8'))
                 return
         if self.path.startswith('/proxy'):
-            target = os.environ.get('APPSCRIPT_URL') or 'https://script.google.com/macros/s/AKfycbzgf6NXFQoIPWlw7Py2TmzFo0DuQD1mci1QfgFAL8eN4wE7N8b3LFBO2gmKqE46Gt07/exec'
+            target = os.environ.get('APPSCRIPT_URL') or DEFAULT_APPSCRIPT_URL
             if self.path != '/proxy' and self.path.startswith('/proxy'):
                 qs = self.path[len('/proxy'):]
                 target = target + qs
@@ -138,7 +375,15 @@ class CORSRequestHandler(SimpleHTTPRequestHandler):
         return super().do_GET()
 
 
-def run(port: int, directory: str, open_browser_flag: bool = True):
+# Use a threading TCPServer and allow address reuse to reduce "address already in use" issues
+class ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    # The default backlog of 5 drops connections during a burst of submissions
+    request_queue_size = 128
+
+
+def run(port: int, directory: str, open_browser_flag: bool = True, upstream_pool: UpstreamPool = None,
+        proxy_cache: ProxyCache = None):
     # Change to the target directory so SimpleHTTPRequestHandler serves files from there
     os.chdir(directory)
     proxy_proc = None
@@ -175,6 +420,8 @@ def run(port: int, directory: str, open_browser_flag: bool = True):
         except Exception as e:
             print('Error stopping proxy server:', e)
     handler = CORSRequestHandler
+    handler.upstream_pool = upstream_pool
+    handler.proxy_cache = proxy_cache
     # Attempt to politely ask an existing run_local server to shutdown (if it was running here before)
     try:
         shutdown_url = f'http://localhost:{port}/__run_local_shutdown__'
@@ -186,10 +433,6 @@ def run(port: int, directory: str, open_browser_flag: bool = True):
         # no existing server responded
         pass
 
-    # Use a threading TCPServer and allow address reuse to reduce "address already in use" issues
-    class ThreadingTCPServer(socketserver.ThreadingTCPServer):
-        allow_reuse_address = True
-
     # Try to bind to the requested port; if it fails (permission or in-use), try a small range of ports
     httpd = None
     tried_ports = []
@@ -236,11 +479,193 @@ def run(port: int, directory: str, open_browser_flag: bool = True):
                 pass
 
 
+def serve_on_socket(sock, directory, upstream_pool=None, proxy_cache=None):
+    """Serve on a listening socket from prefork.Supervisor until SIGTERM, then finish the requests in progress."""
+    os.chdir(directory)
+    handler = CORSRequestHandler
+    handler.upstream_pool = upstream_pool
+    handler.proxy_cache = proxy_cache
+    # staticmethod: a plain function stored on the class would be bound to the handler instance
+    handler.shutdown_hook = staticmethod(signal_supervisor)
+    httpd = ThreadingTCPServer(sock.getsockname()[:2], handler, bind_and_activate=False)
+    httpd.socket.close()
+    httpd.socket = sock
+    # serve_forever() has to be stopped from another thread
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=httpd.shutdown, daemon=True).start())
+
+    stopped = threading.Event()
+    metrics = handler.metrics
+    if metrics is not None and metrics.share_dir:
+        def _publish_metrics():
+            while not stopped.wait(PUBLISH_INTERVAL):
+                metrics.publish(handler._metric_sections())
+        threading.Thread(target=_publish_metrics, daemon=True).start()
+
+    # server_close() on leaving the with block waits for the request threads
+    with httpd:
+        httpd.serve_forever()
+    stopped.set()
+    if metrics is not None and metrics.share_dir:
+        metrics.publish(handler._metric_sections())
+    if upstream_pool is not None:
+        upstream_pool.close()
+
+
+def run_workers(port, directory, open_browser_flag, workers, serve_worker):
+    """Pre-fork workers that each run serve_worker(sock) on one shared port (see prefork.py)."""
+    # Attempt to politely ask an existing run_local server to shutdown (if it was running here before)
+    try:
+        urllib.request.urlopen(f'http://localhost:{port}/__run_local_shutdown__', timeout=1)
+        print('Requested existing local server to shut down...')
+        time.sleep(0.5)
+    except Exception:
+        pass
+
+    supervisor = Supervisor(workers, serve_worker)
+    tried_ports = []
+    for p in range(port, port + 11):
+        tried_ports.append(p)
+        try:
+            supervisor.bind(p)
+            break
+        except OSError as e:
+            print(f"OS error binding to port {p}: {e}")
+    if supervisor.port is None:
+        print(f"Failed to bind to any port in the range {tried_ports}.")
+        return
+
+    url = f'http://localhost:{supervisor.port}/index.html'
+    sharing = 'SO_REUSEPORT' if supervisor.reuse_port else 'one shared socket'
+    print(f"Serving directory with {workers} worker processes ({sharing}): {os.path.abspath(directory)}")
+    print(f"Open this URL in your browser: {url}")
+    if open_browser_flag:
+        try:
+            webbrowser.open(url)
+        except Exception as e:
+            print('Could not open browser automatically:', e)
+    supervisor.run()
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Serve this project locally and open index.html')
     parser.add_argument('--port', '-p', type=int, default=4000, help='Port to listen on (default: 8000)')
     parser.add_argument('--dir', '-d', default='.', help='Directory to serve (default: current directory)')
     parser.add_argument('--no-open', action='store_true', help="Don't open the browser automatically")
+    parser.add_argument('--upstream-connections', type=int, default=8,
+                        help='Keep-alive connections per upstream host for /proxy (default: 8)')
+    parser.add_argument('--connect-timeout', type=float, default=5.0,
+                        help='Seconds allowed to connect to the upstream (default: 5)')
+    parser.add_argument('--read-timeout', type=float, default=15.0,
+                        help='Seconds allowed between upstream response bytes (default: 15)')
+    parser.add_argument('--pool-timeout', type=float, default=60.0,
+                        help='Seconds a /proxy call waits for a free upstream connection when all are busy; '
+                             'never less than --read-timeout (default: 60)')
+    parser.add_argument('--no-upstream-pool', action='store_true',
+                        help='Open a new upstream connection for every /proxy call')
+    parser.add_argument('--cache-ttl', type=float, default=30.0,
+                        help='Seconds to reuse read-only /proxy GET responses such as getLeaderboard; 0 disables (default: 30)')
+    parser.add_argument('--cache-entries', type=int, default=64,
+                        help='Most /proxy responses kept in the cache (default: 64)')
+    parser.add_argument('--precompress', action='store_true',
+                        help='Write .gz (and .br with brotli installed) siblings of the static assets before serving')
+    parser.add_argument('--static-cache-mb', type=float, default=64,
+                        help='Memory for cached static files and their compressed variants in MB; 0 disables (default: 64)')
+    parser.add_argument('--no-sendfile', action='store_true',
+                        help='Copy static files through Python instead of using sendfile()')
+    parser.add_argument('--local-backend', nargs='?', const='', default=None, metavar='DIR',
+                        help='Answer /proxy with the Python Apps Script stand-in instead of APPSCRIPT_URL; '
+                             'keeps data in DIR if given, else in memory')
+    parser.add_argument('--no-metrics', action='store_true',
+                        help='Do not count requests or time upstream calls (disables /__metrics__)')
+    parser.add_argument('--slow-ms', type=float, default=1000,
+                        help='Log requests taking at least this long, shown on /__profile__ (default: 1000)')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='Serve with the asyncio engine in async_server.py instead of one thread per connection')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Pre-fork this many server processes sharing the port (see prefork.py; default: 1)')
 
     args = parser.parse_args()
-    run(args.port, args.dir, not args.no_open)
+    if args.workers > 1 and not can_prefork():
+        print('--workers needs os.fork(), which this platform does not have; serving with one process')
+        args.workers = 1
+    if args.workers > 1 and args.local_backend is not None:
+        parser.error('--local-backend keeps its users in one process and cannot be combined with --workers')
+    CORSRequestHandler.upstream_timeout = args.read_timeout
+    CORSRequestHandler.use_sendfile = CORSRequestHandler.use_sendfile and not args.no_sendfile
+    if args.precompress:
+        count, original, smallest = precompress_tree(args.dir)
+        print(f'Precompressed {count} assets: {original:,} -> {smallest:,} bytes')
+    profiler = Profiler(slow_seconds=args.slow_ms / 1000, per_request=not args.use_async)
+    CORSRequestHandler.profiler = profiler
+
+    def make_cache():
+        if args.cache_ttl > 0:
+            return ProxyCache(ttl=args.cache_ttl, max_entries=args.cache_entries)
+        return None
+
+    def make_pool(metrics):
+        if args.use_async:
+            from async_server import AsyncUpstreamPool
+            # The async engine always goes through its pool; idle_timeout=0 closes each connection after use
+            return AsyncUpstreamPool(max_per_host=args.upstream_connections,
+                                     connect_timeout=args.connect_timeout,
+                                     read_timeout=args.read_timeout,
+                                     pool_timeout=args.pool_timeout,
+                                     idle_timeout=0 if args.no_upstream_pool else 60.0,
+                                     metrics=metrics)
+        if args.no_upstream_pool:
+            return None
+        return UpstreamPool(max_per_host=args.upstream_connections,
+                            connect_timeout=args.connect_timeout,
+                            read_timeout=args.read_timeout,
+                            pool_timeout=args.pool_timeout,
+                            metrics=metrics)
+
+    def make_static_assets():
+        return StaticAssets(max_cache_bytes=int(args.static_cache_mb * 1024 * 1024))
+
+    if args.workers > 1:
+        # Workers publish their metrics here so /__metrics__ on any of them covers all
+        share_dir = None if args.no_metrics else tempfile.mkdtemp(prefix='run_server_metrics_')
+        directory = os.path.abspath(args.dir)
+
+        def serve_worker(sock):
+            # Locks, caches and upstream connections are created after the fork, one set per worker
+            metrics = None if args.no_metrics else ServerMetrics(share_dir=share_dir)
+            CORSRequestHandler.metrics = metrics
+            static_assets = make_static_assets()
+            if args.use_async:
+                from async_server import serve_socket_async
+                serve_socket_async(sock, directory, upstream_pool=make_pool(metrics), proxy_cache=make_cache(),
+                                   static_assets=static_assets, use_sendfile=not args.no_sendfile,
+                                   metrics=metrics, profiler=profiler, shutdown_hook=signal_supervisor)
+            else:
+                CORSRequestHandler.static_assets = static_assets
+                serve_on_socket(sock, directory, make_pool(metrics), make_cache())
+
+        try:
+            run_workers(args.port, args.dir, not args.no_open, args.workers, serve_worker)
+        finally:
+            if share_dir:
+                shutil.rmtree(share_dir, ignore_errors=True)
+    else:
+        static_assets = make_static_assets()
+        CORSRequestHandler.static_assets = static_assets
+        cache = make_cache()
+        metrics = None if args.no_metrics else ServerMetrics()
+        CORSRequestHandler.metrics = metrics
+        pool = make_pool(metrics)
+        backend = None
+        if args.local_backend is not None:
+            backend = AppsScriptBackend(args.local_backend or None)
+            CORSRequestHandler.local_backend = backend
+            print(f"Answering /proxy with the local Apps Script backend ({args.local_backend or 'in memory'})")
+        if args.use_async:
+            from async_server import run_async
+            run_async(args.port, args.dir, not args.no_open, pool, cache, static_assets, not args.no_sendfile, backend,
+                      metrics=metrics, profiler=profiler)
+        else:
+            run(args.port, args.dir, not args.no_open, pool, cache)
+        profiler.stop()
+        if backend is not None:
+            backend.close()
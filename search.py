@@ -3,31 +3,97 @@
 Search Script for GES Promotion Quiz Application
 Searches through all JSON files in default-questions folder and index.html
 for a user-specified phrase and returns filenames and line numbers.
+
+Queries are answered from the persistent index in search_index.py, which is
+refreshed automatically when a file's mtime or size changes. Use --no-index
+to fall back to scanning every file.
+
+With --field, the question sets are searched by field (question, options,
+option:X, answer or explanation) and each hit is reported as the file,
+index and id of the question instead of a bare line number.
+
+Batch mode applies a list of find/replace rules (a JSON/CSV rules file or
+--replace FIND REPLACE arguments) in memory and writes each touched file
+once, atomically. --dry-run prints a unified diff instead of writing.
+
+Usage:
+    python search.py [phrase] [--no-index] [--rebuild-index] [--workers N]
+    python search.py [phrase] --field question|options|option:X|answer|explanation|any
+    python search.py --rules fixes.json [--dry-run] [--report report.diff]
+    python search.py --replace "Act 778" "Act 1049" [--dry-run]
+    python search.py "act (\\d+)" --regex          (also: --whole-word)
 """
 
 import os
+import re
+import csv
 import json
+import difflib
+import fnmatch
+import argparse
 from pathlib import Path
 
+from search_index import SearchIndex, SEARCH_FIELDS, corpus_files
+
 
-def search_phrase_in_file(filepath, phrase):
+def compile_phrase(phrase, regex=False, whole_word=False):
+    """
+    Compile a search phrase into a case-insensitive pattern.
+    
+    Args:
+        phrase: The phrase to search for
+        regex: Treat phrase as a regular expression instead of literal text
+        whole_word: Only match where the phrase is not part of a longer word
+    
+    Returns:
+        Compiled regular expression
+    
+    Raises:
+        re.error: If regex is True and phrase is not a valid pattern
+    """
+    pattern = phrase if regex else re.escape(phrase)
+    if whole_word:
+        if regex or re.match(r'\w', phrase):
+            pattern = r'(?<!\w)(?:' + pattern + ')'
+        if regex or re.search(r'\w$', phrase):
+            pattern = '(?:' + pattern + r')(?!\w)'
+    return re.compile(pattern, re.IGNORECASE)
+
+
+def compile_replacement(replacement, regex=False):
+    """
+    Turn replacement text into a template for Pattern.subn().
+    
+    In regex mode the replacement may use group references such as \\1 or
+    \\g<name>; otherwise backslashes are escaped so it is inserted literally.
+    """
+    return replacement if regex else replacement.replace('\\', '\\\\')
+
+
+def search_phrase_in_file(filepath, phrase, regex=False, whole_word=False):
     """
     Search for a phrase in a file and return matching line numbers.
     
     Args:
         filepath: Path to the file to search
         phrase: The phrase to search for (case-insensitive)
+        regex: Treat phrase as a regular expression
+        whole_word: Only match whole words
     
     Returns:
         List of line numbers where phrase is found (1-indexed)
     """
     matching_lines = []
     phrase_lower = phrase.lower()
+    pattern = compile_phrase(phrase, regex, whole_word) if (regex or whole_word) else None
     
     try:
         with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
             for line_num, line in enumerate(f, 1):
-                if phrase_lower in line.lower():
+                if pattern is not None:
+                    if pattern.search(line):
+                        matching_lines.append(line_num)
+                elif phrase_lower in line.lower():
                     matching_lines.append(line_num)
     except Exception as e:
         print(f"Error reading {filepath}: {e}")
@@ -36,7 +102,70 @@ def search_phrase_in_file(filepath, phrase):
     return matching_lines
 
 
-def replace_in_file(filepath, phrase, replacement, line_numbers=None):
+def replace_in_lines(lines, phrase, replacement, line_numbers=None, regex=False, whole_word=False):
+    """
+    Replace phrase with replacement text in a list of lines, in place.
+    
+    The phrase is compiled once into a case-insensitive pattern and each line
+    is rewritten in a single left-to-right pass, so the cost is linear in the
+    length of the line no matter how many occurrences it holds.
+    
+    Args:
+        lines: List of lines (modified in place)
+        phrase: The phrase to replace (case-insensitive search)
+        replacement: The text to replace with
+        line_numbers: List of specific line numbers to replace (None = all)
+        regex: Treat phrase as a regular expression and replacement as a
+               template that may reference groups
+        whole_word: Only replace where the phrase is not part of a longer word
+    
+    Returns:
+        Number of replacements made
+    """
+    pattern = compile_phrase(phrase, regex, whole_word)
+    template = compile_replacement(replacement, regex)
+    # Literal phrases can skip most lines with a plain substring test, which
+    # is much cheaper than a case-insensitive regex scan
+    phrase_lower = None if regex else phrase.lower()
+    replacements = 0
+    
+    if line_numbers is None:
+        indices = range(len(lines))
+    else:
+        indices = sorted(n - 1 for n in set(line_numbers) if 0 < n <= len(lines))
+    
+    for i in indices:
+        if phrase_lower is not None and phrase_lower not in lines[i].lower():
+            continue
+        new_line, count = pattern.subn(template, lines[i])
+        if count:
+            lines[i] = new_line
+            replacements += count
+    
+    return replacements
+
+
+def read_lines_preserving_newlines(filepath):
+    """Read a file into lines without translating its line endings."""
+    with open(filepath, 'r', encoding='utf-8', errors='ignore', newline='') as f:
+        return f.readlines()
+
+
+def write_file_atomic(filepath, text):
+    """
+    Write text to a file atomically.
+    
+    The content goes to a temporary file in the same directory, which then
+    replaces the original, so readers never see a half-written file.
+    """
+    filepath = Path(filepath)
+    tmp_path = filepath.with_name(f".{filepath.name}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+    os.replace(tmp_path, filepath)
+
+
+def replace_in_file(filepath, phrase, replacement, line_numbers=None, regex=False, whole_word=False):
     """
     Replace phrase with replacement text in a file.
     
@@ -45,37 +174,19 @@ def replace_in_file(filepath, phrase, replacement, line_numbers=None):
         phrase: The phrase to replace (case-insensitive search)
         replacement: The text to replace with
         line_numbers: List of specific line numbers to replace (None = all)
+        regex: Treat phrase as a regular expression
+        whole_word: Only replace whole words
     
     Returns:
         Number of replacements made
     """
     try:
-        with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-            lines = f.readlines()
-        
-        replacements = 0
-        phrase_lower = phrase.lower()
-        
-        for i, line in enumerate(lines, 1):
-            # If line_numbers specified, only replace in those lines
-            if line_numbers is None or i in line_numbers:
-                # Case-insensitive replacement
-                if phrase_lower in line.lower():
-                    # Find all occurrences (case-insensitive)
-                    new_line = line
-                    start = 0
-                    while True:
-                        pos = new_line.lower().find(phrase_lower, start)
-                        if pos == -1:
-                            break
-                        new_line = new_line[:pos] + replacement + new_line[pos + len(phrase):]
-                        start = pos + len(replacement)
-                        replacements += 1
-                    lines[i - 1] = new_line
+        lines = read_lines_preserving_newlines(filepath)
+        replacements = replace_in_lines(lines, phrase, replacement, line_numbers, regex, whole_word)
         
         # Write back to file
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.writelines(lines)
+        if replacements:
+            write_file_atomic(filepath, ''.join(lines))
         
         return replacements
     except Exception as e:
@@ -83,7 +194,7 @@ def replace_in_file(filepath, phrase, replacement, line_numbers=None):
         return 0
 
 
-def show_context(filepath, line_number, phrase, context_lines=2):
+def show_context(filepath, line_number, phrase, context_lines=2, lines=None):
     """
     Show context around a specific line for user review.
     
@@ -92,10 +203,12 @@ def show_context(filepath, line_number, phrase, context_lines=2):
         line_number: Line number to show
         phrase: The phrase being searched (for highlighting)
         context_lines: Number of lines before/after to show
+        lines: Already-loaded lines of the file (read from disk if None)
     """
     try:
-        with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-            lines = f.readlines()
+        if lines is None:
+            with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
+                lines = f.readlines()
         
         start = max(0, line_number - context_lines - 1)
         end = min(len(lines), line_number + context_lines)
@@ -108,7 +221,7 @@ def show_context(filepath, line_number, phrase, context_lines=2):
         print(f"  Error showing context: {e}")
 
 
-def replace_all_occurrences(all_results, phrase, replacement, script_dir):
+def replace_all_occurrences(all_results, phrase, replacement, script_dir, regex=False, whole_word=False):
     """
     Replace all occurrences of phrase with replacement.
     
@@ -117,6 +230,8 @@ def replace_all_occurrences(all_results, phrase, replacement, script_dir):
         phrase: The phrase to replace
         replacement: The text to replace with
         script_dir: Script directory path
+        regex: Treat phrase as a regular expression
+        whole_word: Only replace whole words
     
     Returns:
         Total number of replacements made
@@ -128,7 +243,7 @@ def replace_all_occurrences(all_results, phrase, replacement, script_dir):
         default_questions_dir = script_dir / "default-questions"
         for filename, line_numbers in all_results['default-questions'].items():
             filepath = default_questions_dir / filename
-            count = replace_in_file(str(filepath), phrase, replacement)
+            count = replace_in_file(str(filepath), phrase, replacement, regex=regex, whole_word=whole_word)
             if count > 0:
                 print(f"  [OK] {filename}: {count} replacement(s)")
                 total_replacements += count
@@ -136,7 +251,7 @@ def replace_all_occurrences(all_results, phrase, replacement, script_dir):
     # Replace in index.html
     if "index.html" in all_results:
         index_file = script_dir / "index.html"
-        count = replace_in_file(str(index_file), phrase, replacement)
+        count = replace_in_file(str(index_file), phrase, replacement, regex=regex, whole_word=whole_word)
         if count > 0:
             print(f"  [OK] index.html: {count} replacement(s)")
             total_replacements += count
@@ -144,7 +259,58 @@ def replace_all_occurrences(all_results, phrase, replacement, script_dir):
     return total_replacements
 
 
-def replace_interactively(all_results, phrase, replacement, script_dir):
+def review_file_interactively(filepath, line_numbers, phrase, replacement, regex=False, whole_word=False):
+    """
+    Ask for approval line by line, then write the file once.
+    
+    Approved replacements are applied to an in-memory copy of the file, so
+    later context reflects earlier edits without re-reading the file.
+    
+    Args:
+        filepath: Path to the file
+        line_numbers: Line numbers to review
+        phrase: The phrase to replace
+        replacement: The text to replace with
+        regex: Treat phrase as a regular expression
+        whole_word: Only replace whole words
+    
+    Returns:
+        Tuple of (number of replacements made, whether the user quit)
+    """
+    lines = read_lines_preserving_newlines(filepath)
+    total_replacements = 0
+    quit_requested = False
+    
+    for line_num in line_numbers:
+        show_context(str(filepath), line_num, phrase, lines=lines)
+        
+        while True:
+            choice = input(f"\n  Replace on line {line_num}? (y/n/q to quit): ").strip().lower()
+            if choice in ['y', 'n', 'q']:
+                break
+            print("  Invalid choice. Please enter 'y', 'n', or 'q'.")
+        
+        if choice == 'q':
+            print("\n  Replacement cancelled by user.")
+            quit_requested = True
+            break
+        elif choice == 'y':
+            count = replace_in_lines(lines, phrase, replacement, [line_num], regex, whole_word)
+            total_replacements += count
+            print(f"  [OK] Replaced {count} occurrence(s) on line {line_num}")
+    
+    # Single write per file, covering everything approved so far
+    if total_replacements:
+        try:
+            write_file_atomic(filepath, ''.join(lines))
+        except OSError as e:
+            print(f"  Error writing {filepath}: {e}")
+            return 0, quit_requested
+    
+    return total_replacements, quit_requested
+
+
+def replace_interactively(all_results, phrase, replacement, script_dir, regex=False, whole_word=False):
     """
     Replace occurrences one by one with user approval.
     
@@ -153,6 +319,8 @@ def replace_interactively(all_results, phrase, replacement, script_dir):
         phrase: The phrase to replace
         replacement: The text to replace with
         script_dir: Script directory path
+        regex: Treat phrase as a regular expression
+        whole_word: Only replace whole words
     
     Returns:
         Total number of replacements made
@@ -166,22 +334,11 @@ def replace_interactively(all_results, phrase, replacement, script_dir):
             filepath = default_questions_dir / filename
             print(f"\n[FILE] {filename}")
             
-            for line_num in line_numbers:
-                show_context(str(filepath), line_num, phrase)
-                
-                while True:
-                    choice = input(f"\n  Replace on line {line_num}? (y/n/q to quit): ").strip().lower()
-                    if choice in ['y', 'n', 'q']:
-                        break
-                    print("  Invalid choice. Please enter 'y', 'n', or 'q'.")
-                
-                if choice == 'q':
-                    print("\n  Replacement cancelled by user.")
-                    return total_replacements
-                elif choice == 'y':
-                    count = replace_in_file(str(filepath), phrase, replacement, [line_num])
-                    total_replacements += count
-                    print(f"  [OK] Replaced {count} occurrence(s) on line {line_num}")
+            count, quit_requested = review_file_interactively(filepath, line_numbers, phrase, replacement,
+                                                              regex, whole_word)
+            total_replacements += count
+            if quit_requested:
+                return total_replacements
     
     # Process index.html
     if "index.html" in all_results:
@@ -189,33 +346,256 @@ def replace_interactively(all_results, phrase, replacement, script_dir):
         line_numbers = all_results['index.html']
         print(f"\n📄 index.html")
         
-        for line_num in line_numbers:
-            show_context(str(index_file), line_num, phrase)
-            
-            while True:
-                choice = input(f"\n  Replace on line {line_num}? (y/n/q to quit): ").strip().lower()
-                if choice in ['y', 'n', 'q']:
-                    break
-                print("  Invalid choice. Please enter 'y', 'n', or 'q'.")
-            
-            if choice == 'q':
-                print("\n  Replacement cancelled by user.")
-                return total_replacements
-            elif choice == 'y':
-                count = replace_in_file(str(index_file), phrase, replacement, [line_num])
-                total_replacements += count
-                print(f"  ✓ Replaced {count} occurrence(s) on line {line_num}")
+        count, quit_requested = review_file_interactively(index_file, line_numbers, phrase, replacement,
+                                                          regex, whole_word)
+        total_replacements += count
     
     return total_replacements
 
 
-def search_in_json_files(directory, phrase):
+def load_rules(rules_path):
+    """
+    Load find/replace rules from a JSON or CSV file.
+    
+    JSON files hold a list of objects; CSV files need a header row. Each rule
+    has "find" and "replace", plus optional "file" (a path or glob such as
+    "default-questions/set4*.json", matched against the relative path or the
+    bare filename), "lines" (line numbers to restrict the rule to), and the
+    "regex" / "whole_word" match modes.
+    
+    Args:
+        rules_path: Path to a .json or .csv rules file
+    
+    Returns:
+        List of validated rule dictionaries
+    
+    Raises:
+        ValueError: If the file or any rule is malformed
+    """
+    rules_path = Path(rules_path)
+    if rules_path.suffix.lower() == '.csv':
+        with open(rules_path, 'r', encoding='utf-8-sig', newline='') as f:
+            raw_rules = list(csv.DictReader(f))
+    else:
+        with open(rules_path, 'r', encoding='utf-8-sig') as f:
+            raw_rules = json.load(f)
+        if isinstance(raw_rules, dict):
+            raw_rules = raw_rules.get('rules', [])
+    
+    if not isinstance(raw_rules, list):
+        raise ValueError(f"{rules_path}: expected a list of rules")
+    
+    return [validate_rule(rule, i) for i, rule in enumerate(raw_rules, 1)]
+
+
+def validate_rule(rule, number=1):
+    """
+    Check a single rule and normalize its optional fields.
+    
+    Args:
+        rule: Dictionary with at least "find" and "replace"
+        number: Position of the rule, used in error messages
+    
+    Returns:
+        Normalized rule dictionary
+    
+    Raises:
+        ValueError: If the rule is malformed
+    """
+    if not isinstance(rule, dict):
+        raise ValueError(f"Rule {number}: expected an object")
+    find = rule.get('find')
+    replace = rule.get('replace')
+    if not isinstance(find, str) or not find:
+        raise ValueError(f"Rule {number}: 'find' must be a non-empty string")
+    if not isinstance(replace, str):
+        raise ValueError(f"Rule {number}: 'replace' must be a string")
+    
+    files = rule.get('file') or None
+    if isinstance(files, str):
+        files = [files]
+    
+    lines = rule.get('lines') or None
+    if isinstance(lines, str):
+        lines = [part for part in lines.replace(';', ',').split(',') if part.strip()]
+    try:
+        lines = {int(n) for n in lines} if lines else None
+    except (TypeError, ValueError):
+        raise ValueError(f"Rule {number}: 'lines' must be a list of line numbers")
+    
+    regex = parse_flag(rule.get('regex'))
+    whole_word = parse_flag(rule.get('whole_word'))
+    try:
+        compile_phrase(find, regex, whole_word)
+    except re.error as e:
+        raise ValueError(f"Rule {number}: invalid regular expression: {e}")
+    
+    return {'find': find, 'replace': replace, 'file': files, 'lines': lines,
+            'regex': regex, 'whole_word': whole_word}
+
+
+def parse_flag(value):
+    """Interpret a rule flag given as a JSON boolean or a CSV string."""
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'y')
+    return bool(value)
+
+
+def rule_applies_to(rule, rel_path):
+    """Check whether a rule's file filter matches a relative path."""
+    if not rule['file']:
+        return True
+    name = rel_path.rsplit('/', 1)[-1]
+    return any(fnmatch.fnmatch(rel_path, pattern) or fnmatch.fnmatch(name, pattern)
+               for pattern in rule['file'])
+
+
+def plan_batch_replace(rules, script_dir):
+    """
+    Apply every rule in memory without touching the disk.
+    
+    Each target file is read once and all applicable rules run over the same
+    in-memory copy, in order.
+    
+    Args:
+        rules: List of rules from load_rules()/validate_rule()
+        script_dir: Project directory
+    
+    Returns:
+        List of changes, one per modified file, with the original text, new
+        text and the number of replacements each rule made
+    """
+    changes = []
+    for rel_path, path in corpus_files(script_dir):
+        applicable = [(i, rule) for i, rule in enumerate(rules) if rule_applies_to(rule, rel_path)]
+        if not applicable:
+            continue
+        
+        try:
+            lines = read_lines_preserving_newlines(path)
+        except OSError as e:
+            print(f"Error reading {rel_path}: {e}")
+            continue
+        original = ''.join(lines)
+        
+        counts = {}
+        for i, rule in applicable:
+            count = replace_in_lines(lines, rule['find'], rule['replace'], rule['lines'],
+                                     rule['regex'], rule['whole_word'])
+            if count:
+                counts[i] = count
+        
+        if counts:
+            changes.append({
+                'file': rel_path,
+                'path': path,
+                'original': original,
+                'new': ''.join(lines),
+                'counts': counts,
+            })
+    return changes
+
+
+def format_batch_report(changes, rules, include_diff=True):
+    """
+    Build a human-readable report of planned changes.
+    
+    Args:
+        changes: Result of plan_batch_replace()
+        rules: The rules that produced the changes
+        include_diff: Append a unified diff of every modified file
+    
+    Returns:
+        The report as a string
+    """
+    out = []
+    total = 0
+    for change in changes:
+        file_total = sum(change['counts'].values())
+        total += file_total
+        out.append(f"{change['file']}: {file_total} replacement(s)")
+        for i, count in sorted(change['counts'].items()):
+            rule = rules[i]
+            modes = [name for name in ('regex', 'whole_word') if rule.get(name)]
+            mode_text = f" ({', '.join(modes)})" if modes else ""
+            out.append(f"    rule {i + 1}: '{rule['find']}' -> '{rule['replace']}'{mode_text} x{count}")
+    out.append(f"Total: {total} replacement(s) in {len(changes)} file(s)")
+    
+    if include_diff:
+        for change in changes:
+            out.append('')
+            out.extend(line.rstrip('\r\n') for line in difflib.unified_diff(
+                change['original'].splitlines(keepends=True),
+                change['new'].splitlines(keepends=True),
+                fromfile=f"a/{change['file']}",
+                tofile=f"b/{change['file']}",
+                n=1,
+            ))
+    return '\n'.join(out) + '\n'
+
+
+def apply_batch_replace(changes):
+    """
+    Write every planned change, once per file, atomically.
+    
+    Args:
+        changes: Result of plan_batch_replace()
+    
+    Returns:
+        Total number of replacements written
+    """
+    total = 0
+    for change in changes:
+        try:
+            write_file_atomic(change['path'], change['new'])
+            total += sum(change['counts'].values())
+        except OSError as e:
+            print(f"  Error writing {change['file']}: {e}")
+    return total
+
+
+def run_batch(rules, script_dir, dry_run=False, report_path=None):
+    """
+    Non-interactive find/replace driven by a list of rules.
+    
+    Args:
+        rules: List of validated rules
+        script_dir: Project directory
+        dry_run: Only report what would change
+        report_path: Optional file to write the report and diff to
+    
+    Returns:
+        Total number of replacements made (or planned, for a dry run)
+    """
+    changes = plan_batch_replace(rules, script_dir)
+    report = format_batch_report(changes, rules, include_diff=dry_run or report_path is not None)
+    
+    if report_path:
+        with open(report_path, 'w', encoding='utf-8') as f:
+            f.write(report)
+        print(f"Report written to {report_path}")
+    
+    if dry_run:
+        if not report_path:
+            print(report)
+        else:
+            print(format_batch_report(changes, rules, include_diff=False))
+        print("[DRY-RUN] No files were modified.")
+        return sum(sum(c['counts'].values()) for c in changes)
+    
+    print(format_batch_report(changes, rules, include_diff=False))
+    return apply_batch_replace(changes)
+
+
+def search_in_json_files(directory, phrase, regex=False, whole_word=False):
     """
     Search for phrase in all JSON files in a directory.
     
     Args:
         directory: Path to directory containing JSON files
         phrase: The phrase to search for
+        regex: Treat phrase as a regular expression
+        whole_word: Only match whole words
     
     Returns:
         Dictionary with results
@@ -234,11 +614,8 @@ def search_in_json_files(directory, phrase):
             filepath = os.path.join(directory, filename)
             
             try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    file_content = f.read()
-                    
                 # Search line by line
-                matching_lines = search_phrase_in_file(filepath, phrase)
+                matching_lines = search_phrase_in_file(filepath, phrase, regex, whole_word)
                 
                 if matching_lines:
                     results[filename] = matching_lines
@@ -249,10 +626,95 @@ def search_in_json_files(directory, phrase):
     return results
 
 
+def search_with_index(index, phrase):
+    """
+    Search using the persistent index instead of re-reading every file.
+    
+    Args:
+        index: A SearchIndex, already refreshed
+        phrase: The phrase to search for
+    
+    Returns:
+        Dictionary with results, in the same shape main() builds by scanning
+    """
+    all_results = {}
+    json_results = {}
+    
+    for name, line_numbers in index.search(phrase).items():
+        if name == "index.html":
+            all_results["index.html"] = line_numbers
+        elif name.startswith("default-questions/"):
+            json_results[name[len("default-questions/"):]] = line_numbers
+    
+    if json_results:
+        all_results["default-questions"] = json_results
+    
+    return all_results
+
+
+def print_field_results(hits, phrase, field):
+    """
+    Display the results of a field-aware search.
+    
+    Args:
+        hits: List of hits returned by SearchIndex.search_fields()
+        phrase: The phrase that was searched for
+        field: The field that was searched
+    """
+    print("\n" + "="*70)
+    print(f"RESULTS ({field})")
+    print("="*70)
+    
+    if not hits:
+        print(f"\nNo questions found with '{phrase}' in {field}")
+        return
+    
+    by_file = {}
+    for hit in hits:
+        by_file.setdefault(hit['file'], []).append(hit)
+    
+    for filename, file_hits in by_file.items():
+        print(f"\n[FILE] {filename}")
+        for hit in file_hits:
+            print(f"   • index {hit['index']}, id {hit['id']}, line {hit['line']} "
+                  f"[{', '.join(hit['fields'])}]: {hit['question'][:60]}")
+    
+    print("\n" + "-"*70)
+    print(f"Total questions matched: {len(hits)} in {len(by_file)} file(s)")
+
+
 def main():
     """Main function to run the search."""
+    parser = argparse.ArgumentParser(description="Find (and optionally replace) a phrase in the question bank and index.html")
+    parser.add_argument("phrase", nargs="?", help="Phrase to search for (prompted if omitted)")
+    parser.add_argument("--no-index", action="store_true", help="Scan every file instead of using the search index")
+    parser.add_argument("--rebuild-index", action="store_true", help="Rebuild the search index from scratch")
+    parser.add_argument("--field", help=f"Search questions by field: {', '.join(SEARCH_FIELDS)} or option:X (e.g. option:B)")
+    parser.add_argument("--rules", help="Batch mode: JSON or CSV file of find/replace rules")
+    parser.add_argument("--replace", nargs=2, action="append", metavar=("FIND", "REPLACE"),
+                        help="Batch mode: add a find/replace rule (can be repeated)")
+    parser.add_argument("--regex", action="store_true", help="Treat the phrase (and --replace FIND) as a regular expression")
+    parser.add_argument("--whole-word", action="store_true", help="Only match the phrase as a whole word")
+    parser.add_argument("--dry-run", action="store_true", help="Batch mode: show a diff without writing files")
+    parser.add_argument("--report", help="Batch mode: also write the report and diff to this file")
+    parser.add_argument("--workers", type=int, default=1, help="Re-index changed files in N processes, 0 for one per CPU (default: 1)")
+    args = parser.parse_args()
+    if args.field and args.no_index:
+        parser.error("--field uses the search index and cannot be combined with --no-index")
+    
     # Get the script directory
     script_dir = Path(__file__).parent
+    
+    if args.rules or args.replace:
+        try:
+            rules = load_rules(args.rules) if args.rules else []
+            rules += [validate_rule({'find': f, 'replace': r, 'regex': args.regex,
+                                     'whole_word': args.whole_word}, len(rules) + i)
+                      for i, (f, r) in enumerate(args.replace or [], 1)]
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        run_batch(rules, script_dir, dry_run=args.dry_run, report_path=args.report)
+        return
     default_questions_dir = script_dir / "default-questions"
     index_file = script_dir / "index.html"
     
@@ -261,7 +723,7 @@ def main():
     print("="*70 + "\n")
     
     # Get phrase from user
-    phrase = input("Enter the phrase to search for: ").strip()
+    phrase = (args.phrase or input("Enter the phrase to search for: ")).strip()
     
     if not phrase:
         print("No phrase entered. Exiting.")
@@ -272,23 +734,50 @@ def main():
     
     all_results = {}
     
-    # Search in default-questions folder
-    if default_questions_dir.exists():
-        print(f"\nSearching in: {default_questions_dir}")
-        json_results = search_in_json_files(str(default_questions_dir), phrase)
-        if json_results:
-            all_results["default-questions"] = json_results
-    else:
-        print(f"Warning: default-questions folder not found at {default_questions_dir}")
-    
-    # Search in index.html
-    if index_file.exists():
-        print(f"Searching in: {index_file}")
-        html_results = search_phrase_in_file(str(index_file), phrase)
-        if html_results:
-            all_results["index.html"] = html_results
+    if args.field:
+        # Field-aware search over the cached, parsed question sets
+        index = SearchIndex.open(script_dir, rebuild=args.rebuild_index, workers=args.workers)
+        try:
+            hits = index.search_fields(phrase, args.field)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+        print_field_results(hits, phrase, args.field)
+        print("\n" + "="*70 + "\n")
+        return
+    
+    if args.regex or args.whole_word:
+        try:
+            compile_phrase(phrase, args.regex, args.whole_word)
+        except re.error as e:
+            print(f"Invalid regular expression: {e}")
+            return
+    
+    # The index answers plain substring queries; regex and whole-word
+    # matching scan the files with the compiled pattern instead.
+    if not (args.no_index or args.regex or args.whole_word):
+        # Search the persistent index (re-indexes only files that changed)
+        index = SearchIndex.open(script_dir, rebuild=args.rebuild_index, workers=args.workers)
+        print(f"\nSearching index of {len(index.files)} files")
+        all_results = search_with_index(index, phrase)
     else:
-        print(f"Warning: index.html not found at {index_file}")
+        # Search in default-questions folder
+        if default_questions_dir.exists():
+            print(f"\nSearching in: {default_questions_dir}")
+            json_results = search_in_json_files(str(default_questions_dir), phrase, args.regex, args.whole_word)
+            if json_results:
+                all_results["default-questions"] = json_results
+        else:
+            print(f"Warning: default-questions folder not found at {default_questions_dir}")
+        
+        # Search in index.html
+        if index_file.exists():
+            print(f"Searching in: {index_file}")
+            html_results = search_phrase_in_file(str(index_file), phrase, args.regex, args.whole_word)
+            if html_results:
+                all_results["index.html"] = html_results
+        else:
+            print(f"Warning: index.html not found at {index_file}")
     
     # Display results
     print("\n" + "="*70)
@@ -348,12 +837,14 @@ def main():
             if mode_choice == '1':
                 # Replace all
                 print(f"\nReplacing all occurrences of '{phrase}' with '{replacement}'...\n")
-                total_replaced = replace_all_occurrences(all_results, phrase, replacement, script_dir)
+                total_replaced = replace_all_occurrences(all_results, phrase, replacement, script_dir,
+                                                         args.regex, args.whole_word)
                 print(f"\n✓ Total replacements made: {total_replaced}")
             else:
                 # Replace interactively
                 print(f"\nReplacing '{phrase}' with '{replacement}' (interactive mode)...")
-                total_replaced = replace_interactively(all_results, phrase, replacement, script_dir)
+                total_replaced = replace_interactively(all_results, phrase, replacement, script_dir,
+                                                       args.regex, args.whole_word)
                 print(f"\n✓ Total replacements made: {total_replaced}")
     
     print("\n" + "="*70 + "\n")
@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""
+Persistent Search Index for GES Promotion Quiz Application
+
+Keeps an on-disk token and trigram index of every JSON file in
+default-questions/ and of index.html, so search.py can answer a query
+without re-reading the corpus. Each file is tracked by mtime and size;
+when only one set changes, only that file is re-indexed.
+
+The index lives in .cache/search_index.bin (ignored by git). It is stored
+with marshal behind a format header rather than pickled, so loading it can
+never run code; any file that does not load cleanly is simply rebuilt.
+
+Question sets are also parsed once and cached as per-question records, so
+field-aware queries (question, a specific option, answer letter or
+explanation) can be answered with the (file, index, id) of each question.
+
+Usage:
+    python search_index.py [--rebuild] [--field FIELD] [phrase]
+"""
+
+import os
+import re
+import sys
+import time
+import marshal
+import argparse
+from array import array
+from pathlib import Path
+
+from question_bank import map_in_order, parse_set_items, questions_from_items
+
+# Get the script directory
+SCRIPT_DIR = Path(__file__).parent.absolute()
+CACHE_DIR = SCRIPT_DIR / ".cache"
+INDEX_FILENAME = "search_index.bin"
+INDEX_MAGIC = b"GESIDX"
+
+# Bump when the on-disk layout changes so stale caches are discarded
+INDEX_VERSION = 3
+GRAM_SIZE = 3
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Fields accepted by SearchIndex.search_fields(); "option:X" targets one option
+SEARCH_FIELDS = ("question", "options", "answer", "explanation", "any")
+
+
+def corpus_files(root):
+    """
+    List the files covered by the index.
+
+    Args:
+        root: Project directory
+
+    Returns:
+        List of (relative path, absolute path) tuples
+    """
+    root = Path(root)
+    files = []
+    questions_dir = root / "default-questions"
+    if questions_dir.is_dir():
+        for path in sorted(questions_dir.glob("*.json")):
+            files.append((f"default-questions/{path.name}", path))
+    index_file = root / "index.html"
+    if index_file.is_file():
+        files.append(("index.html", index_file))
+    return files
+
+
+def read_text(path):
+    """Read a file the same way search_phrase_in_file() in search.py does."""
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        return f.read()
+
+
+def split_lines(text):
+    """
+    Split text into lines, numbered the same way as iterating over the file.
+
+    Lines keep no trailing newline.
+    """
+    lines = text.split("\n")
+    if lines and lines[-1] == "":
+        lines.pop()
+    return lines
+
+
+def parse_records(text):
+    """
+    Parse a question set into compact per-question records.
+
+    Args:
+        text: File contents
+
+    Returns:
+        Tuple of (list of (index, id, line, question, options, answer,
+        explanation) tuples, error message or None)
+    """
+    items, lines, error = parse_set_items(text)
+    if error:
+        return [], error
+
+    questions, _ = questions_from_items(items, lines, None)
+    records = []
+    for q in questions:
+        options = q.options
+        records.append((
+            q.index,
+            q.id,
+            q.line,
+            str(q.question or ""),
+            {str(k): str(v) for k, v in options.items()} if isinstance(options, dict) else {},
+            str(q.answer or ""),
+            str(q.explanation or ""),
+        ))
+    return records, None
+
+
+def _add_posting(postings, key, line_num):
+    posting = postings.get(key)
+    if posting is None:
+        postings[key] = array("I", (line_num,))
+    elif posting[-1] != line_num:
+        posting.append(line_num)
+
+
+def index_file(path):
+    """
+    Build the index entry for one file.
+
+    Args:
+        path: Path to the file
+
+    Returns:
+        Dictionary with the lowercased lines and their token/trigram postings
+    """
+    stat = os.stat(path)
+    text = read_text(path)
+    lines = [line.lower() for line in split_lines(text)]
+    records, parse_error = parse_records(text) if Path(path).suffix == ".json" else (None, None)
+    grams = {}
+    tokens = {}
+
+    for line_num, line in enumerate(lines, 1):
+        for gram in {line[i:i + GRAM_SIZE] for i in range(len(line) - GRAM_SIZE + 1)}:
+            _add_posting(grams, gram, line_num)
+        for token in set(TOKEN_PATTERN.findall(line)):
+            _add_posting(tokens, token, line_num)
+
+    # Postings are stored as raw bytes: they serialize far faster than array
+    # objects (which marshal cannot store) and are viewed as uint32 again at
+    # query time.
+    return {
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "lines": lines,
+        "grams": {key: posting.tobytes() for key, posting in grams.items()},
+        "tokens": {key: posting.tobytes() for key, posting in tokens.items()},
+        "records": records,
+        "parse_error": parse_error,
+    }
+
+
+def index_file_job(path):
+    """index_file() for map_in_order(): returns (entry, error message or None)."""
+    try:
+        return index_file(path), None
+    except OSError as e:
+        return None, str(e)
+
+
+def phrase_keys(phrase_lower):
+    """
+    Work out which index keys every matching line must contain.
+
+    Returns:
+        Tuple of (trigrams, complete tokens). A token only counts as complete
+        when it is bounded by non-word characters inside the phrase itself;
+        tokens touching either end may be part of a longer word in the line.
+    """
+    grams = {phrase_lower[i:i + GRAM_SIZE] for i in range(len(phrase_lower) - GRAM_SIZE + 1)}
+    tokens = {
+        m.group(0)
+        for m in TOKEN_PATTERN.finditer(phrase_lower)
+        if m.start() > 0 and m.end() < len(phrase_lower)
+    }
+    return grams, tokens
+
+
+class SearchIndex:
+    """Token and trigram index over the question bank and index.html."""
+
+    def __init__(self, root=None, index_path=None):
+        self.root = Path(root or SCRIPT_DIR)
+        self.index_path = Path(index_path) if index_path else self.root / CACHE_DIR.name / INDEX_FILENAME
+        self.files = {}
+        self.dirty = False
+        self._lowered = {}
+
+    @classmethod
+    def open(cls, root=None, index_path=None, rebuild=False, workers=1):
+        """
+        Load the index from disk, bring it up to date and save it if needed.
+
+        Args:
+            root: Project directory
+            index_path: Location of the index file
+            rebuild: Ignore any existing index and re-index every file
+            workers: Re-index changed files in this many processes
+
+        Returns:
+            A ready-to-query SearchIndex
+        """
+        index = cls(root, index_path)
+        if not rebuild:
+            index.load()
+        index.refresh(workers)
+        if index.dirty:
+            index.save()
+        return index
+
+    def load(self):
+        """Load the index file if it exists and matches the current version."""
+        header = INDEX_MAGIC + INDEX_VERSION.to_bytes(4, "little")
+        try:
+            with open(self.index_path, "rb") as f:
+                if f.read(len(header)) != header:
+                    return False
+                data = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return False
+        if not isinstance(data, dict) or not isinstance(data.get("files"), dict):
+            return False
+        self.files = data["files"]
+        return True
+
+    def save(self):
+        """Write the index atomically into the cache directory."""
+        tmp_path = self.index_path.with_name(self.index_path.name + ".tmp")
+        try:
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(INDEX_MAGIC + INDEX_VERSION.to_bytes(4, "little"))
+                marshal.dump({"files": self.files}, f)
+            os.replace(tmp_path, self.index_path)
+            self.dirty = False
+        except OSError as e:
+            print(f"Warning: could not save search index: {e}")
+
+    def refresh(self, workers=1):
+        """
+        Re-index files whose mtime or size changed and drop deleted files.
+
+        Args:
+            workers: Re-index in this many processes (0 = one per CPU)
+
+        Returns:
+            Tuple of (list of re-indexed paths, list of removed paths)
+        """
+        updated = []
+        current = corpus_files(self.root)
+        current_names = {name for name, _ in current}
+
+        removed = [name for name in self.files if name not in current_names]
+        for name in removed:
+            del self.files[name]
+            self._lowered.pop(name, None)
+
+        stale = []
+        for name, path in current:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entry = self.files.get(name)
+            if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+                continue
+            stale.append((name, path))
+
+        results = map_in_order(index_file_job, [path for _, path in stale], workers)
+        for (name, _), (entry, error) in zip(stale, results):
+            if error:
+                print(f"Error indexing {name}: {error}")
+                continue
+            self.files[name] = entry
+            self._lowered.pop(name, None)
+            updated.append(name)
+
+        if updated or removed:
+            self.dirty = True
+        return updated, removed
+
+    def search_file(self, name, phrase):
+        """
+        Find the lines of one indexed file that contain phrase.
+
+        Args:
+            name: Relative path of the file, as listed by corpus_files()
+            phrase: The phrase to search for (case-insensitive)
+
+        Returns:
+            List of matching line numbers (1-indexed)
+        """
+        entry = self.files.get(name)
+        if not entry or not phrase:
+            return []
+        phrase_lower = phrase.lower()
+        lines = entry["lines"]
+        grams, tokens = phrase_keys(phrase_lower)
+
+        postings = []
+        for gram in grams:
+            posting = entry["grams"].get(gram)
+            if posting is None:
+                return []
+            postings.append(memoryview(posting).cast("I"))
+        for token in tokens:
+            posting = entry["tokens"].get(token)
+            if posting is None:
+                return []
+            postings.append(memoryview(posting).cast("I"))
+
+        if not postings:
+            # Phrase shorter than a trigram: scan the cached lines in memory
+            candidates = range(1, len(lines) + 1)
+        else:
+            postings.sort(key=len)
+            candidates = postings[0]
+            if len(postings) > 1:
+                second = set(postings[1])
+                candidates = [n for n in candidates if n in second]
+
+        return [n for n in candidates if phrase_lower in lines[n - 1]]
+
+    def search(self, phrase):
+        """
+        Search every indexed file.
+
+        Args:
+            phrase: The phrase to search for (case-insensitive)
+
+        Returns:
+            Dictionary mapping relative path to matching line numbers
+        """
+        results = {}
+        for name in self.files:
+            matches = self.search_file(name, phrase)
+            if matches:
+                results[name] = matches
+        return results
+
+    def _lowered_records(self, name):
+        """Lowercased copies of a file's records, built once per session."""
+        lowered = self._lowered.get(name)
+        if lowered is None:
+            lowered = [
+                (question.lower(), {k.lower(): v.lower() for k, v in options.items()},
+                 answer.strip().lower(), explanation.lower())
+                for _, _, _, question, options, answer, explanation in self.files[name]["records"] or ()
+            ]
+            self._lowered[name] = lowered
+        return lowered
+
+    def search_fields(self, phrase, field="any"):
+        """
+        Search parsed questions by field.
+
+        Args:
+            phrase: The phrase to search for (case-insensitive). For the
+                    "answer" field it must equal the answer letter.
+            field: One of SEARCH_FIELDS, or "option:X" for a single option
+
+        Returns:
+            List of hit dictionaries with file, index, id, line and the
+            fields that matched
+
+        Raises:
+            ValueError: If field is not recognised
+        """
+        field = field.lower()
+        option_key = None
+        if field.startswith("option:"):
+            option_key = field.split(":", 1)[1].strip()
+            if not option_key:
+                raise ValueError("option field needs a key, e.g. option:B")
+        elif field not in SEARCH_FIELDS:
+            raise ValueError(f"Unknown field '{field}'. Use one of: {', '.join(SEARCH_FIELDS)}, option:X")
+
+        phrase_lower = phrase.lower()
+        answer_wanted = phrase.strip().lower()
+        hits = []
+
+        for name, entry in self.files.items():
+            if not entry.get("records"):
+                continue
+            for record, lowered in zip(entry["records"], self._lowered_records(name)):
+                question, options, answer, explanation = lowered
+                matched = []
+                if field in ("question", "any") and phrase_lower in question:
+                    matched.append("question")
+                if field in ("options", "any"):
+                    matched.extend(f"option:{k.upper()}" for k, v in options.items() if phrase_lower in v)
+                if option_key is not None and phrase_lower in options.get(option_key, ""):
+                    matched.append(f"option:{option_key.upper()}")
+                if field == "answer" and answer == answer_wanted:
+                    matched.append("answer")
+                if field in ("explanation", "any") and phrase_lower in explanation:
+                    matched.append("explanation")
+                if matched:
+                    hits.append({
+                        "file": name,
+                        "index": record[0],
+                        "id": record[1],
+                        "line": record[2],
+                        "fields": matched,
+                        "question": record[3],
+                    })
+        return hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the persistent search index")
+    parser.add_argument("phrase", nargs="?", help="Phrase to look up after updating the index")
+    parser.add_argument("--rebuild", action="store_true", help="Discard the existing index and rebuild it")
+    parser.add_argument("--field", help=f"Search parsed questions by field: {', '.join(SEARCH_FIELDS)} or option:X")
+    parser.add_argument("--workers", type=int, default=1, help="Re-index files in N processes, 0 for one per CPU (default: 1)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = SearchIndex(SCRIPT_DIR)
+    if not args.rebuild:
+        index.load()
+    updated, removed = index.refresh(args.workers)
+    if index.dirty:
+        index.save()
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"Index ready: {len(index.files)} files, {len(updated)} re-indexed, "
+          f"{len(removed)} removed ({elapsed:.1f} ms)")
+
+    if args.phrase and args.field:
+        start = time.perf_counter()
+        try:
+            hits = index.search_fields(args.phrase, args.field)
+        except ValueError as e:
+            parser.error(str(e))
+        elapsed = (time.perf_counter() - start) * 1000
+        for hit in hits:
+            print(f"   • {hit['file']} #{hit['index']} (id {hit['id']}, line {hit['line']}): {', '.join(hit['fields'])}")
+        print(f"{len(hits)} matching question(s) in {elapsed:.2f} ms")
+    elif args.phrase:
+        start = time.perf_counter()
+        results = index.search(args.phrase)
+        elapsed = (time.perf_counter() - start) * 1000
+        for name, line_numbers in results.items():
+            print(f"   • {name}: Lines {', '.join(map(str, line_numbers))}")
+        print(f"{sum(len(v) for v in results.values())} matching line(s) in {elapsed:.2f} ms")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
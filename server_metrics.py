@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+"""
+server_metrics.py
+Request metrics and a runtime profiler for run_server.py, in both the
+threaded and the asyncio (`--async`) modes.
+
+ServerMetrics counts requests by route (static, proxy, proxy_test, admin),
+method and status code, and keeps a latency histogram per route. The
+upstream pools add a histogram per upstream host and phase:
+
+  connect     TCP connect of a new upstream connection
+  tls         TLS handshake of a new https connection
+  first_byte  request sent -> response headers received, per hop
+  total       pool.request() -> final response closed, redirects included,
+              recorded under the host that gave the final response
+
+GET /__metrics__ renders all of it, together with the proxy cache, upstream
+pool, static cache and local backend counters, in the Prometheus text
+exposition format. Under `--workers N` every worker publishes its numbers to
+a shared directory about once a second, and whichever worker answers
+/__metrics__ reports the sum, plus requests per worker.
+
+Profiler is off until it is switched on through GET /__profile__, so slow
+requests can be looked at without restarting the server:
+
+  /__profile__?start=cprofile[&min_ms=200]  cProfile requests (threaded: one
+                                            request at a time, only those
+                                            taking at least min_ms; asyncio:
+                                            everything on the event loop)
+  /__profile__?start=sample[&interval_ms=5] sample every thread's stack
+  /__profile__?stop                         switch profiling off
+  /__profile__                              report: the profile so far and
+                                            the most recent slow requests
+
+With --workers, /__profile__ acts on the worker that answers it; the report
+names its pid. Requests slower than --slow-ms are logged whether or not profiling is on.
+Sampled stacks are reported in the collapsed format flamegraph.pl reads.
+
+Usage:
+    python run_server.py [--slow-ms 1000] [--no-metrics]
+    curl http://localhost:4000/__metrics__
+    curl 'http://localhost:4000/__profile__?start=sample'
+"""
+
+import io
+import os
+import json
+import sys
+import time
+import bisect
+import pstats
+import cProfile
+import threading
+import urllib.parse
+from collections import Counter, deque
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UPSTREAM_PHASES = ('connect', 'tls', 'first_byte', 'total')
+# Server endpoints that report on the server itself
+ADMIN_PATHS = {'/__run_local_shutdown__', '/__proxy_cache__', '/__metrics__', '/__profile__'}
+# Snapshot keys that are current levels rather than running totals
+GAUGE_KEYS = {'entries', 'bytes', 'in_flight', 'idle_connections', 'users', 'scores', 'pending'}
+# Seconds between a --workers process publishing its metrics for the others
+PUBLISH_INTERVAL = 1.0
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+PREFIX = 'run_server'
+
+
+def route_for(target):
+    """The metrics route of a request target, matching how the handlers dispatch it."""
+    if target == '/proxy_test':
+        return 'proxy_test'
+    if target.startswith('/proxy'):
+        return 'proxy'
+    if target.split('?', 1)[0] in ADMIN_PATHS:
+        return 'admin'
+    return 'static'
+
+
+def _labels(**labels):
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + '}'
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # One count per bucket plus the +Inf overflow
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def add(self, counts, total, count):
+        """Merge in another histogram's bucket counts, sum and count."""
+        for i, bucket_count in enumerate(counts):
+            self.counts[i] += bucket_count
+        self.sum += total
+        self.count += count
+
+    def render(self, name, **labels):
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            lines.append(f'{name}_bucket{_labels(**labels, le=bound)} {total}')
+        lines.append(f'{name}_sum{_labels(**labels)} {self.sum:.6f}')
+        lines.append(f'{name}_count{_labels(**labels)} {self.count}')
+        return lines
+
+
+class ServerMetrics:
+    """Thread-safe request and upstream metrics rendered for Prometheus."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, share_dir=None):
+        """
+        Args:
+            buckets: Upper bounds in seconds of the histogram buckets
+            share_dir: Directory where the --workers processes publish their
+                       metrics, so /__metrics__ on any worker reports the sum
+                       over all of them; None reports this process only
+        """
+        self.buckets = buckets
+        self.share_dir = share_dir
+        self._lock = threading.Lock()
+        # (route, method, code) -> count
+        self.requests = Counter()
+        # route -> Histogram
+        self.durations = {}
+        # (host, phase) -> Histogram
+        self.upstream = {}
+        # exception class name -> count of failed /proxy and /proxy_test calls
+        self.proxy_errors = Counter()
+        self.in_flight = 0
+        self.start_time = time.time()
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self, route, method, status, seconds):
+        """Count one request; status None means the client went away before an answer."""
+        with self._lock:
+            self.in_flight -= 1
+            self.requests[route, method or '-', str(status or 'aborted')] += 1
+            histogram = self.durations.get(route)
+            if histogram is None:
+                histogram = self.durations[route] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def observe_upstream(self, host, phase, seconds):
+        with self._lock:
+            histogram = self.upstream.get((host, phase))
+            if histogram is None:
+                histogram = self.upstream[host, phase] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def proxy_error(self, error):
+        with self._lock:
+            self.proxy_errors[type(error).__name__] += 1
+
+    # -- sharing between worker processes ----------------------------------------
+
+    def state(self, sections=None):
+        """This process's metrics and section counters as a JSON-serialisable dictionary."""
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'start_time': self.start_time,
+                'in_flight': self.in_flight,
+                'requests': [[route, method, code, count] for (route, method, code), count in self.requests.items()],
+                'durations': [[route, h.counts[:], h.sum, h.count] for route, h in self.durations.items()],
+                'upstream': [[host, phase, h.counts[:], h.sum, h.count]
+                             for (host, phase), h in self.upstream.items()],
+                'proxy_errors': dict(self.proxy_errors),
+                'sections': {name: snapshot for name, snapshot in (sections or {}).items() if snapshot},
+            }
+
+    def publish(self, sections=None):
+        """Write state() to share_dir for the other workers' /__metrics__; returns the state."""
+        state = self.state(sections)
+        if self.share_dir:
+            path = os.path.join(self.share_dir, f"worker-{state['pid']}.json")
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(path + '.tmp', path)
+        return state
+
+    def _sibling_states(self):
+        """States published by the other workers, each marked alive or not."""
+        states = []
+        own = f'worker-{os.getpid()}.json'
+        for name in os.listdir(self.share_dir):
+            if not (name.startswith('worker-') and name.endswith('.json')) or name == own:
+                continue
+            try:
+                with open(os.path.join(self.share_dir, name), encoding='utf-8') as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                continue
+            state['alive'] = _alive(state['pid'])
+            states.append(state)
+        return states
+
+    def render(self, sections=None):
+        """
+        Render the metrics in the Prometheus text format.
+
+        Args:
+            sections: Optional dictionary of name -> snapshot() dictionary (or
+                      None) from the cache, pool, static assets and backend;
+                      each key becomes a counter, or a gauge for GAUGE_KEYS
+
+        Returns:
+            The exposition text; with share_dir, summed over every worker
+        """
+        state = self.publish(sections)
+        state['alive'] = True
+        states = [state] + (self._sibling_states() if self.share_dir else [])
+        return render_states(states, self.buckets)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def render_states(states, buckets=LATENCY_BUCKETS):
+    """
+    Render the sum of one or more ServerMetrics.state() dictionaries.
+
+    Counters and histograms include workers that have exited, so totals do
+    not drop when a worker is replaced; gauges only count live workers.
+    """
+    live = [state for state in states if state.get('alive', True)]
+    requests = Counter()
+    durations = {}
+    upstream = {}
+    proxy_errors = Counter()
+    sections = {}
+    for state in states:
+        for route, method, code, count in state['requests']:
+            requests[route, method, code] += count
+        for route, counts, total, count in state['durations']:
+            durations.setdefault(route, Histogram(buckets)).add(counts, total, count)
+        for host, phase, counts, total, count in state['upstream']:
+            upstream.setdefault((host, phase), Histogram(buckets)).add(counts, total, count)
+        proxy_errors.update(state['proxy_errors'])
+        alive = state.get('alive', True)
+        for section, snapshot in state['sections'].items():
+            merged = sections.setdefault(section, Counter())
+            for key, value in snapshot.items():
+                if isinstance(value, (int, float)) and (key not in GAUGE_KEYS or alive):
+                    merged[key] += value
+
+    lines = [
+        f'# HELP {PREFIX}_start_time_seconds Unix time the first worker started.',
+        f'# TYPE {PREFIX}_start_time_seconds gauge',
+        f"{PREFIX}_start_time_seconds {min(state['start_time'] for state in states):.3f}",
+        f'# HELP {PREFIX}_workers Serving processes alive.',
+        f'# TYPE {PREFIX}_workers gauge',
+        f'{PREFIX}_workers {len(live)}',
+        f'# HELP {PREFIX}_requests_in_flight Requests being answered right now.',
+        f'# TYPE {PREFIX}_requests_in_flight gauge',
+        f"{PREFIX}_requests_in_flight {sum(state['in_flight'] for state in live)}",
+        f'# HELP {PREFIX}_requests_total Requests answered, by route, method and status code.',
+        f'# TYPE {PREFIX}_requests_total counter',
+    ]
+    for (route, method, code), count in sorted(requests.items()):
+        lines.append(f'{PREFIX}_requests_total{_labels(route=route, method=method, code=code)} {count}')
+    if len(states) > 1:
+        lines += [
+            f'# HELP {PREFIX}_worker_requests_total Requests answered by each worker process.',
+            f'# TYPE {PREFIX}_worker_requests_total counter',
+        ]
+        for state in sorted(states, key=lambda state: state['pid']):
+            count = sum(row[3] for row in state['requests'])
+            lines.append(f"{PREFIX}_worker_requests_total{_labels(pid=state['pid'])} {count}")
+    lines += [
+        f'# HELP {PREFIX}_request_duration_seconds Time from request head parsed to response sent.',
+        f'# TYPE {PREFIX}_request_duration_seconds histogram',
+    ]
+    for route in sorted(durations):
+        lines += durations[route].render(f'{PREFIX}_request_duration_seconds', route=route)
+    lines += [
+        f'# HELP {PREFIX}_upstream_phase_seconds Upstream request timing by host and phase '
+        f'({", ".join(UPSTREAM_PHASES)}).',
+        f'# TYPE {PREFIX}_upstream_phase_seconds histogram',
+    ]
+    for host, phase in sorted(upstream):
+        lines += upstream[host, phase].render(f'{PREFIX}_upstream_phase_seconds', host=host, phase=phase)
+    lines += [
+        f'# HELP {PREFIX}_proxy_errors_total Failed /proxy and /proxy_test calls, by exception.',
+        f'# TYPE {PREFIX}_proxy_errors_total counter',
+    ]
+    for error, count in sorted(proxy_errors.items()):
+        lines.append(f'{PREFIX}_proxy_errors_total{_labels(error=error)} {count}')
+
+    for section, totals in sections.items():
+        for key, value in sorted(totals.items()):
+            if key in GAUGE_KEYS:
+                name = f'{PREFIX}_{section}_{key}'
+                lines.append(f'# TYPE {name} gauge')
+            else:
+                name = f'{PREFIX}_{section}_{key}_total'
+                lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+class Profiler:
+    """cProfile or stack sampling switched on and off at runtime, plus a slow-request log."""
+
+    def __init__(self, slow_seconds=1.0, max_slow=50, per_request=True):
+        """
+        Args:
+            slow_seconds: Requests taking at least this long are logged
+            max_slow: Most slow requests kept in the log
+            per_request: cProfile single requests (threaded server); False
+                         profiles the whole thread that calls start(), which
+                         for the asyncio server is the event loop
+        """
+        self.slow_seconds = slow_seconds
+        self.per_request = per_request
+        self.slow = deque(maxlen=max_slow)
+        self.mode = None
+        self.started = None
+        self.profiled_requests = 0
+        self.samples_taken = 0
+        self._lock = threading.Lock()
+        self._min_seconds = 0.0
+        self._stats = None
+        self._busy = False
+        self._window = None
+        self._samples = Counter()
+        self._sampler_stop = None
+
+    # -- switching -----------------------------------------------------------
+
+    def start(self, mode, interval=0.005, min_seconds=0.0):
+        """
+        Start a fresh profile, discarding the previous one.
+
+        Args:
+            mode: 'cprofile' or 'sample'
+            interval: Seconds between stack samples ('sample')
+            min_seconds: Only keep cProfile data of requests at least this
+                         slow ('cprofile' with per_request)
+        """
+        if mode not in ('cprofile', 'sample'):
+            raise ValueError(f'unknown profiling mode: {mode}')
+        self.stop()
+        with self._lock:
+            self._stats = None
+            self._samples = Counter()
+            self.profiled_requests = 0
+            self.samples_taken = 0
+            self._min_seconds = min_seconds
+            self.mode = mode
+            self.started = time.time()
+        if mode == 'sample':
+            self._sampler_stop = threading.Event()
+            threading.Thread(target=self._sample, args=(interval, self._sampler_stop),
+                             name='profiler-sampler', daemon=True).start()
+        elif not self.per_request:
+            self._window = cProfile.Profile()
+            self._window.enable()
+
+    def stop(self):
+        """Stop profiling; the collected data stays available to report()."""
+        if self._sampler_stop is not None:
+            self._sampler_stop.set()
+            self._sampler_stop = None
+        if self._window is not None:
+            window, self._window = self._window, None
+            window.disable()
+            self._merge(window)
+        self.mode = None
+
+    def _merge(self, profile):
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+
+    # -- cProfile per request --------------------------------------------------
+
+    def begin_request(self):
+        """Start profiling the calling thread's request if cProfile is on and no other request holds it."""
+        if self.mode != 'cprofile' or not self.per_request:
+            return None
+        with self._lock:
+            # One profile at a time: newer Pythons allow only one active profiler
+            if self._busy:
+                return None
+            self._busy = True
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def end_request(self, profile, method, target, status, seconds):
+        """Finish a request started with begin_request() and log it if slow."""
+        if profile is not None:
+            profile.disable()
+            if self.mode == 'cprofile' and seconds >= self._min_seconds:
+                self._merge(profile)
+                with self._lock:
+                    self.profiled_requests += 1
+            with self._lock:
+                self._busy = False
+        if seconds >= self.slow_seconds:
+            self.slow.append((time.time(), method or '-', target, status, seconds))
+
+    # -- sampling --------------------------------------------------------------
+
+    def _sample(self, interval, stop):
+        me = threading.get_ident()
+        while not stop.wait(interval):
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                    frame = frame.f_back
+                stacks.append(';'.join(reversed(stack)))
+            with self._lock:
+                self._samples.update(stacks)
+                self.samples_taken += 1
+
+    # -- reporting -------------------------------------------------------------
+
+    def report(self, limit=40):
+        """Plain-text report of the current or last profile and the slow-request log."""
+        out = io.StringIO()
+        state = self.mode or 'off'
+        if self.started is not None:
+            state += f', started {time.strftime("%H:%M:%S", time.localtime(self.started))}'
+        out.write(f'Profiler: {state} (pid {os.getpid()})\n')
+        if self._window is not None:
+            # Snapshot the running profile; create_stats() disables it
+            self._merge(self._window)
+            self._window = cProfile.Profile()
+            self._window.enable()
+        with self._lock:
+            samples = self._samples.most_common(limit)
+            taken = self.samples_taken
+            if self._stats is not None:
+                if self.per_request:
+                    out.write(f'{self.profiled_requests} requests profiled\n')
+                self._stats.stream = out
+                self._stats.sort_stats('cumulative').print_stats(limit)
+        if samples:
+            out.write(f'\n{taken} samples; busiest stacks (collapsed, for flamegraph.pl):\n')
+            for stack, count in samples:
+                out.write(f'{stack} {count}\n')
+
+        out.write(f'\nRequests slower than {self.slow_seconds * 1000:.0f} ms (newest last):\n')
+        for stamp, method, target, status, seconds in self.slow:
+            out.write(f'{time.strftime("%H:%M:%S", time.localtime(stamp))} {seconds * 1000:8.1f} ms '
+                      f'{status or "-"} {method} {target}\n')
+        return out.getvalue()
+
+    def handle(self, query):
+        """
+        Answer GET /__profile__.
+
+        Args:
+            query: The request's query string
+
+        Returns:
+            Plain-text report after applying start/stop
+        """
+        params = dict(urllib.parse.parse_qsl(query, keep_blank_values=True))
+        try:
+            if 'stop' in params:
+                self.stop()
+            elif 'start' in params:
+                self.start(params['start'] or 'cprofile',
+                           interval=float(params.get('interval_ms', 5)) / 1000,
+                           min_seconds=float(params.get('min_ms', 0)) / 1000)
+        except ValueError as e:
+            return f'Profiler: {e}\n'
+        return self.report()
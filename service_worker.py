@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Service Worker Generator for GES Promotion Quiz Application
+
+build_site.py calls this to write two files into the site:
+
+    precache.<version>.json  - the versioned precache manifest: every file
+                               the app needs offline, with a content
+                               revision for names that are not hashed
+    sw.js                    - the service worker, with that version baked in
+
+sw.js changes whenever anything in the manifest changes. Browsers check it
+on every visit, so each deploy installs a new worker in the background.
+That worker:
+
+  - Copies every entry whose name or revision is unchanged from the previous
+    version's cache, and downloads only what the deploy changed. A revisioned
+    entry is checked against its SHA-256 before it is cached.
+  - Answers page loads with the precached index.html straight away. The
+    background update check then makes the next load use the new deploy,
+    which is stale-while-revalidate for the whole app shell.
+  - Serves fingerprinted files cache-first. Other JSON from the site, and
+    the Tailwind and Google Fonts files from their CDNs, are served
+    stale-while-revalidate from a runtime cache. The ?v= cache-buster on
+    question sets is ignored for caching.
+  - Never stores bank/ files itself. The page keeps the question bank in
+    its own cache and patches it, so the worker answers bank/ requests from
+    the precache (manifest, sources) or the network, and a client holds the
+    bank once.
+  - On activation, drops fingerprinted runtime entries that the new
+    precache manifest does not list.
+  - Leaves everything else alone: API calls, analytics and non-GET requests.
+
+Usage:
+    python service_worker.py [--site docs]    # print the precache manifest of a built site
+"""
+
+import json
+import argparse
+from pathlib import Path
+
+from build_bank import content_hash
+from static_assets import is_immutable
+
+WORKER_NAME = "sw.js"
+PRECACHE_PREFIX = "precache."
+PRECACHE_FORMAT = 1
+
+SW_TEMPLATE = r"""// Generated by service_worker.py for build __VERSION__; edit the template there, not this file.
+const PRECACHE_VERSION = '__VERSION__';
+const PRECACHE_PREFIX = 'gesexam-precache-';
+const PRECACHE = PRECACHE_PREFIX + PRECACHE_VERSION;
+const RUNTIME = 'gesexam-runtime';
+const REVISION_HEADER = 'X-Precache-Revision';
+const HASHED_NAME = /\.[0-9a-f]{8,64}\.[A-Za-z0-9]+$/;
+// The page caches the question bank and its patches itself (see index.html)
+const BANK_DIR = 'bank/';
+const RUNTIME_HOSTS = ['cdn.tailwindcss.com', 'fonts.googleapis.com', 'fonts.gstatic.com'];
+
+const scopeUrl = (path) => new URL(path, self.registration.scope).href;
+
+async function sha256Hex(buffer) {
+    const digest = await crypto.subtle.digest('SHA-256', buffer);
+    return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join('');
+}
+
+// A copy of the entry from an earlier version's cache, if its content is unchanged
+async function findUnchanged(url, revision) {
+    for (const name of await caches.keys()) {
+        if (name === PRECACHE || !(name.startsWith(PRECACHE_PREFIX) || name === RUNTIME)) continue;
+        const response = await (await caches.open(name)).match(url);
+        if (response && (revision === null || response.headers.get(REVISION_HEADER) === revision)) {
+            return response;
+        }
+    }
+    return null;
+}
+
+async function download(entry) {
+    // Fingerprinted names never change, so a copy in the HTTP cache is as good as the network
+    const response = await fetch(scopeUrl(entry.url), { cache: entry.revision ? 'no-cache' : 'force-cache' });
+    if (!response.ok) throw new Error(`Precaching ${entry.url} failed: HTTP ${response.status}`);
+    const body = await response.arrayBuffer();
+    if (entry.revision && !(await sha256Hex(body)).startsWith(entry.revision)) {
+        // A newer deploy went live mid-install; the next update check picks it up
+        throw new Error(`${entry.url} does not match revision ${entry.revision}`);
+    }
+    const headers = new Headers(response.headers);
+    if (entry.revision) headers.set(REVISION_HEADER, entry.revision);
+    return new Response(body, { status: response.status, statusText: response.statusText, headers });
+}
+
+self.addEventListener('install', event => {
+    event.waitUntil((async () => {
+        const response = await fetch(scopeUrl(`precache.${PRECACHE_VERSION}.json`), { cache: 'no-cache' });
+        if (!response.ok) throw new Error(`Precache manifest unavailable: HTTP ${response.status}`);
+        const manifest = await response.json();
+        const cache = await caches.open(PRECACHE);
+        await Promise.all(manifest.entries.map(async entry => {
+            const url = scopeUrl(entry.url);
+            if (await cache.match(url)) return;
+            await cache.put(url, (await findUnchanged(url, entry.revision)) || (await download(entry)));
+        }));
+        await self.skipWaiting();
+    })());
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil((async () => {
+        for (const name of await caches.keys()) {
+            if (name.startsWith(PRECACHE_PREFIX) && name !== PRECACHE) await caches.delete(name);
+        }
+        // Fingerprinted files the new manifest does not list belong to older deploys
+        const current = new Set((await (await caches.open(PRECACHE)).keys()).map(request => request.url));
+        const runtime = await caches.open(RUNTIME);
+        for (const request of await runtime.keys()) {
+            const url = new URL(request.url);
+            if (url.origin === self.location.origin && HASHED_NAME.test(url.pathname) &&
+                !current.has(url.origin + url.pathname)) {
+                await runtime.delete(request);
+            }
+        }
+        await self.clients.claim();
+    })());
+});
+
+async function appShell(request) {
+    const cached = await caches.match(scopeUrl('index.html'), { cacheName: PRECACHE });
+    return cached || fetch(request);
+}
+
+async function cacheFirst(request, store = true) {
+    const cached = await caches.match(request);
+    if (cached) return cached;
+    const response = await fetch(request);
+    if (store && response.ok) await (await caches.open(RUNTIME)).put(request, response.clone());
+    return response;
+}
+
+async function staleWhileRevalidate(event, request, key) {
+    const cache = await caches.open(RUNTIME);
+    const cached = await cache.match(key);
+    const network = fetch(request).then(async response => {
+        if (response.ok || response.type === 'opaque') await cache.put(key, response.clone());
+        return response;
+    });
+    if (!cached) return network;
+    event.waitUntil(network.catch(() => null));
+    return cached;
+}
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    if (request.method !== 'GET') return;
+    const url = new URL(request.url);
+    const scope = new URL(self.registration.scope);
+
+    if (url.origin === self.location.origin) {
+        if (!url.pathname.startsWith(scope.pathname)) return;
+        const page = url.pathname.slice(scope.pathname.length);
+        if (request.mode === 'navigate') {
+            if (page === '' || page === 'index.html') event.respondWith(appShell(request));
+        } else if (page.startsWith(BANK_DIR)) {
+            event.respondWith(cacheFirst(request, false));
+        } else if (HASHED_NAME.test(url.pathname)) {
+            event.respondWith(cacheFirst(request));
+        } else if (url.pathname.endsWith('.json')) {
+            // Question sets are fetched with a ?v= cache-buster; keep one copy per file
+            event.respondWith(staleWhileRevalidate(event, request, url.origin + url.pathname));
+        }
+    } else if (RUNTIME_HOSTS.includes(url.hostname)) {
+        event.respondWith(staleWhileRevalidate(event, request, request));
+    }
+});
+"""
+
+
+def precache_manifest(entries):
+    """
+    Build the precache manifest.
+
+    Args:
+        entries: List of (site path, file bytes) for everything to precache
+
+    Returns:
+        Dictionary ready to be serialized. Fingerprinted names get a null
+        revision, since their name already changes with their content.
+    """
+    files = [
+        {
+            "url": url,
+            "revision": None if is_immutable(url) else content_hash(data),
+            "bytes": len(data),
+        }
+        for url, data in entries
+    ]
+    version = content_hash(json.dumps(files, sort_keys=True).encode("utf-8"))
+    return {"format": PRECACHE_FORMAT, "version": version, "entries": files}
+
+
+def build_service_worker(entries):
+    """
+    Generate the service worker and its precache manifest.
+
+    Args:
+        entries: List of (site path, file bytes) for everything to precache
+
+    Returns:
+        Dictionary of site path -> bytes for sw.js and precache.<version>.json
+    """
+    manifest = precache_manifest(entries)
+    version = manifest["version"]
+    return {
+        f"{PRECACHE_PREFIX}{version}.json": json.dumps(manifest, separators=(",", ":")).encode("utf-8"),
+        WORKER_NAME: SW_TEMPLATE.replace("__VERSION__", version).encode("utf-8"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the precache manifest of a built site")
+    parser.add_argument(
+        "--site",
+        default=str(Path(__file__).parent.absolute() / "docs"),
+        help="Site directory written by build_site.py (default: docs)"
+    )
+    args = parser.parse_args()
+
+    manifests = sorted(Path(args.site).glob(f"{PRECACHE_PREFIX}*.json"))
+    if not manifests:
+        print(f"No precache manifest in {args.site}; run build_site.py first")
+        return
+    manifest = json.loads(manifests[-1].read_text(encoding="utf-8"))
+    print(f"Precache version {manifest['version']}:")
+    for entry in manifest["entries"]:
+        revision = entry["revision"] or "(hashed name)"
+        print(f"  {entry['url']:<40} {entry['bytes']:>12,}  {revision}")
+    print(f"  {'Total':<40} {sum(e['bytes'] for e in manifest['entries']):>12,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""
+static_assets.py
+Static file serving helpers shared by run_server.py's threaded and asyncio
+modes: precompressed variants, strong ETags and cache policy.
+
+  - Encodings: a file may have pre-built `<name>.br` and `<name>.gz`
+    siblings. When the request's Accept-Encoding allows it, the smallest
+    acceptable fresh one is sent with Content-Encoding and
+    `Vary: Accept-Encoding`. A sibling older than its source is ignored.
+  - ETags: strong, derived from a SHA-256 of the file's content (cached per
+    path, mtime and size). Each encoding gets its own tag. If-None-Match is
+    answered with 304, and If-Modified-Since is still honoured when no
+    If-None-Match is sent.
+  - Memory: encoded variants and small files are kept in an LRU cache
+    bounded by bytes and revalidated against the file's mtime and size on
+    every request, so a room loading the app at once costs one stat() per
+    request instead of an open and a read. Files too large for the cache
+    are returned open, for the server to send with sendfile().
+  - Cache-Control: content-hashed names such as `bank/questions.<hash>.json`
+    never change, so they are marked immutable for a year. Everything else
+    is `no-cache`, which means revalidate with the ETag on every use.
+
+Brotli variants are written only when the optional `brotli` package is
+installed. Serving existing .br files does not need it.
+
+Usage:
+    python static_assets.py [--dir .] [--clean]
+    python run_server.py --precompress
+"""
+
+import os
+import re
+import gzip
+import stat
+import hashlib
+import argparse
+import datetime
+import mimetypes
+import threading
+import email.utils
+from collections import OrderedDict, namedtuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# (Content-Encoding, file suffix), in order of preference when sizes tie
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+COMPRESSIBLE_EXTENSIONS = {'.html', '.htm', '.js', '.css', '.json', '.bin', '.svg', '.txt', '.md'}
+# Smaller files gain nothing from compression once headers are counted
+MIN_COMPRESS_BYTES = 1024
+# Variants that do not save at least this fraction are not kept
+MIN_SAVING = 0.05
+SKIP_DIRS = {'.git', '__pycache__', 'node_modules'}
+
+# questions.0123abcd4567.json, sources.<hash>.json, app.<hash>.js, ...
+HASHED_NAME = re.compile(r'\.[0-9a-f]{8,64}\.[A-Za-z0-9]+$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+# status: int, headers: list of (name, value), file: CachedBody, open binary
+# file or None, length: bytes to send
+StaticResponse = namedtuple('StaticResponse', 'status headers file length')
+
+
+def guess_type(path):
+    return mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+
+def is_compressible(path):
+    return os.path.splitext(path)[1].lower() in COMPRESSIBLE_EXTENSIONS
+
+
+def is_variant(path):
+    """True for a .br/.gz sibling written for a compressible file, such as index.html.gz."""
+    return any(path.endswith(suffix) and is_compressible(path[:-len(suffix)]) for _, suffix in ENCODINGS)
+
+
+def is_immutable(path):
+    """True for fingerprinted file names whose content never changes."""
+    return HASHED_NAME.search(os.path.basename(path)) is not None
+
+
+def parse_accept_encoding(header):
+    """
+    Parse an Accept-Encoding header.
+
+    Returns:
+        Dictionary of lowercased coding -> q value (a '*' entry included)
+    """
+    codings = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+
+def accepts(codings, coding):
+    """True if the parsed Accept-Encoding allows coding."""
+    if coding in codings:
+        return codings[coding] > 0
+    if coding == 'gzip' and 'x-gzip' in codings:
+        return codings['x-gzip'] > 0
+    return codings.get('*', 0) > 0
+
+
+def etag_matches(if_none_match, etag):
+    """Weak comparison of an If-None-Match header against etag, as RFC 9110 asks for."""
+    if if_none_match.strip() == '*':
+        return True
+    target = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == target:
+            return True
+    return False
+
+
+def modified_since(if_modified_since, mtime):
+    """False when the file is not newer than the If-Modified-Since date."""
+    try:
+        ims = email.utils.parsedate_to_datetime(if_modified_since)
+    except (TypeError, IndexError, OverflowError, ValueError):
+        return True
+    if ims.tzinfo is None:
+        ims = ims.replace(tzinfo=datetime.timezone.utc)
+    last_modified = datetime.datetime.fromtimestamp(mtime, datetime.timezone.utc).replace(microsecond=0)
+    return last_modified > ims
+
+
+class CachedBody:
+    """
+    Response body served from memory.
+
+    Stands in for the file object SimpleHTTPRequestHandler.send_head()
+    returns, so the handler's copy and close calls still work.
+    """
+
+    def __init__(self, data):
+        self.data = data
+
+    def close(self):
+        pass
+
+
+class StaticAssets:
+    """Resolves static file requests to a response; thread-safe."""
+
+    def __init__(self, max_cache_bytes=64 * 1024 * 1024, max_file_bytes=8 * 1024 * 1024):
+        """
+        Args:
+            max_cache_bytes: Most file bytes kept in memory at once; 0 reads
+                             every body from disk
+            max_file_bytes: Larger files are never kept in memory
+        """
+        self.max_cache_bytes = max_cache_bytes
+        self.max_file_bytes = max_file_bytes
+        self._lock = threading.Lock()
+        # path -> (st_mtime_ns, st_size, hex digest)
+        self._digests = {}
+        # path -> (st_mtime_ns, st_size, bytes), least recently used first
+        self._bodies = OrderedDict()
+        self._body_bytes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'evicted': 0, 'from_disk': 0}
+
+    def _cached_body(self, path, st):
+        """Return the cached content of path if it still matches st, else None."""
+        with self._lock:
+            entry = self._bodies.get(path)
+            if entry is None or entry[:2] != (st.st_mtime_ns, st.st_size):
+                return None
+            self._bodies.move_to_end(path)
+            self.stats['hits'] += 1
+            return entry[2]
+
+    def _store_body(self, path, st, data):
+        if len(data) > min(self.max_file_bytes, self.max_cache_bytes):
+            return
+        with self._lock:
+            old = self._bodies.pop(path, None)
+            if old is not None:
+                self._body_bytes -= len(old[2])
+            self._bodies[path] = (st.st_mtime_ns, st.st_size, data)
+            self._body_bytes += len(data)
+            while self._body_bytes > self.max_cache_bytes:
+                _, (_, _, evicted) = self._bodies.popitem(last=False)
+                self._body_bytes -= len(evicted)
+                self.stats['evicted'] += 1
+
+    def _read(self, path):
+        """Read path whole; returns (stat of what was read, bytes)."""
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            return st, f.read()
+
+    def _body(self, path, st):
+        """
+        Content of path as of st, from memory when possible.
+
+        Returns:
+            Tuple of (stat, bytes), or None when the file is too large to
+            keep in memory
+        """
+        data = self._cached_body(path, st)
+        if data is not None:
+            return st, data
+        if st.st_size > min(self.max_file_bytes, self.max_cache_bytes):
+            return None
+        with self._lock:
+            self.stats['misses'] += 1
+        st, data = self._read(path)
+        self._store_body(path, st, data)
+        return st, data
+
+    def _digest(self, path, st):
+        key = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._digests.get(path)
+        if cached is not None and cached[:2] == key:
+            return cached[2]
+        h = hashlib.sha256()
+        body = self._body(path, st)
+        if body is not None:
+            h.update(body[1])
+        else:
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    h.update(block)
+        digest = h.hexdigest()[:20]
+        with self._lock:
+            self._digests[path] = key + (digest,)
+        return digest
+
+    def _pick_variant(self, path, st, accept_encoding):
+        """Return (coding, path, stat) of the smallest acceptable fresh variant, or None."""
+        codings = parse_accept_encoding(accept_encoding)
+        best = None
+        for coding, suffix in ENCODINGS:
+            if not accepts(codings, coding):
+                continue
+            try:
+                variant_st = os.stat(path + suffix)
+            except OSError:
+                continue
+            if variant_st.st_mtime_ns < st.st_mtime_ns or not stat.S_ISREG(variant_st.st_mode):
+                continue
+            if best is None or variant_st.st_size < best[2].st_size:
+                best = (coding, path + suffix, variant_st)
+        return best
+
+    def open(self, path, accept_encoding=None, if_none_match=None, if_modified_since=None):
+        """
+        Resolve a GET/HEAD for the regular file at path.
+
+        Bodies that fit in the cache are served from memory and invalidated
+        when the file's mtime or size changes. Larger ones (or all of them
+        with the cache disabled) come back as an open file for the caller
+        to send, with sendfile() where the socket allows it.
+
+        Args:
+            path: Filesystem path (already translated from the URL)
+            accept_encoding: Request's Accept-Encoding header or None
+            if_none_match: Request's If-None-Match header or None
+            if_modified_since: Request's If-Modified-Since header or None
+
+        Returns:
+            StaticResponse. For a 200 its file is a CachedBody or an open
+            file, which the caller must close; for a 304 it is None.
+
+        Raises:
+            OSError: The file does not exist or cannot be read
+        """
+        st = os.stat(path)
+        if not stat.S_ISREG(st.st_mode):
+            raise IsADirectoryError(path)
+        digest = self._digest(path, st)
+        variant = self._pick_variant(path, st, accept_encoding) if is_compressible(path) else None
+        coding = variant[0] if variant else None
+        etag = f'"{digest}-{coding}"' if coding else f'"{digest}"'
+
+        headers = [
+            ('ETag', etag),
+            ('Last-Modified', email.utils.formatdate(st.st_mtime, usegmt=True)),
+            ('Cache-Control', IMMUTABLE_CACHE_CONTROL if is_immutable(path) else REVALIDATE_CACHE_CONTROL),
+        ]
+        if is_compressible(path):
+            headers.append(('Vary', 'Accept-Encoding'))
+
+        if if_none_match is not None:
+            not_modified = etag_matches(if_none_match, etag)
+        elif if_modified_since is not None:
+            not_modified = not modified_since(if_modified_since, st.st_mtime)
+        else:
+            not_modified = False
+        if not_modified:
+            return StaticResponse(304, headers, None, 0)
+
+        headers.insert(0, ('Content-Type', guess_type(path)))
+        if variant:
+            headers.append(('Content-Encoding', coding))
+            path, st = variant[1], variant[2]
+        body = self._body(path, st)
+        if body is not None:
+            data = body[1]
+            headers.append(('Content-Length', str(len(data))))
+            return StaticResponse(200, headers, CachedBody(data), len(data))
+        f = open(path, 'rb')
+        length = os.fstat(f.fileno()).st_size
+        with self._lock:
+            self.stats['from_disk'] += 1
+        headers.append(('Content-Length', str(length)))
+        return StaticResponse(200, headers, f, length)
+
+    def snapshot(self):
+        """Copy of the counters plus the current cache size."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._bodies)
+            stats['bytes'] = self._body_bytes
+        return stats
+
+
+def compress(data, coding):
+    if coding == 'gzip':
+        # mtime=0 keeps the output identical across runs
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    return brotli.compress(data, quality=11)
+
+
+def precompress_file(path):
+    """
+    Write fresh .gz (and .br when brotli is installed) siblings for path.
+
+    Returns:
+        Dictionary of coding -> variant size for the variants kept
+    """
+    st = os.stat(path)
+    kept = {}
+    data = None
+    for coding, suffix in ENCODINGS:
+        variant = path + suffix
+        if coding == 'br' and brotli is None:
+            continue
+        try:
+            variant_st = os.stat(variant)
+            if variant_st.st_mtime_ns == st.st_mtime_ns:
+                kept[coding] = variant_st.st_size
+                continue
+        except OSError:
+            pass
+        if data is None:
+            with open(path, 'rb') as f:
+                data = f.read()
+        body = compress(data, coding)
+        if len(body) > len(data) * (1 - MIN_SAVING):
+            if os.path.exists(variant):
+                os.remove(variant)
+            continue
+        tmp = variant + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(body)
+        # The variant carries its source's mtime; an edited source is newer and makes it stale
+        os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+        os.replace(tmp, variant)
+        kept[coding] = len(body)
+    return kept
+
+
+def iter_assets(directory):
+    """Yield the compressible files under directory that are big enough to bother with."""
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS and not d.startswith('.'))
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            if is_compressible(path) and os.path.getsize(path) >= MIN_COMPRESS_BYTES:
+                yield path
+
+
+def precompress_tree(directory, verbose=False):
+    """
+    Precompress every compressible asset under directory.
+
+    Returns:
+        Tuple of (files processed, original bytes, smallest variant bytes)
+    """
+    count = original = smallest = 0
+    for path in iter_assets(directory):
+        kept = precompress_file(path)
+        size = os.path.getsize(path)
+        best = min(kept.values(), default=size)
+        count += 1
+        original += size
+        smallest += best
+        if verbose:
+            variants = ', '.join(f'{coding} {n:,}' for coding, n in sorted(kept.items())) or 'not worth compressing'
+            print(f'  {os.path.relpath(path, directory)}: {size:,} -> {variants}')
+    return count, original, smallest
+
+
+def clean_tree(directory):
+    """Remove every .gz/.br sibling of a compressible asset. Returns the number removed."""
+    removed = 0
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if d not in SKIP_DIRS and not d.startswith('.')]
+        for name in files:
+            if is_variant(name) and os.path.splitext(name)[0] in files:
+                os.remove(os.path.join(root, name))
+                removed += 1
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write precompressed .gz/.br siblings for static assets')
+    parser.add_argument('--dir', '-d', default='.', help='Directory to process (default: current directory)')
+    parser.add_argument('--clean', action='store_true', help='Remove the generated siblings instead')
+    args = parser.parse_args()
+
+    if args.clean:
+        print(f'Removed {clean_tree(args.dir)} precompressed files')
+        return
+    if brotli is None:
+        print('brotli is not installed; writing gzip variants only (pip install brotli for .br)')
+    count, original, smallest = precompress_tree(args.dir, verbose=True)
+    if not count:
+        print('No compressible assets found')
+        return
+    print(f'\n{count} files: {original:,} bytes -> {smallest:,} bytes '
+          f'over the wire ({smallest / original:.1%})')
+
+
+if __name__ == '__main__':
+    main()
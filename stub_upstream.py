@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+stub_upstream.py
+Local stand-in for the Apps Script web app, for benchmarking run_server.py's
+/proxy path without touching the real deployment.
+
+It answers the actions the Apps Script implements (getLeaderboard,
+submitScore, register) with small JSON bodies and rejects any other action
+the way the script does, speaks HTTP/1.1 keep-alive, and can
+simulate the costs that matter through a proxy:
+
+  --latency        time Apps Script spends running the script, per request
+  --handshake      extra delay on the first request of every new connection,
+                   standing in for the TCP + TLS setup to script.google.com
+  --redirect       answer with a 302 to /echo first, like Apps Script does
+  --leaderboard    number of rows in the getLeaderboard response
+  --chunked        send getLeaderboard with Transfer-Encoding: chunked
+                   instead of a Content-Length
+
+Usage:
+    python stub_upstream.py --port 9100 --latency 20 --handshake 60
+    APPSCRIPT_URL=http://127.0.0.1:9100/exec python run_server.py --no-open
+"""
+
+import json
+import time
+import argparse
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Write actions the stub accepts besides getLeaderboard; like the script, it rejects any other
+STUB_ACTIONS = {'register', 'submitScore'}
+
+
+def leaderboard_rows(count):
+    """Deterministic fake leaderboard of count rows."""
+    return [
+        {'rank': i + 1, 'name': f'Candidate {i + 1}', 'email': f'candidate{i + 1}@example.com',
+         'score': 100 - (i % 100), 'total': 100, 'timestamp': '2026-01-01T00:00:00Z'}
+        for i in range(count)
+    ]
+
+
+class StubUpstreamHandler(BaseHTTPRequestHandler):
+    """Minimal Apps Script look-alike; settings live on the server object."""
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without this, Nagle plus
+    # delayed ACKs would add ~40 ms to every response on a reused connection
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.first_request = True
+        with self.server.lock:
+            self.server.connection_count += 1
+
+    def _simulate_costs(self):
+        if self.first_request:
+            self.first_request = False
+            if self.server.handshake:
+                time.sleep(self.server.handshake)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+    def _reply(self, status, body, content_type='application/json', chunked=False):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+        if not chunked:
+            self.wfile.write(body)
+            return
+        for start in range(0, len(body), 16 * 1024):
+            piece = body[start:start + 16 * 1024]
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(piece), piece))
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length > 0 else b''
+        with self.server.lock:
+            self.server.request_count += 1
+        self._simulate_costs()
+
+        parts = urllib.parse.urlsplit(self.path)
+        params = urllib.parse.parse_qs(parts.query)
+        if self.server.redirect and parts.path != '/echo':
+            # Apps Script runs the script, then redirects to a one-off URL that serves the result
+            self.send_response(302)
+            self.send_header('Location', urllib.parse.urlunsplit(('', '', '/echo', parts.query, '')))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        action = (params.get('action') or [''])[0]
+        if action == 'getLeaderboard':
+            self._reply(200, self.server.leaderboard_body, chunked=self.server.chunked)
+            return
+        if action in STUB_ACTIONS:
+            payload = {'success': True, 'action': action, 'received': len(body)}
+        else:
+            payload = {'success': False, 'message': 'Invalid action specified.', 'data': {}}
+        self._reply(200, json.dumps(payload).encode('utf-8'))
+
+    do_GET = _handle
+    do_POST = _handle
+    do_HEAD = _handle
+
+
+class StubUpstreamServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    # Benchmarks open hundreds of connections at once; the default backlog of 5 would drop them
+    request_queue_size = 512
+
+    def __init__(self, address, latency=0.0, handshake=0.0, redirect=False, leaderboard=50, chunked=False):
+        super().__init__(address, StubUpstreamHandler)
+        self.latency = latency
+        self.handshake = handshake
+        self.redirect = redirect
+        self.chunked = chunked
+        # Encoded once, so serving it does not show up in the proxy's memory use
+        payload = {'success': True, 'data': leaderboard_rows(leaderboard)}
+        self.leaderboard_body = json.dumps(payload).encode('utf-8')
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.connection_count = 0
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/exec'
+
+
+def start_stub_upstream(port=0, **settings):
+    """
+    Start a stub upstream in a background thread.
+
+    Args:
+        port: Port to listen on (0 picks a free one)
+        settings: latency / handshake (seconds), redirect, leaderboard rows,
+                  chunked
+
+    Returns:
+        The running StubUpstreamServer; call shutdown() when done
+    """
+    server = StubUpstreamServer(('127.0.0.1', port), **settings)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a local stand-in for the Apps Script endpoint')
+    parser.add_argument('--port', '-p', type=int, default=9100, help='Port to listen on (default: 9100)')
+    parser.add_argument('--latency', type=float, default=20, help='Per-request processing time in ms (default: 20)')
+    parser.add_argument('--handshake', type=float, default=60, help='Extra delay per new connection in ms (default: 60)')
+    parser.add_argument('--redirect', action='store_true', help='Redirect every call once, like Apps Script')
+    parser.add_argument('--leaderboard', type=int, default=50, help='Rows returned by getLeaderboard (default: 50)')
+    parser.add_argument('--chunked', action='store_true', help='Send getLeaderboard without a Content-Length')
+    args = parser.parse_args()
+
+    server = StubUpstreamServer(('127.0.0.1', args.port), latency=args.latency / 1000,
+                                handshake=args.handshake / 1000, redirect=args.redirect,
+                                leaderboard=args.leaderboard, chunked=args.chunked)
+    print(f'Stub upstream listening on {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('\nShutting down stub upstream...')
+        server.server_close()
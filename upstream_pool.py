@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+upstream_pool.py
+Bounded, thread-safe pool of keep-alive HTTP(S) connections used by
+run_server.py to forward /proxy calls to the Apps Script endpoint.
+
+Each upstream host (scheme, host, port) gets at most `max_per_host` open
+connections. Idle connections are kept for `idle_timeout` seconds and reused,
+so a burst of submitScore calls pays for one TCP + TLS handshake per
+connection instead of one per request. Connect and read timeouts are
+separate: a slow handshake fails fast while a slow Apps Script run is given
+time to finish. Requests beyond `max_per_host` queue for a free connection
+for up to `pool_timeout` seconds, which is never less than `read_timeout`,
+so a burst larger than the pool is slowed down rather than refused.
+
+Redirects are followed the way urllib does it (Apps Script answers every
+call with a 302 to script.googleusercontent.com), and the redirect target's
+connections are pooled too.
+
+Usage:
+    pool = UpstreamPool(max_per_host=8, connect_timeout=5, read_timeout=15, pool_timeout=60)
+    with pool.request('GET', url, headers={'Accept': 'application/json'}) as resp:
+        data = resp.read()
+"""
+
+import ssl
+import time
+import socket
+import threading
+import http.client
+import urllib.parse
+from collections import deque
+
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
+MAX_REDIRECTS = 5
+
+# Failures that mean a reused keep-alive connection was closed by the other
+# side while it sat idle. The request is retried on a fresh connection if it
+# could not have been processed: it failed while sending, or the method is
+# idempotent.
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    BrokenPipeError,
+    ConnectionAbortedError,
+)
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection slot for a host frees up in time."""
+
+
+class UpstreamResponse:
+    """
+    Response from UpstreamPool.request().
+
+    Wraps http.client.HTTPResponse. The connection goes back to the pool when
+    the body has been read to the end and the response is closed; a response
+    closed early closes its connection instead, so a half-read body never
+    leaks into the next request.
+    """
+
+    def __init__(self, pool, key, conn, response, url):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+        # Set by UpstreamPool.request() on the response it returns, for the 'total' timing
+        self.started = None
+
+    def getcode(self):
+        return self.status
+
+    def getheaders(self):
+        return self._response.getheaders()
+
+    def read(self, amt=None):
+        return self._response.read(amt)
+
+    def read1(self, amt=-1):
+        return self._response.read1(amt)
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        # read1() stops at the end of a Content-Length body without marking the
+        # response closed, so a zero remaining length also counts as fully read
+        response = self._response
+        finished = response.isclosed() or (not response.chunked and response.length == 0)
+        reusable = finished and not response.will_close
+        self._response.close()
+        self._pool._release(self._key, conn, reusable)
+        if self.started is not None:
+            self._pool._observe(self._key, 'total', time.perf_counter() - self.started)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class UpstreamPool:
+    """Keep-alive connection pool with per-host limits."""
+
+    def __init__(self, max_per_host=8, connect_timeout=5.0, read_timeout=15.0,
+                 pool_timeout=60.0, idle_timeout=60.0, ssl_context=None, metrics=None):
+        """
+        Args:
+            max_per_host: Most connections open to one host at a time; further
+                          requests wait up to pool_timeout for a free slot
+            connect_timeout: Seconds allowed for TCP connect and TLS handshake
+            read_timeout: Seconds allowed between bytes of the response
+            pool_timeout: Seconds a request waits for a free slot (raised to
+                          read_timeout if lower)
+            idle_timeout: Idle connections older than this are discarded
+            ssl_context: Context for https upstreams (default: system trust)
+            metrics: server_metrics.ServerMetrics that receives connect, tls,
+                     first_byte and total timings; None records nothing
+        """
+        self.max_per_host = max_per_host
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_timeout = max(pool_timeout, read_timeout)
+        self.idle_timeout = idle_timeout
+        self.ssl_context = ssl_context or ssl.create_default_context()
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._slots = {}
+        self.stats = {'requests': 0, 'connections_opened': 0, 'connections_reused': 0,
+                      'stale_retries': 0, 'redirects': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _observe(self, key, phase, seconds):
+        if self.metrics is not None:
+            self.metrics.observe_upstream(key[1], phase, seconds)
+
+    def _slot(self, key):
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._slots[key] = threading.BoundedSemaphore(self.max_per_host)
+            return slot
+
+    def _acquire(self, key):
+        """Return (connection, reused) for key, waiting for a free slot."""
+        if not self._slot(key).acquire(timeout=self.pool_timeout):
+            raise PoolTimeout(f'no free upstream connection to {key[1]}:{key[2]} '
+                              f'within {self.pool_timeout}s')
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle.get(key)
+            while idle:
+                conn, last_used = idle.pop()
+                if now - last_used <= self.idle_timeout:
+                    self.stats['connections_reused'] += 1
+                    return conn, True
+                conn.close()
+            self.stats['connections_opened'] += 1
+
+        scheme, host, port = key
+        try:
+            started = time.perf_counter()
+            if scheme == 'https':
+                conn = http.client.HTTPSConnection(host, port, timeout=self.connect_timeout,
+                                                   context=self.ssl_context)
+                # TCP first and the TLS handshake separately, so each gets its own timing
+                http.client.HTTPConnection.connect(conn)
+                connected = time.perf_counter()
+                conn.sock = self.ssl_context.wrap_socket(conn.sock, server_hostname=host)
+                self._observe(key, 'tls', time.perf_counter() - connected)
+            else:
+                conn = http.client.HTTPConnection(host, port, timeout=self.connect_timeout)
+                conn.connect()
+                connected = time.perf_counter()
+            self._observe(key, 'connect', connected - started)
+            conn.sock.settimeout(self.read_timeout)
+            # Keep-alive requests are small; do not let Nagle hold them back
+            conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except BaseException:
+            self._slot(key).release()
+            raise
+        return conn, False
+
+    def _release(self, key, conn, reusable):
+        if reusable:
+            with self._lock:
+                self._idle.setdefault(key, deque()).append((conn, time.monotonic()))
+        else:
+            conn.close()
+        self._slot(key).release()
+
+    def _send(self, method, url, body, headers):
+        """Send one request (no redirects) and return an UpstreamResponse."""
+        parts = urllib.parse.urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ('http', 'https'):
+            raise ValueError(f'unsupported upstream scheme: {parts.scheme}')
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (scheme, parts.hostname, port)
+        target = urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+
+        while True:
+            conn, reused = self._acquire(key)
+            sent = False
+            try:
+                started = time.perf_counter()
+                conn.request(method, target, body=body, headers=headers)
+                sent = True
+                response = conn.getresponse()
+                self._observe(key, 'first_byte', time.perf_counter() - started)
+            except STALE_CONNECTION_ERRORS:
+                self._release(key, conn, False)
+                if not reused or (sent and method not in IDEMPOTENT_METHODS):
+                    raise
+                self._count('stale_retries')
+                continue
+            except BaseException:
+                self._release(key, conn, False)
+                raise
+            return UpstreamResponse(self, key, conn, response, url)
+
+    def request(self, method, url, body=None, headers=None):
+        """
+        Send a request upstream, following redirects like urllib.
+
+        301/302/303 turn a POST into a body-less GET, 307/308 repeat the
+        request as is.
+
+        Args:
+            method: HTTP method
+            url: Absolute http(s) URL
+            body: Request body bytes or None
+            headers: Dictionary of request headers
+
+        Returns:
+            UpstreamResponse; use it as a context manager or close() it
+        """
+        headers = dict(headers or {})
+        self._count('requests')
+        started = time.perf_counter()
+        for _ in range(MAX_REDIRECTS + 1):
+            resp = self._send(method, url, body, headers)
+            location = resp.headers.get('Location')
+            if resp.status not in REDIRECT_CODES or not location:
+                resp.started = started
+                return resp
+            # Drain the redirect body so its connection can be reused
+            resp.read()
+            resp.close()
+            self._count('redirects')
+            url = urllib.parse.urljoin(url, location)
+            if resp.status in (301, 302, 303) and method != 'HEAD':
+                method = 'GET'
+                body = None
+                headers.pop('Content-Type', None)
+        raise http.client.HTTPException(f'too many redirects ending at {url}')
+
+    def snapshot(self):
+        """Copy of the counters plus the number of idle connections."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['idle_connections'] = sum(len(idle) for idle in self._idle.values())
+        return stats
+
+    def close(self):
+        """Close every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for conn, _ in connections:
+                conn.close()
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Question Set Validator for GES Promotion Quiz Application
+
+Strict checks for every set in default-questions/, run by deploy.py before
+anything is committed. The loaders are lenient on purpose: question_bank.py
+tolerates raw control characters, and the browser drops whatever
+isValidQuestion() rejects and treats a set that JSON.parse() refuses as empty.
+Here every such problem is an error, reported with its file, line and column.
+
+  - encoding:    valid UTF-8 with no U+FFFD replacement characters (a BOM is
+                 only a warning, since browsers strip it)
+  - strict-json: parses exactly as JSON.parse() would parse it, so raw
+                 control characters inside strings are errors, and every
+                 one of them is listed
+  - structure:   the top level is an array of objects
+  - fields:      integer id; non-empty question; options as a non-empty
+                 object of strings; answer and explanation as strings
+  - answer:      answer is one of the option keys
+  - duplicate-id: no id is used twice within a set
+
+Sets are checked in a process pool (see question_bank.map_in_order()).
+
+Usage:
+    python validate_sets.py [--source default-questions] [--workers N] [--all]
+"""
+
+import sys
+import json
+import argparse
+from pathlib import Path
+
+from question_bank import (
+    DEFAULT_SOURCE_DIR,
+    discover_sets,
+    map_in_order,
+    parse_set_items,
+    relative_name,
+)
+
+# Raw control characters listed per set before the rest are summarized
+MAX_CONTROL_CHARACTERS = 20
+# Problems printed per set unless every one is asked for
+REPORT_LIMIT = 10
+CONTROL_NAMES = {0x09: "tab", 0x0A: "line feed", 0x0D: "carriage return"}
+
+
+def _position(text, pos):
+    """1-indexed (line, column) of a character offset."""
+    line = text.count("\n", 0, pos) + 1
+    return line, pos - (text.rfind("\n", 0, pos) + 1) + 1
+
+
+def _problem(check, message, line=None, column=None):
+    return {"check": check, "message": message, "line": line, "column": column}
+
+
+class _NonStandardConstant(ValueError):
+    """NaN, Infinity or -Infinity, which json.loads() accepts and JSON.parse() does not."""
+
+    def __init__(self, token):
+        super().__init__(token)
+        self.token = token
+
+
+def _reject_constant(token):
+    raise _NonStandardConstant(token)
+
+
+def _constant_offset(text, token):
+    """Offset of the first token outside a string, or None."""
+    in_string = escaped = False
+    for pos, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif text.startswith(token, pos):
+            return pos
+    return None
+
+
+def check_encoding(data):
+    """
+    Decode a set as UTF-8.
+
+    Returns:
+        Tuple of (text, problems, warnings). Undecodable bytes are replaced
+        so the remaining checks can still run.
+    """
+    problems = []
+    warnings = []
+    if data.startswith(b"\xef\xbb\xbf"):
+        warnings.append("starts with a UTF-8 byte order mark")
+        data = data[3:]
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError as e:
+        line = data.count(b"\n", 0, e.start) + 1
+        problems.append(_problem("encoding", f"not valid UTF-8: byte 0x{data[e.start]:02x} ({e.reason})", line))
+        text = data.decode("utf-8", errors="replace")
+    else:
+        pos = text.find("\ufffd")
+        while pos != -1:
+            problems.append(_problem("encoding", "U+FFFD replacement character (text was mis-decoded "
+                                                 "before it was saved)", *_position(text, pos)))
+            pos = text.find("\ufffd", pos + 1)
+    return text, problems, warnings
+
+
+def check_strict_json(text):
+    """
+    Parse the way JSON.parse() does.
+
+    Each raw control character is reported, then blanked out so that the
+    parse can go on to find the next one. Positions refer to the original
+    text, whose line breaks the blanking may have removed. NaN, Infinity
+    and -Infinity are rejected, as JSON.parse() rejects them.
+
+    Returns:
+        List of problems (empty when the text is strict JSON)
+    """
+    problems = []
+    work = text
+    while True:
+        try:
+            json.loads(work, parse_constant=_reject_constant)
+            return problems
+        except _NonStandardConstant as e:
+            pos = _constant_offset(work, e.token)
+            position = _position(text, pos) if pos is not None else ()
+            problems.append(_problem("strict-json", f"{e.token} is not valid JSON; use a number or null",
+                                     *position))
+            return problems
+        except json.JSONDecodeError as e:
+            if not e.msg.startswith("Invalid control character"):
+                line_start = work.rfind("\n", 0, e.pos) + 1
+                excerpt = work[max(line_start, e.pos - 30):e.pos + 30].split("\n")[0].strip()
+                problems.append(_problem("strict-json", f"{e.msg} near {excerpt!r}", *_position(text, e.pos)))
+                return problems
+            if len(problems) == MAX_CONTROL_CHARACTERS:
+                problems.append(_problem("strict-json", "more raw control characters follow"))
+                return problems
+            code = ord(work[e.pos])
+            name = CONTROL_NAMES.get(code, "control character")
+            problems.append(_problem(
+                "strict-json",
+                f"raw {name} (U+{code:04X}) inside a string; escape it as \\u{code:04x}",
+                *_position(text, e.pos),
+            ))
+            work = work[:e.pos] + " " + work[e.pos + 1:]
+
+
+def check_item(item):
+    """Field and answer-key problems of one question, as (check, message) pairs."""
+    if not isinstance(item, dict):
+        return [("structure", f"item is a {type(item).__name__}, not an object")]
+
+    problems = []
+    q_id = item.get("id")
+    if "id" not in item:
+        problems.append(("fields", "missing id"))
+    elif not isinstance(q_id, int) or isinstance(q_id, bool):
+        problems.append(("fields", f"id {q_id!r} is not an integer"))
+
+    question = item.get("question")
+    if not isinstance(question, str):
+        problems.append(("fields", "missing question" if question is None else "question is not a string"))
+    elif not question.strip():
+        problems.append(("fields", "question is empty"))
+
+    options = item.get("options")
+    if not isinstance(options, dict):
+        problems.append(("fields", "missing options" if options is None else "options is not an object"))
+        options = None
+    elif not options:
+        problems.append(("fields", "options is empty"))
+    else:
+        for key, value in options.items():
+            if not isinstance(value, str):
+                problems.append(("fields", f"option {key!r} is not a string"))
+
+    answer = item.get("answer")
+    if not isinstance(answer, str):
+        problems.append(("fields", "missing answer" if answer is None else "answer is not a string"))
+    elif options and answer not in options:
+        problems.append(("answer", f"answer {answer!r} is not one of the options "
+                                   f"({', '.join(map(str, options))})"))
+
+    explanation = item.get("explanation")
+    if not isinstance(explanation, str):
+        problems.append(("fields", "missing explanation" if explanation is None else "explanation is not a string"))
+    return problems
+
+
+def validate_set(job):
+    """
+    Run every check on one set; the unit of work for validate_sets().
+
+    Args:
+        job: Tuple of (path, path relative to the base directory)
+
+    Returns:
+        Dictionary with 'file', 'questions', 'problems' and 'warnings'
+    """
+    path, rel_path = job
+    result = {"file": rel_path, "questions": 0, "problems": [], "warnings": []}
+    try:
+        data = Path(path).read_bytes()
+    except OSError as e:
+        result["problems"].append(_problem("encoding", f"cannot be read: {e}"))
+        return result
+
+    text, problems, warnings = check_encoding(data)
+    result["problems"] += problems
+    result["warnings"] += warnings
+    result["problems"] += check_strict_json(text)
+
+    # Field checks still run on sets that only fail on control characters
+    items, lines, error = parse_set_items(text)
+    if error:
+        if not any(p["check"] == "strict-json" for p in result["problems"]):
+            result["problems"].append(_problem("structure", error))
+        return result
+    if not items:
+        result["warnings"].append("set has no questions")
+    result["questions"] = len(items)
+
+    id_lines = {}
+    for index, (item, line) in enumerate(zip(items, lines)):
+        for check, message in check_item(item):
+            result["problems"].append(_problem(check, f"item {index}: {message}", line))
+        q_id = item.get("id") if isinstance(item, dict) else None
+        if isinstance(q_id, int) and not isinstance(q_id, bool):
+            id_lines.setdefault(q_id, []).append(line)
+
+    for q_id, at in id_lines.items():
+        if len(at) > 1:
+            shown = ", ".join(map(str, at[:6])) + (", ..." if len(at) > 6 else "")
+            result["problems"].append(_problem(
+                "duplicate-id", f"id {q_id} is used {len(at)} times (lines {shown})", at[1]))
+
+    result["problems"].sort(key=lambda p: (p["line"] or 0, p["column"] or 0))
+    return result
+
+
+def validate_sets(source_dir=None, base_dir=None, workers=0):
+    """
+    Validate every set in a directory.
+
+    Args:
+        source_dir: Directory containing the JSON question sets
+        base_dir: Directory that set paths are reported relative to
+                  (defaults to the parent of source_dir)
+        workers: Check sets in this many processes (0 = one per CPU)
+
+    Returns:
+        List of validate_set() results, in client load order
+    """
+    source_dir = Path(source_dir or DEFAULT_SOURCE_DIR)
+    base_dir = Path(base_dir) if base_dir else source_dir.parent
+    jobs = [(path, relative_name(path, base_dir)) for path in discover_sets(source_dir)]
+    return map_in_order(validate_set, jobs, workers)
+
+
+def print_report(results, limit=REPORT_LIMIT):
+    """
+    Print the problems and warnings of every set that has any.
+
+    Args:
+        results: Result of validate_sets()
+        limit: Problems printed per set (None for all)
+
+    Returns:
+        Total number of problems
+    """
+    total = 0
+    for result in results:
+        problems = result["problems"]
+        total += len(problems)
+        if not problems and not result["warnings"]:
+            continue
+        mark = "✗" if problems else "⚠"
+        print(f"  {mark} {result['file']}: {len(problems)} problem(s)")
+        for p in problems[:limit]:
+            where = f"line {p['line']}" if p["line"] else ""
+            if p["column"]:
+                where += f", col {p['column']}"
+            print(f"      {where:<20} {p['check']:<13} {p['message']}")
+        if limit is not None and len(problems) > limit:
+            checks = sorted({p["check"] for p in problems[limit:]})
+            print(f"      ... and {len(problems) - limit} more ({', '.join(checks)})")
+        for warning in result["warnings"]:
+            print(f"      {'':<20} {'warning':<13} {warning}")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Strictly validate the question sets before they are deployed")
+    parser.add_argument(
+        "--source",
+        default=str(DEFAULT_SOURCE_DIR),
+        help="Directory containing setN.json files (default: default-questions)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Check sets in N processes, 0 for one per CPU (default: 0)"
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help=f"List every problem instead of the first {REPORT_LIMIT} per set"
+    )
+    args = parser.parse_args()
+
+    results = validate_sets(args.source, workers=args.workers)
+    if not results:
+        print(f"No question sets found in {args.source}")
+        sys.exit(1)
+
+    total = print_report(results, limit=None if args.all else REPORT_LIMIT)
+    failed = sum(1 for r in results if r["problems"])
+    questions = sum(r["questions"] for r in results)
+    if total:
+        print(f"\n✗ {total} problem(s) in {failed} of {len(results)} set(s)")
+        sys.exit(1)
+    print(f"✓ {len(results)} set(s), {questions} questions: all checks passed")
+
+
+if __name__ == "__main__":
+    main()